@@ -0,0 +1,33 @@
+"""HTTP API support: caching, deal feeds, streaming and adaptive load shedding."""
+
+from dealfinder.api.cache import ResponseCache
+from dealfinder.api.deals import (
+    conditional_response,
+    deals_router,
+    etag_matches,
+    render_page,
+    strong_etag,
+)
+from dealfinder.api.limits import (
+    AdaptiveConcurrencyMiddleware,
+    ConcurrencyLimiter,
+    GradientLimit,
+    RouteStats,
+)
+from dealfinder.api.stream import StreamEvent, StreamHub, stream_router
+
+__all__ = [
+    "AdaptiveConcurrencyMiddleware",
+    "ConcurrencyLimiter",
+    "GradientLimit",
+    "ResponseCache",
+    "RouteStats",
+    "StreamEvent",
+    "StreamHub",
+    "conditional_response",
+    "deals_router",
+    "etag_matches",
+    "render_page",
+    "stream_router",
+    "strong_etag",
+]
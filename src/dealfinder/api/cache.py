@@ -0,0 +1,222 @@
+"""Tiered response cache for API reads such as ``deals:{user}:v1``.
+
+A flat Redis TTL makes every task that reads a popular key miss at the
+same moment and hit DynamoDB and OpenSearch together. :class:`ResponseCache`
+avoids that in four ways:
+
+* An in-process LRU sits in front of Redis, so the common case costs no
+  network round trip.
+* Misses are coalesced per key, so each instance runs the loader at most
+  once at a time for a key.
+* Entries are refreshed early with probability rising towards expiry
+  (XFetch, weighted by how long the loader took). Once expired they are
+  still served for ``stale_ttl`` seconds while one background refresh
+  runs. Readers only wait on the loader when the key is absent.
+* :meth:`ResponseCache.invalidate` deletes keys in Redis and broadcasts
+  them over pub/sub, so every instance drops its LRU copy when new
+  opportunities land. If the subscription drops, the instance reconnects
+  and clears its whole LRU, since it may have missed invalidations.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Sequence
+from dataclasses import dataclass
+from typing import Any
+
+from redis.asyncio import Redis
+
+from dealfinder.pubsub import PubSubRelay
+
+logger = logging.getLogger(__name__)
+
+Loader = Callable[[], Awaitable[Any]]
+
+
+@dataclass(frozen=True, slots=True)
+class _Entry:
+    value: Any
+    created: float
+    delta: float
+
+    def to_json(self) -> str:
+        return json.dumps({"value": self.value, "created": self.created, "delta": self.delta})
+
+    @classmethod
+    def from_json(cls, raw: str | bytes) -> _Entry:
+        data = json.loads(raw)
+        return cls(data["value"], data["created"], data["delta"])
+
+
+class ResponseCache:
+    """Two-tier (process LRU + Redis) read-through cache with early refresh.
+
+    Values must be JSON-serializable.
+
+    Args:
+        redis: Async Redis client.
+        ttl: Seconds an entry is fresh.
+        stale_ttl: Further seconds an expired entry is served while it is
+            refreshed in the background.
+        l1_size: Entries kept in the in-process LRU.
+        l1_ttl: Seconds an LRU entry is trusted before Redis is consulted.
+        beta: XFetch aggressiveness; larger refreshes earlier, 0 disables
+            early refresh.
+        channel: Redis pub/sub channel carrying invalidations.
+        seed: Seed for early-refresh sampling.
+        clock: Source of the current time, overridable in tests.
+    """
+
+    prefix = "api"
+
+    def __init__(
+        self,
+        redis: Redis,
+        *,
+        ttl: float = 60.0,
+        stale_ttl: float = 300.0,
+        l1_size: int = 10_000,
+        l1_ttl: float = 5.0,
+        beta: float = 1.0,
+        channel: str = "api:invalidate",
+        seed: int | None = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self._redis = redis
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.l1_size = l1_size
+        self.l1_ttl = l1_ttl
+        self.beta = beta
+        self.channel = channel
+        self._rng = random.Random(seed)
+        self._clock = clock
+        self._l1: OrderedDict[str, tuple[float, _Entry]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Task[Any]] = {}
+        self._relay = PubSubRelay(redis, channel, self._relayed, on_reconnect=self._drop_all)
+        # Bumped when a key with a load in flight is invalidated, so that
+        # load doesn't write back what was just invalidated. Entries only
+        # live while a load is in flight.
+        self._generations: dict[str, int] = {}
+        self.l1_hits = 0
+        self.redis_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    def _l1_get(self, key: str, now: float) -> _Entry | None:
+        item = self._l1.get(key)
+        if item is None:
+            return None
+        expires_at, entry = item
+        if expires_at <= now:
+            del self._l1[key]
+            return None
+        self._l1.move_to_end(key)
+        return entry
+
+    def _l1_put(self, key: str, entry: _Entry, now: float) -> None:
+        expires_at = min(now + self.l1_ttl, entry.created + self.ttl + self.stale_ttl)
+        self._l1[key] = (expires_at, entry)
+        self._l1.move_to_end(key)
+        while len(self._l1) > self.l1_size:
+            self._l1.popitem(last=False)
+
+    def _refresh_early(self, entry: _Entry, now: float) -> bool:
+        """XFetch: refresh with probability rising as expiry nears."""
+        if self.beta <= 0:
+            return False
+        jitter = -entry.delta * self.beta * math.log(1.0 - self._rng.random())
+        return now + jitter >= entry.created + self.ttl
+
+    async def get(self, key: str, loader: Loader) -> Any:
+        """Return the cached value for ``key``, calling ``loader`` to fill or refresh it."""
+        now = self._clock()
+        entry = self._l1_get(key, now)
+        if entry is not None:
+            self.l1_hits += 1
+        else:
+            raw = await self._redis.get(self._key(key))
+            if raw is None:
+                self.misses += 1
+                return await asyncio.shield(self._fill(key, loader))
+            entry = _Entry.from_json(raw)
+            self._l1_put(key, entry, now)
+            self.redis_hits += 1
+        if now >= entry.created + self.ttl:
+            self.stale_hits += 1
+            self._fill(key, loader)
+        elif self._refresh_early(entry, now):
+            self._fill(key, loader)
+        return entry.value
+
+    def _fill(self, key: str, loader: Loader) -> asyncio.Task[Any]:
+        """The single in-flight load for ``key``, started if there is none."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.create_task(self._load(key, loader))
+            task.add_done_callback(lambda done: self._loaded(key, done))
+        return task
+
+    def _loaded(self, key: str, task: asyncio.Task[Any]) -> None:
+        self._inflight.pop(key, None)
+        self._generations.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Cache load failed", extra={"key": key, "error": str(task.exception())})
+
+    async def _load(self, key: str, loader: Loader) -> Any:
+        generation = self._generations.get(key, 0)
+        started = self._clock()
+        value = await loader()
+        now = self._clock()
+        self.refreshes += 1
+        if generation == self._generations.get(key, 0):
+            entry = _Entry(value, now, now - started)
+            await self._redis.set(
+                self._key(key), entry.to_json(), px=int((self.ttl + self.stale_ttl) * 1000)
+            )
+            self._l1_put(key, entry, now)
+        return value
+
+    async def invalidate(self, keys: Sequence[str]) -> None:
+        """Delete keys everywhere and tell every instance to drop its LRU copy."""
+        if not keys:
+            return
+        self._drop(keys)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.delete(*(self._key(key) for key in keys))
+            pipe.publish(self.channel, "\n".join(keys))
+            await pipe.execute()
+
+    def _drop(self, keys: Sequence[str]) -> None:
+        for key in keys:
+            self._l1.pop(key, None)
+            if key in self._inflight:
+                self._generations[key] = self._generations.get(key, 0) + 1
+
+    def _drop_all(self) -> None:
+        self._l1.clear()
+        for key in self._inflight:
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def _relayed(self, data: bytes | str) -> None:
+        self._drop((data.decode() if isinstance(data, bytes) else data).split("\n"))
+
+    async def start(self) -> None:
+        """Start applying invalidations broadcast by other instances."""
+        await self._relay.start()
+
+    async def aclose(self) -> None:
+        """Stop the invalidation listener and wait for in-flight loads."""
+        await self._relay.aclose()
+        await asyncio.gather(*self._inflight.values(), return_exceptions=True)
@@ -0,0 +1,87 @@
+"""``GET /api/v1/deals``: pre-serialized feed pages with strong ETags.
+
+Deal bodies are stored as JSON bytes when they are published (see
+:class:`~dealfinder.feeds.FeedStore`). A page response is built by joining
+those bytes, so no Pydantic model is validated or encoded per request.
+Each page carries a strong ETag hashed from its exact bytes. Polling
+clients send it back in ``If-None-Match`` and get an empty ``304`` while
+their feed is unchanged.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from collections.abc import Callable, Sequence
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+
+from dealfinder.feeds import PAGE_SIZE, FeedStore
+
+# Clients may keep a page but must revalidate it before every use.
+CACHE_CONTROL = "private, no-cache"
+
+
+def render_page(bodies: Sequence[bytes], next_cursor: str | None) -> bytes:
+    """A page response body built from stored deal JSON without re-encoding it."""
+    return b"".join(
+        [
+            b'{"items":[',
+            b",".join(bodies),
+            b'],"next_cursor":',
+            json.dumps(next_cursor).encode(),
+            b"}",
+        ]
+    )
+
+
+def strong_etag(payload: bytes) -> str:
+    """Quoted strong entity tag derived from the payload bytes."""
+    return '"' + hashlib.blake2b(payload, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Whether an ``If-None-Match`` header matches ``etag``.
+
+    Uses the weak comparison RFC 9110 requires for ``If-None-Match``.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag.removeprefix("W/") in tags
+
+
+def conditional_response(request: Request, payload: bytes, etag: str) -> Response:
+    """``304`` if the client already has ``etag``, else the payload as JSON."""
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(payload, media_type="application/json", headers=headers)
+
+
+def deals_router(feeds: FeedStore, current_user: Callable[..., str]) -> APIRouter:
+    """Router serving each user's materialized feed.
+
+    Args:
+        feeds: Store the feeds are read from.
+        current_user: FastAPI dependency returning the authenticated user ID.
+    """
+    router = APIRouter()
+
+    @router.get("/api/v1/deals")
+    async def list_deals(
+        request: Request,
+        user_id: str = Depends(current_user),
+        cursor: str | None = None,
+        limit: int = Query(PAGE_SIZE, ge=1, le=100),
+    ) -> Response:
+        try:
+            page = await feeds.raw_page(user_id, limit=limit, cursor=cursor)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        payload = render_page(page.bodies, page.next_cursor)
+        return conditional_response(request, payload, strong_etag(payload))
+
+    return router
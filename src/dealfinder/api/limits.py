@@ -0,0 +1,307 @@
+"""Adaptive per-route concurrency limits for the FastAPI app.
+
+When DynamoDB or OpenSearch slows down, requests pile up in flight until
+everything times out. :class:`AdaptiveConcurrencyMiddleware` caps the
+requests in flight on each route and sheds the excess immediately: it
+serves a cached response from the optional fallback if there is one,
+otherwise a ``503`` with ``Retry-After``. Requests that are admitted then
+finish at normal latency, so goodput holds up during a partial outage.
+
+Each route's cap is a :class:`GradientLimit`, which adapts the cap as a
+gradient controller in the style of TCP Vegas. It compares a short-term
+average of response time with a long-term baseline. While latency stays
+near the baseline the limit grows by about its square root per update;
+when latency rises the limit shrinks in proportion. Errors and timeouts
+cut it multiplicatively, as in AIMD.
+
+Routes are keyed by their path template (``/api/v1/deals/{deal_id}``), not
+the raw path, and the limiter keeps at most ``max_routes`` of them, so
+scanners and path parameters cannot grow its state without bound. Limit
+changes are reported to an optional :class:`~dealfinder.metrics.Gauge`.
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Collection
+from dataclasses import dataclass
+
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from dealfinder.metrics import Gauge
+
+Fallback = Callable[[Request], Awaitable[Response | None]]
+
+
+class GradientLimit:
+    """Concurrency limit driven by the latency gradient.
+
+    Args:
+        initial: Starting limit.
+        min_limit: Smallest limit.
+        max_limit: Largest limit.
+        tolerance: Short-term latency may reach this multiple of the
+            baseline before the limit shrinks.
+        smoothing: Weight of each new estimate in the limit.
+        short_window: Samples in the short-term latency average.
+        long_window: Samples in the long-term baseline average.
+        backoff: Factor applied to the limit when a request fails.
+    """
+
+    def __init__(
+        self,
+        *,
+        initial: int = 20,
+        min_limit: int = 4,
+        max_limit: int = 500,
+        tolerance: float = 1.5,
+        smoothing: float = 0.2,
+        short_window: int = 10,
+        long_window: int = 600,
+        backoff: float = 0.9,
+    ) -> None:
+        if not 1 <= min_limit <= initial <= max_limit:
+            raise ValueError("require 1 <= min_limit <= initial <= max_limit")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.short_window = short_window
+        self.long_window = long_window
+        self.backoff = backoff
+        self._limit = float(initial)
+        self._short: float | None = None
+        self._long: float | None = None
+        self.in_flight = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def try_acquire(self) -> bool:
+        """Admit a request if the route is under its limit."""
+        if self.in_flight >= self.limit:
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self, latency: float | None, *, dropped: bool = False) -> None:
+        """Finish an admitted request and adapt the limit.
+
+        Args:
+            latency: Seconds the request took, or ``None`` if it was
+                abandoned and says nothing about the backend.
+            dropped: Whether it failed in a way that signals overload.
+        """
+        saturated = self.in_flight >= self._limit / 2
+        self.in_flight -= 1
+        if dropped:
+            self._limit = max(self.min_limit, self._limit * self.backoff)
+            return
+        if latency is None:
+            return
+        if self._short is None or self._long is None:
+            self._short = self._long = latency
+            return
+        self._short += (latency - self._short) / self.short_window
+        self._long += (latency - self._long) / self.long_window
+        # Let the baseline follow a lasting improvement quickly.
+        if self._long > 2 * self._short:
+            self._long *= 0.95
+        if not saturated:
+            return
+        gradient = max(0.5, min(1.0, self.tolerance * self._long / self._short))
+        estimate = self._limit * gradient + math.sqrt(self._limit)
+        self._limit += self.smoothing * (estimate - self._limit)
+        self._limit = max(self.min_limit, min(self.max_limit, self._limit))
+
+
+@dataclass(slots=True)
+class RouteStats:
+    """Current limit and shedding counters for one route."""
+
+    limit: int
+    in_flight: int
+    rejected: int = 0
+    fallbacks: int = 0
+
+
+class ConcurrencyLimiter:
+    """One :class:`GradientLimit` per route, plus the stats to export.
+
+    Args:
+        factory: Builds the limit for a newly seen route.
+        max_routes: Routes tracked at once. Past this, the least recently
+            used route with nothing in flight is forgotten.
+        gauge: Receives ``concurrency_limit`` for a route whenever its
+            limit changes, and every reading on :meth:`report`.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], GradientLimit] = GradientLimit,
+        *,
+        max_routes: int = 256,
+        gauge: Gauge | None = None,
+    ) -> None:
+        if max_routes < 1:
+            raise ValueError("max_routes must be at least 1")
+        self.factory = factory
+        self.max_routes = max_routes
+        self.gauge = gauge
+        self._limits: OrderedDict[str, GradientLimit] = OrderedDict()
+        self._stats: dict[str, RouteStats] = {}
+
+    def __len__(self) -> int:
+        return len(self._limits)
+
+    def route(self, key: str) -> GradientLimit:
+        limit = self._limits.get(key)
+        if limit is not None:
+            self._limits.move_to_end(key)
+            return limit
+        limit = self._limits[key] = self.factory()
+        self._stats[key] = RouteStats(limit.limit, 0)
+        if len(self._limits) > self.max_routes:
+            self._evict()
+        return limit
+
+    def _evict(self) -> None:
+        for key, limit in self._limits.items():
+            if limit.in_flight == 0:
+                del self._limits[key]
+                del self._stats[key]
+                return
+
+    def release(
+        self, key: str, limit: GradientLimit, latency: float | None, *, dropped: bool = False
+    ) -> None:
+        """Release ``limit`` (see :meth:`GradientLimit.release`) and report a changed limit."""
+        before = limit.limit
+        limit.release(latency, dropped=dropped)
+        if self.gauge is not None and limit.limit != before:
+            self.gauge("concurrency_limit", limit.limit, {"route": key})
+
+    def report(self) -> None:
+        """Send every route's limit, in-flight count and shed counters to the gauge."""
+        if self.gauge is None:
+            return
+        for key, stats in self.snapshot().items():
+            labels = {"route": key}
+            self.gauge("concurrency_limit", stats.limit, labels)
+            self.gauge("concurrency_in_flight", stats.in_flight, labels)
+            self.gauge("concurrency_rejected", stats.rejected, labels)
+            self.gauge("concurrency_fallbacks", stats.fallbacks, labels)
+
+    def stats(self, key: str) -> RouteStats:
+        self.route(key)
+        return self._stats[key]
+
+    def snapshot(self) -> dict[str, RouteStats]:
+        """Per-route limits and counters, e.g. for a CloudWatch or Prometheus gauge."""
+        for key, limit in self._limits.items():
+            self._stats[key].limit = limit.limit
+            self._stats[key].in_flight = limit.in_flight
+        return dict(self._stats)
+
+
+def default_route_key(scope: Scope) -> str:
+    """``"METHOD /path/{template}"`` of the app route matching the request.
+
+    Requests matching no route share one ``"METHOD *"`` key.
+    """
+    template = "*"
+    for route in getattr(scope.get("app"), "routes", ()):
+        match, _ = route.matches(scope)
+        if match is Match.FULL:
+            template = getattr(route, "path", template)
+            break
+        if match is Match.PARTIAL and template == "*":
+            template = getattr(route, "path", template)
+    return f"{scope['method']} {template}"
+
+
+class AdaptiveConcurrencyMiddleware:
+    """ASGI middleware shedding load above each route's adaptive limit.
+
+    Args:
+        app: The wrapped ASGI app.
+        limiter: Shared limiter, so its :meth:`~ConcurrencyLimiter.snapshot`
+            can be exported.
+        fallback: Returns a cached response for a shed request, or ``None``.
+        retry_after: Seconds sent in ``Retry-After`` with a ``503``.
+        route_key: Groups requests into routes; by default the matched path
+            template.
+        exclude: Path prefixes that are never limited, such as long-lived
+            streams.
+        clock: Monotonic time source, overridable in tests.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        limiter: ConcurrencyLimiter | None = None,
+        fallback: Fallback | None = None,
+        retry_after: int = 1,
+        route_key: Callable[[Scope], str] = default_route_key,
+        exclude: Collection[str] = (),
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.app = app
+        self.limiter = limiter if limiter is not None else ConcurrencyLimiter()
+        self.fallback = fallback
+        self.retry_after = retry_after
+        self.route_key = route_key
+        self.exclude = tuple(exclude)
+        self._clock = clock
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude):
+            await self.app(scope, receive, send)
+            return
+        key = self.route_key(scope)
+        limit = self.limiter.route(key)
+        if not limit.try_acquire():
+            await self._shed(key, scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = self._clock()
+        try:
+            await self.app(scope, receive, send_status)
+        except Exception:
+            self.limiter.release(key, limit, self._clock() - started, dropped=True)
+            raise
+        except BaseException:
+            self.limiter.release(key, limit, None)
+            raise
+        self.limiter.release(key, limit, self._clock() - started, dropped=status >= 500)
+
+    async def _shed(self, key: str, scope: Scope, receive: Receive, send: Send) -> None:
+        stats = self.limiter.stats(key)
+        if self.fallback is not None:
+            response = await self.fallback(Request(scope, receive))
+            if response is not None:
+                stats.fallbacks += 1
+                await response(scope, receive, send)
+                return
+        stats.rejected += 1
+        response = Response(
+            "Service overloaded, retry shortly",
+            status_code=503,
+            headers={"Retry-After": str(self.retry_after)},
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,261 @@
+"""``GET /api/v1/deals/stream``: opportunities pushed as SSE or NDJSON.
+
+Polling ``/api/v1/deals`` sends a request through the whole edge stack
+every few seconds per client, and a new deal can still wait out the cache
+TTL. Streaming clients hold one long-lived response instead, and each
+opportunity is written to them as soon as it is matched.
+
+All clients on an instance share one upstream: a :class:`StreamHub`
+subscribes once to a Redis pub/sub channel and routes each event to the
+connected clients of the users it matched. Event IDs come from a Redis
+counter, so they are global across instances, and each instance keeps the
+most recent events in a bounded replay buffer. A reconnecting client sends
+its last ID (``Last-Event-ID`` for SSE, ``cursor`` for NDJSON) and is
+replayed what it missed. If the buffer no longer reaches back that far, or
+is empty while the Redis counter is past the client's ID, it gets a
+``reset`` event and should reload its feed. Connected clients get one too
+when the upstream subscription drops and is re-established, since events
+may have been lost in between. A client that falls ``max_queue`` events
+behind is disconnected, and resumes the same way.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from collections import deque
+from collections.abc import AsyncIterator, Callable, Sequence
+from dataclasses import dataclass, field
+from typing import Annotated, Literal
+
+from fastapi import APIRouter, Depends, Header, Query
+from fastapi.responses import StreamingResponse
+from redis.asyncio import Redis
+
+from dealfinder.pubsub import PubSubRelay
+from dealfinder.schemas import PricedDeal
+
+logger = logging.getLogger(__name__)
+
+StreamFormat = Literal["sse", "ndjson"]
+MEDIA_TYPES: dict[StreamFormat, str] = {
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson",
+}
+
+
+@dataclass(frozen=True, slots=True)
+class StreamEvent:
+    """One opportunity for a set of users, with both wire encodings built once."""
+
+    id: int
+    users: frozenset[str]
+    body: bytes
+    sse: bytes = field(init=False, repr=False)
+    ndjson: bytes = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "sse", b"id: %d\nevent: deal\ndata: %s\n\n" % (self.id, self.body))
+        object.__setattr__(self, "ndjson", b'{"id":%d,"deal":%s}\n' % (self.id, self.body))
+
+
+RESET: dict[StreamFormat, bytes] = {
+    "sse": b"event: reset\ndata: {}\n\n",
+    "ndjson": b'{"reset":true}\n',
+}
+HEARTBEAT: dict[StreamFormat, bytes] = {"sse": b": keepalive\n\n", "ndjson": b"\n"}
+
+
+@dataclass(slots=True, eq=False)
+class _Client:
+    user_id: str
+    queue: deque[StreamEvent]
+    wake: asyncio.Event = field(default_factory=asyncio.Event)
+    overflowed: bool = False
+    closed: bool = False
+    reset: bool = False
+
+
+class StreamHub:
+    """Shares one upstream subscription among this instance's streaming clients.
+
+    Args:
+        redis: Optional async Redis client for IDs and cross-instance events;
+            without it events are numbered and delivered locally.
+        channel: Redis pub/sub channel carrying events.
+        replay_size: Recent events kept for resuming clients.
+        max_queue: Events buffered per client before it is disconnected.
+        heartbeat: Seconds of silence before a keep-alive is written.
+    """
+
+    prefix = "stream"
+
+    def __init__(
+        self,
+        redis: Redis | None = None,
+        *,
+        channel: str = "stream:deals",
+        replay_size: int = 10_000,
+        max_queue: int = 256,
+        heartbeat: float = 15.0,
+    ) -> None:
+        self._redis = redis
+        self.channel = channel
+        self.max_queue = max_queue
+        self.heartbeat = heartbeat
+        self._replay: deque[StreamEvent] = deque(maxlen=replay_size)
+        self._clients: dict[str, set[_Client]] = {}
+        self._relay = (
+            None
+            if redis is None
+            else PubSubRelay(redis, channel, self._relayed, on_reconnect=self._resync)
+        )
+        self._sequence = 0
+        self.delivered = 0
+        self.disconnected = 0
+
+    def __len__(self) -> int:
+        """Connected clients."""
+        return sum(len(clients) for clients in self._clients.values())
+
+    async def start(self) -> None:
+        """Subscribe to the shared upstream channel."""
+        if self._relay is not None:
+            await self._relay.start()
+
+    def _relayed(self, data: bytes) -> None:
+        header, _, body = data.partition(b"\n")
+        meta = json.loads(header)
+        self.deliver(StreamEvent(meta["id"], frozenset(meta["users"]), body))
+
+    def _resync(self) -> None:
+        """Drop the replay buffer and reset clients after events may have been lost."""
+        self._replay.clear()
+        for clients in self._clients.values():
+            for client in clients:
+                client.reset = True
+                client.wake.set()
+
+    async def aclose(self) -> None:
+        """Stop the upstream subscription and end every client stream.
+
+        Clients reconnect, typically to another instance, and resume from
+        their last event ID.
+        """
+        for clients in self._clients.values():
+            for client in clients:
+                client.closed = True
+                client.wake.set()
+        if self._relay is not None:
+            await self._relay.aclose()
+
+    async def publish(self, priced: PricedDeal, user_ids: Sequence[str]) -> int:
+        """Stream an opportunity to the matched users on every instance. Returns its ID."""
+        body = priced.model_dump_json().encode()
+        if self._redis is None:
+            self._sequence += 1
+            self.deliver(StreamEvent(self._sequence, frozenset(user_ids), body))
+            return self._sequence
+        event_id = int(await self._redis.incr(f"{self.prefix}:sequence"))
+        header = json.dumps({"id": event_id, "users": list(user_ids)}).encode()
+        await self._redis.publish(self.channel, header + b"\n" + body)
+        return event_id
+
+    def deliver(self, event: StreamEvent) -> None:
+        """Record an event for replay and queue it for connected matched users."""
+        self._replay.append(event)
+        for user_id in event.users:
+            for client in self._clients.get(user_id, ()):
+                if len(client.queue) == self.max_queue:
+                    client.overflowed = True
+                else:
+                    client.queue.append(event)
+                    self.delivered += 1
+                client.wake.set()
+
+    async def _sequence_now(self) -> int:
+        """ID of the latest event published from any instance."""
+        if self._redis is None:
+            return self._sequence
+        return int(await self._redis.get(f"{self.prefix}:sequence") or 0)
+
+    async def _missed(self, user_id: str, last_id: int) -> tuple[bool, list[StreamEvent]]:
+        """Whether events after ``last_id`` are not buffered, and the buffered ones for the user."""
+        if self._replay:
+            oldest = self._replay[0].id
+        else:
+            oldest = await self._sequence_now() + 1
+            if self._replay:
+                # Events arrived while the counter was read.
+                oldest = min(oldest, self._replay[0].id)
+        gap = oldest > last_id + 1
+        return gap, [e for e in self._replay if e.id > last_id and user_id in e.users]
+
+    async def stream(
+        self, user_id: str, fmt: StreamFormat = "sse", last_event_id: int | None = None
+    ) -> AsyncIterator[bytes]:
+        """Encoded events for one client: replay after ``last_event_id``, then live."""
+        client = _Client(user_id, deque())
+        self._clients.setdefault(user_id, set()).add(client)
+        try:
+            if fmt == "sse":
+                yield b"retry: 3000\n\n"
+            # Events queued while replaying may also be in the replay.
+            replayed: set[int] = set()
+            if last_event_id is not None:
+                gap, missed = await self._missed(user_id, last_event_id)
+                if gap:
+                    yield RESET[fmt]
+                for event in missed:
+                    yield getattr(event, fmt)
+                    replayed.add(event.id)
+            while client.queue or not (client.overflowed or client.closed):
+                if client.reset:
+                    client.reset = False
+                    yield RESET[fmt]
+                    continue
+                if not client.queue:
+                    client.wake.clear()
+                    try:
+                        await asyncio.wait_for(client.wake.wait(), self.heartbeat)
+                    except TimeoutError:
+                        yield HEARTBEAT[fmt]
+                    continue
+                event = client.queue.popleft()
+                if event.id not in replayed:
+                    yield getattr(event, fmt)
+            if client.overflowed:
+                self.disconnected += 1
+                logger.warning("Disconnected slow stream consumer", extra={"user_id": user_id})
+        finally:
+            clients = self._clients[user_id]
+            clients.discard(client)
+            if not clients:
+                del self._clients[user_id]
+
+
+def stream_router(hub: StreamHub, current_user: Callable[..., str]) -> APIRouter:
+    """Router serving each user's live opportunity stream.
+
+    Args:
+        hub: This instance's stream hub.
+        current_user: FastAPI dependency returning the authenticated user ID.
+    """
+    router = APIRouter()
+
+    @router.get("/api/v1/deals/stream")
+    async def stream_deals(
+        user_id: str = Depends(current_user),
+        fmt: Annotated[StreamFormat, Query(alias="format")] = "sse",
+        cursor: Annotated[int | None, Query(ge=0)] = None,
+        last_event_id: Annotated[int | None, Header(ge=0)] = None,
+    ) -> StreamingResponse:
+        resume = last_event_id if last_event_id is not None else cursor
+        return StreamingResponse(
+            hub.stream(user_id, fmt, resume),
+            media_type=MEDIA_TYPES[fmt],
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    return router
@@ -0,0 +1,21 @@
+"""Duplicate detection for deals within the 24-hour window."""
+
+from dealfinder.dedup.bloom import BloomParameters, SlicedBloomFilter, key_digest
+from dealfinder.dedup.minhash import (
+    MinHasher,
+    NearDuplicate,
+    NearDuplicateIndex,
+    lsh_bands,
+    normalize_title,
+)
+
+__all__ = [
+    "BloomParameters",
+    "MinHasher",
+    "NearDuplicate",
+    "NearDuplicateIndex",
+    "SlicedBloomFilter",
+    "key_digest",
+    "lsh_bands",
+    "normalize_title",
+]
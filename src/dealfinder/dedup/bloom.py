@@ -0,0 +1,171 @@
+"""Time-sliced Bloom filter for the 24-hour duplicate window.
+
+The window is split into hourly slices, each a Bloom filter bitmap in Redis
+that expires once it falls out of the window, so old deals age out without
+any sweeping. Alongside each bitmap is an exact set of 16-byte key digests:
+Bloom negatives (the common case for new deals) are answered by the filter
+alone, and the rare positives from older slices are confirmed against the
+exact sets so a new deal is never dropped by a false positive.
+
+A batch is checked and inserted with one ``MULTI``/``EXEC`` pipeline — one
+``BITFIELD`` per slice covering every key in the batch, and an ``SADD`` per
+key whose reply says whether the current slice already held it — plus one
+``SMISMEMBER`` round trip, only for the keys some bitmap reports as present.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import time
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+
+from redis.asyncio import Redis
+
+
+@dataclass(frozen=True, slots=True)
+class BloomParameters:
+    """Bitmap size and hash count for one slice."""
+
+    bits: int
+    hashes: int
+
+    @classmethod
+    def optimal(cls, capacity: int, error_rate: float) -> BloomParameters:
+        """Size a filter for ``capacity`` keys at the given false-positive rate."""
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError("capacity must be positive and 0 < error_rate < 1")
+        bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        hashes = max(1, round(bits / capacity * math.log(2)))
+        return cls(bits=bits, hashes=hashes)
+
+
+def key_digest(key: str) -> bytes:
+    """Return the 16-byte digest a deal key is stored as."""
+    return hashlib.blake2b(key.encode(), digest_size=16).digest()
+
+
+class SlicedBloomFilter:
+    """Rotating hourly Bloom filter slices with exact confirmation of positives.
+
+    Args:
+        redis: Async Redis client.
+        prefix: Key prefix for the slice bitmaps and exact sets.
+        window_seconds: Duplicate window, 24 hours by default.
+        slice_seconds: Width of each slice.
+        capacity_per_slice: Expected keys per slice; the bitmap is sized for
+            this at ``error_rate``.
+        error_rate: Target false-positive rate of each slice.
+        clock: Source of the current time, overridable in tests.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        *,
+        prefix: str = "dedup:deals",
+        window_seconds: int = 24 * 3600,
+        slice_seconds: int = 3600,
+        capacity_per_slice: int = 10_000,
+        error_rate: float = 0.001,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        if slice_seconds < 1 or window_seconds < slice_seconds:
+            raise ValueError("require 1 <= slice_seconds <= window_seconds")
+        self._redis = redis
+        self.prefix = prefix
+        self.window_seconds = window_seconds
+        self.slice_seconds = slice_seconds
+        # One extra slice so a key inserted at the start of the oldest slice
+        # is still covered for the full window.
+        self.slice_count = math.ceil(window_seconds / slice_seconds) + 1
+        self.params = BloomParameters.optimal(capacity_per_slice, error_rate)
+        self._clock = clock
+
+    def _bits_key(self, index: int) -> str:
+        return f"{self.prefix}:bits:{index}"
+
+    def _exact_key(self, index: int) -> str:
+        return f"{self.prefix}:exact:{index}"
+
+    def _positions(self, digest: bytes) -> list[int]:
+        # Kirsch-Mitzenmacher double hashing from the two halves of the digest.
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.params.bits for i in range(self.params.hashes)]
+
+    def _bitfield_args(self, op: str, positions: Sequence[list[int]]) -> list[str | int]:
+        args: list[str | int] = []
+        for item_positions in positions:
+            for position in item_positions:
+                args += [op, "u1", position] if op == "GET" else [op, "u1", position, 1]
+        return args
+
+    async def check_and_add(self, keys: Sequence[str]) -> list[bool]:
+        """Record ``keys`` and report which were already seen in the window.
+
+        Repeats within ``keys`` itself count as duplicates after their first
+        occurrence. Returns one flag per key, ``True`` for duplicates.
+        """
+        return await self._run(keys, insert=True)
+
+    async def contains(self, keys: Sequence[str]) -> list[bool]:
+        """Report which keys were seen in the window without recording them."""
+        return await self._run(keys, insert=False)
+
+    async def _run(self, keys: Sequence[str], *, insert: bool) -> list[bool]:
+        if not keys:
+            return []
+        unique = list(dict.fromkeys(keys))
+        digests = [key_digest(key) for key in unique]
+        positions = [self._positions(digest) for digest in digests]
+        k = self.params.hashes
+        current = int(self._clock() // self.slice_seconds)
+        # With an insert, SADD's per-digest replies answer for the current
+        # slice exactly, so only the other slices' bitmaps are read.
+        read = range(current - self.slice_count + 1, current if insert else current + 1)
+        ttl = self.window_seconds + self.slice_seconds
+
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for index in read:
+                pipe.execute_command(
+                    "BITFIELD", self._bits_key(index), *self._bitfield_args("GET", positions)
+                )
+            if insert:
+                for digest in digests:
+                    pipe.sadd(self._exact_key(current), digest)
+                pipe.execute_command(
+                    "BITFIELD", self._bits_key(current), *self._bitfield_args("SET", positions)
+                )
+                pipe.expire(self._bits_key(current), ttl)
+                pipe.expire(self._exact_key(current), ttl)
+            replies = await pipe.execute()
+
+        if insert:
+            seen = [not added for added in replies[len(read) : len(read) + len(digests)]]
+        else:
+            seen = [False] * len(digests)
+        # Slices (by index) whose bitmap had all k bits set for each key.
+        candidates: dict[int, list[int]] = {}
+        for bits, index in zip(replies[: len(read)], read, strict=True):
+            for item in range(len(digests)):
+                if not seen[item] and all(bits[item * k : (item + 1) * k]):
+                    candidates.setdefault(index, []).append(item)
+
+        if candidates:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for index, items in candidates.items():
+                    pipe.smismember(self._exact_key(index), [digests[i] for i in items])
+                confirmations = await pipe.execute()
+            for items, flags in zip(candidates.values(), confirmations, strict=True):
+                for item, flag in zip(items, flags, strict=True):
+                    seen[item] = seen[item] or bool(flag)
+
+        by_key = dict(zip(unique, seen, strict=True))
+        result: list[bool] = []
+        emitted: set[str] = set()
+        for key in keys:
+            result.append(by_key[key] or key in emitted)
+            emitted.add(key)
+        return result
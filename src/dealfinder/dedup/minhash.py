@@ -0,0 +1,316 @@
+"""MinHash/LSH near-duplicate detection across feeds.
+
+The same deal is often posted by several sources with slightly different
+titles, which exact GUID dedup cannot catch. :class:`NearDuplicateIndex`
+shingles each normalized title, computes a MinHash signature with NumPy and
+files it into banded LSH buckets, so "is this a near-copy of anything in the
+last 24 hours" is a handful of dict lookups plus a signature comparison on
+the few candidates. The index lives in process memory and is snapshotted to
+Redis so a fresh worker can pick it up. It runs before the ensemble stage so
+near-duplicates never reach the paid pricing models.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import re
+import time
+import unicodedata
+import zlib
+from collections import deque
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from typing import cast
+
+import numpy as np
+import numpy.typing as npt
+from redis.asyncio import Redis
+from redis.typing import EncodableT, FieldT
+
+Signature = npt.NDArray[np.uint64]
+
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_SHIFT = np.uint64(32)
+_NON_WORD = re.compile(r"[^\w$.%]+")
+
+DEFAULT_STOPWORDS = frozenset(
+    {"a", "an", "and", "at", "by", "for", "from", "in", "of", "on", "the", "to", "via", "with"}
+)
+
+
+def normalize_title(title: str, stopwords: Iterable[str] = DEFAULT_STOPWORDS) -> str:
+    """Lowercase, fold accents and punctuation, and drop filler words."""
+    text = unicodedata.normalize("NFKD", title).encode("ascii", "ignore").decode()
+    drop = frozenset(stopwords)
+    return " ".join(w for w in _NON_WORD.sub(" ", text.lower()).split() if w not in drop)
+
+
+def lsh_bands(num_perm: int, threshold: float) -> tuple[int, int]:
+    """Pick ``(bands, rows)`` so the LSH S-curve crosses near ``threshold``.
+
+    Candidates with Jaccard similarity ``s`` collide with probability
+    ``1 - (1 - s**rows)**bands``, whose midpoint is ``(1/bands)**(1/rows)``.
+    Configurations whose midpoint sits at or below the threshold are
+    preferred so that recall is favoured over precision; candidates are
+    verified against the full signature anyway.
+    """
+    best: tuple[float, int, int] | None = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        midpoint = (1 / bands) ** (1 / rows)
+        score = abs(midpoint - threshold) + (0.5 if midpoint > threshold else 0.0)
+        if best is None or score < best[0]:
+            best = (score, bands, rows)
+    assert best is not None
+    return best[1], best[2]
+
+
+class MinHasher:
+    """Compute MinHash signatures over character shingles.
+
+    Args:
+        num_perm: Signature length (number of hash permutations).
+        shingle_size: Characters per shingle.
+        seed: Seed for the permutation coefficients. Signatures are only
+            comparable between hashers with the same seed and ``num_perm``.
+    """
+
+    def __init__(self, num_perm: int = 128, *, shingle_size: int = 3, seed: int = 1) -> None:
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+        max_coefficient = np.iinfo(np.uint64).max
+        self._a = rng.integers(0, max_coefficient, size=(num_perm, 1), dtype=np.uint64) | np.uint64(
+            1
+        )
+        self._b = rng.integers(0, max_coefficient, size=(num_perm, 1), dtype=np.uint64)
+
+    def shingles(self, text: str) -> set[str]:
+        k = self.shingle_size
+        if len(text) <= k:
+            return {text} if text else set()
+        return {text[i : i + k] for i in range(len(text) - k + 1)}
+
+    def signature(self, text: str) -> Signature:
+        """Return the signature of already-normalized ``text``."""
+        shingles = self.shingles(text)
+        if not shingles:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        hashed = np.fromiter(
+            (zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles)
+        )
+        # Multiply-shift hashing: (a*x + b) mod 2**64, keeping the high 32
+        # bits. The modulus is free uint64 wraparound, avoiding a costly
+        # per-element integer division.
+        permuted = (self._a * hashed + self._b) >> _SHIFT
+        minimum: Signature = permuted.min(axis=1)
+        return minimum
+
+
+def similarity(left: Signature, right: Signature) -> float:
+    """Estimate Jaccard similarity from two signatures."""
+    return float(np.count_nonzero(left == right)) / len(left)
+
+
+@dataclass(frozen=True, slots=True)
+class NearDuplicate:
+    """An indexed deal that a query matched."""
+
+    deal_id: str
+    similarity: float
+
+
+@dataclass(slots=True)
+class _Entry:
+    signature: Signature
+    added_at: float
+    price: float | None
+
+
+class NearDuplicateIndex:
+    """In-memory banded LSH index over deal titles with a sliding time window.
+
+    Args:
+        threshold: Minimum estimated Jaccard similarity for a near-duplicate.
+        num_perm: MinHash signature length.
+        shingle_size: Characters per shingle.
+        window_seconds: How long an indexed deal is considered for matches.
+        price_tolerance: When both deals carry a price, they only match if
+            the prices differ by at most this fraction of the higher one, so
+            the same product at a genuinely different price is not dropped.
+        seed: MinHash permutation seed.
+        clock: Source of the current time, overridable in tests.
+    """
+
+    def __init__(
+        self,
+        *,
+        threshold: float = 0.5,
+        num_perm: int = 128,
+        shingle_size: int = 3,
+        window_seconds: float = 24 * 3600,
+        price_tolerance: float = 0.05,
+        seed: int = 1,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.window_seconds = window_seconds
+        self.price_tolerance = price_tolerance
+        self.hasher = MinHasher(num_perm, shingle_size=shingle_size, seed=seed)
+        self.bands, self.rows = lsh_bands(num_perm, threshold)
+        self._clock = clock
+        self._entries: dict[str, _Entry] = {}
+        self._buckets: list[dict[bytes, set[str]]] = [{} for _ in range(self.bands)]
+        self._order: deque[tuple[float, str]] = deque()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, deal_id: object) -> bool:
+        return deal_id in self._entries
+
+    def _band_keys(self, signature: Signature) -> list[bytes]:
+        r = self.rows
+        return [signature[i * r : (i + 1) * r].tobytes() for i in range(self.bands)]
+
+    def _price_matches(self, left: float | None, right: float | None) -> bool:
+        if left is None or right is None:
+            return True
+        return abs(left - right) <= self.price_tolerance * max(abs(left), abs(right))
+
+    def signature(self, title: str) -> Signature:
+        return self.hasher.signature(normalize_title(title))
+
+    def query(self, title: str, *, price: float | None = None) -> list[NearDuplicate]:
+        """Return indexed deals similar to ``title``, most similar first."""
+        self.expire()
+        signature = self.signature(title)
+        return self._query(signature, price)
+
+    def _query(self, signature: Signature, price: float | None) -> list[NearDuplicate]:
+        candidates: set[str] = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            candidates |= self._buckets[band].get(key, set())
+        matches = []
+        for deal_id in candidates:
+            entry = self._entries[deal_id]
+            score = similarity(signature, entry.signature)
+            if score >= self.threshold and self._price_matches(price, entry.price):
+                matches.append(NearDuplicate(deal_id, score))
+        matches.sort(key=lambda m: m.similarity, reverse=True)
+        return matches
+
+    def add(self, deal_id: str, title: str, *, price: float | None = None) -> None:
+        """Index a deal. Re-adding an id replaces its previous entry."""
+        self._insert(deal_id, self.signature(title), price, self._clock())
+
+    def check_and_add(
+        self, deal_id: str, title: str, *, price: float | None = None
+    ) -> NearDuplicate | None:
+        """Return the best near-duplicate of a deal, indexing it if there is none.
+
+        Duplicates are not indexed themselves, so a chain of gradually
+        drifting titles cannot creep away from the original.
+        """
+        self.expire()
+        signature = self.signature(title)
+        matches = [m for m in self._query(signature, price) if m.deal_id != deal_id]
+        if matches:
+            return matches[0]
+        self._insert(deal_id, signature, price, self._clock())
+        return None
+
+    def remove(self, deal_id: str) -> None:
+        entry = self._entries.pop(deal_id, None)
+        if entry is None:
+            return
+        for band, key in enumerate(self._band_keys(entry.signature)):
+            bucket = self._buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(deal_id)
+                if not bucket:
+                    del self._buckets[band][key]
+
+    def expire(self, now: float | None = None) -> int:
+        """Drop deals older than the window. Returns how many were removed."""
+        cutoff = (self._clock() if now is None else now) - self.window_seconds
+        removed = 0
+        while self._order and self._order[0][0] <= cutoff:
+            added_at, deal_id = self._order.popleft()
+            entry = self._entries.get(deal_id)
+            # Skip queue records superseded by a later re-add of the same id.
+            if entry is not None and entry.added_at == added_at:
+                self.remove(deal_id)
+                removed += 1
+        return removed
+
+    def _insert(
+        self, deal_id: str, signature: Signature, price: float | None, added_at: float
+    ) -> None:
+        self.remove(deal_id)
+        self._entries[deal_id] = _Entry(signature, added_at, price)
+        self._order.append((added_at, deal_id))
+        for band, key in enumerate(self._band_keys(signature)):
+            self._buckets[band].setdefault(key, set()).add(deal_id)
+
+    async def snapshot(self, redis: Redis, key: str = "dedup:near:snapshot") -> None:
+        """Write the index to a Redis hash that expires with the window."""
+        self.expire()
+        ids = list(self._entries)
+        entries = [self._entries[i] for i in ids]
+        signatures = np.stack([e.signature for e in entries]) if entries else np.empty(0)
+        meta = {
+            "num_perm": self.hasher.num_perm,
+            "shingle_size": self.hasher.shingle_size,
+            "seed": self.hasher.seed,
+        }
+        mapping: dict[FieldT, EncodableT] = {
+            "meta": json.dumps(meta),
+            "ids": json.dumps(ids),
+            "added_at": np.array([e.added_at for e in entries], dtype=np.float64).tobytes(),
+            "prices": np.array(
+                [math.nan if e.price is None else e.price for e in entries], dtype=np.float64
+            ).tobytes(),
+            "signatures": signatures.astype(np.uint64).tobytes(),
+        }
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            pipe.hset(key, mapping=mapping)
+            pipe.expire(key, int(self.window_seconds))
+            await pipe.execute()
+
+    async def restore(self, redis: Redis, key: str = "dedup:near:snapshot") -> int:
+        """Load a snapshot written by :meth:`snapshot`. Returns entries loaded.
+
+        Raises:
+            ValueError: If the snapshot was built with different MinHash
+                parameters, whose signatures would not be comparable.
+        """
+        # The client is not configured with decode_responses, so values are bytes.
+        data = cast(dict[bytes, bytes], await redis.hgetall(key))
+        if not data:
+            return 0
+        meta = json.loads(data[b"meta"])
+        expected = {
+            "num_perm": self.hasher.num_perm,
+            "shingle_size": self.hasher.shingle_size,
+            "seed": self.hasher.seed,
+        }
+        if meta != expected:
+            raise ValueError(f"snapshot parameters {meta} do not match index {expected}")
+        ids: list[str] = json.loads(data[b"ids"])
+        added_at = np.frombuffer(data[b"added_at"], dtype=np.float64)
+        prices = np.frombuffer(data[b"prices"], dtype=np.float64)
+        signatures = np.frombuffer(data[b"signatures"], dtype=np.uint64).reshape(
+            len(ids), self.hasher.num_perm
+        )
+        order = np.argsort(added_at, kind="stable")
+        for i in order:
+            price = None if math.isnan(prices[i]) else float(prices[i])
+            self._insert(ids[i], signatures[i].copy(), price, float(added_at[i]))
+        self.expire()
+        return len(self._entries)
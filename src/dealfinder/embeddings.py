@@ -0,0 +1,222 @@
+"""Text embedding interfaces and the batching embedding service.
+
+Deals are embedded for vector similarity, and the same titles and
+descriptions recur across scans and sources. :class:`BatchingEmbedder`
+wraps an embedding backend: concurrent callers' texts are collected into
+micro-batches (flushed when ``max_batch_size`` texts are waiting or after
+``max_delay`` seconds), each batch makes one backend call, and results are
+cached by content hash in an in-process LRU backed by Redis. Callers get
+their rows back through shared futures, so a text requested by several
+coroutines at once is embedded once.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import Protocol, cast
+
+import numpy as np
+import numpy.typing as npt
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+Embeddings = npt.NDArray[np.float32]
+Vector = npt.NDArray[np.float32]
+
+
+class Embedder(Protocol):
+    """Embeds a batch of texts into a ``(len(texts), dim)`` float32 matrix."""
+
+    async def embed(self, texts: Sequence[str]) -> Embeddings: ...
+
+
+def normalize_rows(vectors: npt.ArrayLike) -> Embeddings:
+    """Scale rows to unit length so dot products are cosine similarities."""
+    matrix = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    normalized: Embeddings = np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+    return normalized
+
+
+def content_hash(text: str, model: str) -> str:
+    """Cache key for a text under an embedding model."""
+    return hashlib.sha256(f"{model}\0{text}".encode()).hexdigest()
+
+
+class BatchingEmbedder:
+    """Micro-batching, content-hash-cached front end to an :class:`Embedder`.
+
+    Itself an :class:`Embedder`, so it can be passed anywhere a backend is.
+
+    Args:
+        backend: Embedding backend called once per micro-batch.
+        model: Model identifier; part of the cache key so a model change
+            never serves stale vectors.
+        redis: Optional shared cache tier; ``None`` keeps only the LRU.
+        max_batch_size: Texts per backend call.
+        max_delay: Seconds the first queued text waits for a batch to fill.
+        cache_size: Embeddings held in the in-process LRU.
+        ttl: Seconds embeddings stay in Redis.
+    """
+
+    prefix = "embeddings"
+
+    def __init__(
+        self,
+        backend: Embedder,
+        model: str,
+        redis: Redis | None = None,
+        *,
+        max_batch_size: int = 64,
+        max_delay: float = 0.01,
+        cache_size: int = 50_000,
+        ttl: int = 30 * 86400,
+    ) -> None:
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be positive")
+        self.backend = backend
+        self.model = model
+        self._redis = redis
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self._lru: OrderedDict[str, Vector] = OrderedDict()
+        self._pending: dict[str, str] = {}
+        self._inflight: dict[str, asyncio.Future[Vector]] = {}
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task[None]] = set()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.batches = 0
+
+    def _key(self, digest: str) -> str:
+        return f"{self.prefix}:{self.model}:{digest}"
+
+    def _remember(self, digest: str, vector: Vector) -> None:
+        self._lru[digest] = vector
+        self._lru.move_to_end(digest)
+        while len(self._lru) > self.cache_size:
+            self._lru.popitem(last=False)
+
+    async def embed(self, texts: Sequence[str]) -> Embeddings:
+        """Embed ``texts``, joining the current micro-batch for cache misses."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        loop = asyncio.get_running_loop()
+        digests = [content_hash(text, self.model) for text in texts]
+        rows: dict[str, Vector] = {}
+        waiting: dict[str, asyncio.Future[Vector]] = {}
+        for text, digest in zip(texts, digests, strict=True):
+            if digest in rows or digest in waiting:
+                continue
+            cached = self._lru.get(digest)
+            if cached is not None:
+                self._lru.move_to_end(digest)
+                rows[digest] = cached
+                self.hits += 1
+                continue
+            future = self._inflight.get(digest)
+            if future is None:
+                future = self._inflight[digest] = loop.create_future()
+                self._pending[digest] = text
+            waiting[digest] = future
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._pending and self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+
+        if waiting:
+            # asyncio.wait does not cancel shared futures if this caller is cancelled.
+            await asyncio.wait(waiting.values())
+            for digest, future in waiting.items():
+                rows[digest] = future.result()
+        return np.stack([rows[digest] for digest in digests])
+
+    def _flush(self) -> None:
+        """Hand all pending texts to background batch tasks."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending = list(self._pending.items())
+        self._pending.clear()
+        for start in range(0, len(pending), self.max_batch_size):
+            task = asyncio.create_task(self._run(pending[start : start + self.max_batch_size]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list[tuple[str, str]]) -> None:
+        """Resolve one micro-batch from Redis, then the backend."""
+        digests = [digest for digest, _ in batch]
+        found = await self._read_cache(digests)
+        fresh: dict[str, Vector] = {}
+        try:
+            missing = [(digest, text) for digest, text in batch if digest not in found]
+            if missing:
+                vectors = np.asarray(
+                    await self.backend.embed([text for _, text in missing]), dtype=np.float32
+                )
+                if len(vectors) != len(missing):
+                    raise ValueError(
+                        f"backend returned {len(vectors)} embeddings for {len(missing)} texts"
+                    )
+                self.batches += 1
+                self.misses += len(missing)
+                fresh = {digest: vector for (digest, _), vector in zip(missing, vectors)}
+                found.update(fresh)
+        except Exception as exc:  # noqa: BLE001 - re-raised to every waiting caller
+            logger.warning("Embedding batch failed", extra={"size": len(batch), "error": str(exc)})
+            for digest in digests:
+                future = self._inflight.pop(digest)
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for digest in digests:
+            self._remember(digest, found[digest])
+            future = self._inflight.pop(digest)
+            if not future.done():
+                future.set_result(found[digest])
+        if fresh:
+            await self._write_cache(fresh)
+
+    async def _read_cache(self, digests: list[str]) -> dict[str, Vector]:
+        """Embeddings Redis holds for ``digests``; on a Redis error, none."""
+        found: dict[str, Vector] = {}
+        if self._redis is None:
+            return found
+        try:
+            raw = await self._redis.mget([self._key(d) for d in digests])
+        except Exception as exc:  # noqa: BLE001 - the cache is best-effort
+            logger.warning("Embedding cache read failed", extra={"error": str(exc)})
+            return found
+        for digest, value in zip(digests, raw, strict=True):
+            if value is not None:
+                found[digest] = np.frombuffer(cast(bytes, value), dtype=np.float32)
+        self.redis_hits += len(found)
+        return found
+
+    async def _write_cache(self, fresh: dict[str, Vector]) -> None:
+        if self._redis is None:
+            return
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for digest, vector in fresh.items():
+                    pipe.set(self._key(digest), vector.tobytes(), ex=self.ttl)
+                await pipe.execute()
+        except Exception as exc:  # noqa: BLE001 - the cache is best-effort
+            logger.warning("Embedding cache write failed", extra={"error": str(exc)})
+
+    async def aclose(self) -> None:
+        """Flush pending texts and wait for in-flight batches."""
+        if self._pending:
+            self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,177 @@
+"""Materialized per-user deal feeds in Redis sorted sets.
+
+Serving ``/api/v1/deals`` used to mean querying active deals by user
+preferences, enriching them from OpenSearch and sorting on every cache
+miss. :class:`FeedStore` moves that work to write time. When an
+opportunity is found it is written once to a shared hash of deal bodies
+and added to the sorted set of every matching user, scored by discount
+and trimmed to a cap. A page read is then one ``ZREVRANGEBYSCORE`` and one
+``HMGET``, whatever the size of the catalog. Bodies are serialized once at
+publish time, and :meth:`FeedStore.raw_page` returns them as stored so the
+API can splice them into a response without re-encoding.
+
+Pages are addressed by an opaque cursor holding the last item's score and
+deal ID rather than by offset, so new opportunities arriving between
+requests do not shift or repeat items. Bodies of expired deals are removed
+with :meth:`FeedStore.prune`, and readers drop the dangling feed entries
+they come across.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+from typing import cast
+
+from redis.asyncio import Redis
+
+from dealfinder.schemas import PricedDeal
+
+PAGE_SIZE = 20
+
+
+def discount_score(priced: PricedDeal) -> float:
+    """Feed ordering score: the discount in dollars, 0 when unknown."""
+    return priced.discount if priced.discount is not None else 0.0
+
+
+def encode_cursor(score: float, deal_id: str) -> str:
+    raw = json.dumps([score, deal_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[float, str]:
+    """Parse a cursor from :func:`encode_cursor`; raises ``ValueError`` if invalid."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        score, deal_id = json.loads(raw)
+        return float(score), str(deal_id)
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f"invalid feed cursor {cursor!r}") from exc
+
+
+@dataclass(frozen=True, slots=True)
+class RawFeedPage:
+    """One page of a user's feed as the JSON bytes stored at publish time."""
+
+    bodies: list[bytes]
+    next_cursor: str | None
+
+
+@dataclass(frozen=True, slots=True)
+class FeedPage:
+    """One page of a user's feed, best deal first."""
+
+    items: list[PricedDeal]
+    next_cursor: str | None
+
+
+class FeedStore:
+    """Fan-out-on-write deal feeds.
+
+    Args:
+        redis: Async Redis client.
+        cap: Deals kept per user; the lowest-scored are trimmed.
+        ttl: Seconds an untouched feed lives.
+        chunk_size: Users written per pipeline when fanning out.
+        score: Orders deals within a feed; higher comes first.
+    """
+
+    prefix = "feed"
+
+    def __init__(
+        self,
+        redis: Redis,
+        *,
+        cap: int = 500,
+        ttl: int = 7 * 24 * 3600,
+        chunk_size: int = 1000,
+        score: Callable[[PricedDeal], float] = discount_score,
+    ) -> None:
+        if cap < 1 or chunk_size < 1:
+            raise ValueError("cap and chunk_size must be at least 1")
+        self._redis = redis
+        self.cap = cap
+        self.ttl = ttl
+        self.chunk_size = chunk_size
+        self.score = score
+
+    @property
+    def bodies_key(self) -> str:
+        return f"{self.prefix}:deals"
+
+    def _key(self, user_id: str) -> str:
+        return f"{self.prefix}:{user_id}"
+
+    async def publish(self, priced: PricedDeal, user_ids: Sequence[str]) -> None:
+        """Store a deal's body and add it to each user's feed."""
+        deal_id = priced.deal.id
+        score = self.score(priced)
+        await self._redis.hset(self.bodies_key, deal_id, priced.model_dump_json())
+        for start in range(0, len(user_ids), self.chunk_size):
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for user_id in user_ids[start : start + self.chunk_size]:
+                    key = self._key(user_id)
+                    pipe.zadd(key, {deal_id: score})
+                    pipe.zremrangebyrank(key, 0, -self.cap - 1)
+                    pipe.expire(key, self.ttl)
+                await pipe.execute()
+
+    async def raw_page(
+        self, user_id: str, *, limit: int = PAGE_SIZE, cursor: str | None = None
+    ) -> RawFeedPage:
+        """Read up to ``limit`` deals after ``cursor`` as their stored JSON.
+
+        Raises ``ValueError`` for a malformed cursor.
+        """
+        key = self._key(user_id)
+        rows: list[tuple[bytes, float]]
+        if cursor is None:
+            rows = cast(
+                list[tuple[bytes, float]],
+                await self._redis.zrevrangebyscore(
+                    key, "+inf", "-inf", start=0, num=limit, withscores=True
+                ),
+            )
+        else:
+            # Deals are ordered by (score, deal ID) descending; ties with the
+            # cursor's score are fetched separately and filtered by ID.
+            after_score, after_id = decode_cursor(cursor)
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.zrangebyscore(key, after_score, after_score, withscores=True)
+                pipe.zrevrangebyscore(
+                    key, f"({after_score!r}", "-inf", start=0, num=limit, withscores=True
+                )
+                ties, lower = await pipe.execute()
+            after = after_id.encode()
+            rows = sorted(((m, s) for m, s in ties if m < after), reverse=True) + lower
+            rows = rows[:limit]
+        if not rows:
+            return RawFeedPage([], None)
+
+        deal_ids = [member.decode() for member, _ in rows]
+        bodies = cast(list[bytes | None], await self._redis.hmget(self.bodies_key, deal_ids))
+        missing = [deal_id for deal_id, body in zip(deal_ids, bodies, strict=True) if body is None]
+        if missing:
+            await self._redis.zrem(key, *missing)
+        next_cursor = encode_cursor(rows[-1][1], deal_ids[-1]) if len(rows) == limit else None
+        return RawFeedPage([body for body in bodies if body is not None], next_cursor)
+
+    async def page(
+        self, user_id: str, *, limit: int = PAGE_SIZE, cursor: str | None = None
+    ) -> FeedPage:
+        """Read up to ``limit`` deals after ``cursor``, parsed.
+
+        Raises ``ValueError`` for a malformed cursor.
+        """
+        raw = await self.raw_page(user_id, limit=limit, cursor=cursor)
+        return FeedPage(
+            [PricedDeal.model_validate_json(body) for body in raw.bodies], raw.next_cursor
+        )
+
+    async def prune(self, deal_ids: Sequence[str]) -> None:
+        """Drop the bodies of deals that are no longer active."""
+        if deal_ids:
+            await self._redis.hdel(self.bodies_key, *deal_ids)
@@ -0,0 +1,221 @@
+"""Idempotency ledger for exactly-once notification sends.
+
+Before a notification is dispatched its ``(user, deal, channel)`` key is
+claimed in Redis with ``SET NX PX``; a batch of claims is one pipelined
+round trip, and only keys whose ``SET`` succeeded may be sent. Claims are
+buffered and written behind to the ``deal-state`` table in batches, by size
+and on a timer, off the send path, so the ledger survives losing Redis without paying a
+DynamoDB conditional write on every send.
+
+Every claim pipeline also reads a sentinel key holding the time recovery
+ends. If Redis comes back without it (a failover to an empty or stale
+replica) the first instance to notice writes a deadline one window ahead,
+and until then every instance checks keys that Redis lets through against
+DynamoDB: keys found there are treated as duplicates and re-seeded into
+Redis with their remaining TTL. The ledger is rebuilt lazily, key by key,
+as claims arrive. :meth:`IdempotencyLedger.recover` enters the same mode
+explicitly after a failover that kept the sentinel.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections.abc import Callable, Sequence
+from typing import Any
+
+from redis.asyncio import Redis
+
+from dealfinder.state import StateStore
+
+logger = logging.getLogger(__name__)
+
+
+def idempotency_key(user_id: str, deal_id: str, channel: str) -> str:
+    """Ledger key for sending one deal to one user on one channel."""
+    return f"{user_id}#{deal_id}#{channel}"
+
+
+class IdempotencyLedger:
+    """Claims notification keys in Redis with durable write-behind.
+
+    Args:
+        redis: Async Redis client.
+        store: Durable store, normally the ``deal-state`` table.
+        window: Seconds a claim blocks duplicates.
+        flush_size: Buffered claims that trigger a write-behind flush.
+        flush_interval: Seconds between write-behind flushes once
+            :meth:`start` has been called. Without the timer, a claim
+            schedules a flush when this much time has passed since the last.
+        clock: Source of the current time, overridable in tests.
+    """
+
+    prefix = "idempotency"
+    state_prefix = "idempotency#"
+
+    def __init__(
+        self,
+        redis: Redis,
+        store: StateStore,
+        *,
+        window: int = 24 * 3600,
+        flush_size: int = 500,
+        flush_interval: float = 1.0,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self._redis = redis
+        self._store = store
+        self.window = window
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._clock = clock
+        self._pending: dict[str, dict[str, Any]] = {}
+        self._last_flush = clock()
+        self._verify_until = -float("inf")
+        self._flusher: asyncio.Task[None] | None = None
+        self._flushing: asyncio.Task[int] | None = None
+        self.claimed = 0
+        self.duplicates = 0
+
+    @property
+    def sentinel(self) -> str:
+        return f"{self.prefix}:sentinel"
+
+    @property
+    def recovering(self) -> bool:
+        return self._clock() < self._verify_until
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    async def recover(self) -> None:
+        """Make every instance verify claims against DynamoDB for one window.
+
+        Use after a failover that kept the sentinel; a lost sentinel starts
+        recovery on its own.
+        """
+        self._verify_until = self._clock() + self.window
+        await self._redis.set(self.sentinel, repr(self._verify_until))
+        logger.warning("Idempotency ledger recovering from durable store")
+
+    async def _start_recovery(self) -> None:
+        # Several instances may find the sentinel missing at once; the first
+        # deadline written wins and the others adopt it.
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.set(self.sentinel, repr(self._clock() + self.window), nx=True)
+            pipe.get(self.sentinel)
+            _, deadline = await pipe.execute()
+        self._verify_until = float(deadline)
+        logger.warning("Idempotency ledger recovering from durable store")
+
+    async def start(self) -> None:
+        """Flush buffered claims every ``flush_interval`` seconds until :meth:`aclose`."""
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def claim_many(self, keys: Sequence[str]) -> list[bool]:
+        """Claim keys; ``True`` means the caller owns the send, ``False`` a duplicate.
+
+        A key repeated within ``keys`` is only claimed at its first position.
+        """
+        now = self._clock()
+        unique = list(dict.fromkeys(keys))
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.get(self.sentinel)
+            for key in unique:
+                pipe.set(self._key(key), repr(now), nx=True, px=self.window * 1000)
+            results = await pipe.execute()
+        if results[0] is None:
+            await self._start_recovery()
+        else:
+            self._verify_until = float(results[0])
+        claimed = {key: bool(ok) for key, ok in zip(unique, results[1:], strict=True)}
+
+        if self.recovering:
+            await self._verify(claimed, now)
+
+        for key, ok in claimed.items():
+            if ok:
+                self._pending[self.state_prefix + key] = {"claimed_at": now}
+        owned = sum(claimed.values())
+        self.claimed += owned
+        self.duplicates += len(keys) - owned
+        due = self._flusher is None and now - self._last_flush >= self.flush_interval
+        if len(self._pending) >= self.flush_size or due:
+            self._flush_in_background()
+
+        seen: set[str] = set()
+        outcome = []
+        for key in keys:
+            outcome.append(claimed[key] and key not in seen)
+            seen.add(key)
+        return outcome
+
+    async def claim(self, key: str) -> bool:
+        return (await self.claim_many([key]))[0]
+
+    async def _verify(self, claimed: dict[str, bool], now: float) -> None:
+        """Reject fresh Redis claims that DynamoDB already holds and re-seed them."""
+        fresh = [self.state_prefix + key for key, ok in claimed.items() if ok]
+        if not fresh:
+            return
+        durable = await asyncio.to_thread(self._store.get_many, fresh)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for state_key, record in durable.items():
+                if record.get("released"):
+                    continue
+                key = state_key.removeprefix(self.state_prefix)
+                claimed[key] = False
+                remaining = record["claimed_at"] + self.window - now
+                if remaining > 0:
+                    pipe.set(self._key(key), repr(record["claimed_at"]), px=int(remaining * 1000))
+            await pipe.execute()
+
+    async def release(self, keys: Sequence[str]) -> None:
+        """Give up claims whose sends failed permanently so they can be retried."""
+        if not keys:
+            return
+        await self._redis.delete(*(self._key(key) for key in keys))
+        for key in keys:
+            self._pending[self.state_prefix + key] = {"released": True}
+
+    def _flush_in_background(self) -> None:
+        """Start a flush without making the claiming send wait for DynamoDB."""
+        if self._flushing is None or self._flushing.done():
+            self._flushing = asyncio.create_task(self.flush())
+
+    async def flush(self) -> int:
+        """Write buffered claims to the durable store. Returns the number written.
+
+        On failure the claims stay buffered for the next flush.
+        """
+        self._last_flush = self._clock()
+        if not self._pending:
+            return 0
+        items, self._pending = self._pending, {}
+        try:
+            await asyncio.to_thread(self._store.put_many, items, ttl=self.window)
+        except Exception as exc:  # noqa: BLE001 - write-behind must not fail sends
+            logger.warning(
+                "Idempotency write-behind failed", extra={"items": len(items), "error": str(exc)}
+            )
+            self._pending = {**items, **self._pending}
+            return 0
+        return len(items)
+
+    async def aclose(self) -> None:
+        """Stop the flush timer and flush buffered claims."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        if self._flushing is not None:
+            await asyncio.gather(self._flushing, return_exceptions=True)
+            self._flushing = None
+        await self.flush()
@@ -0,0 +1,295 @@
+"""Inverted index from deal attributes to interested subscribers.
+
+The Opportunity Evaluator must find the users who care about each
+opportunity. Scanning every subscription per deal is O(users x deals), so
+:class:`PreferenceIndex` inverts the predicates instead. Each user owns a
+slot (a bit position). Every category, brand and keyword maps to a posting
+of the slots that asked for it, and a per-field wildcard bitset holds slots
+that left the field unconstrained. A deal resolves by OR-ing the postings
+of its terms with the wildcard for each field and AND-ing the fields
+together, which costs a few word-wise NumPy operations over ``users / 64``
+words. Price and discount bounds are then checked with one vectorized
+comparison over the surviving slots.
+
+Most terms are rare, and a bitset per term would cost ``users / 8`` bytes
+each, so a posting is a sorted slot array until the term is held by one
+slot in 64, where the bitset becomes the smaller of the two. Memory then
+grows with the number of subscribed terms rather than terms x users.
+
+Terms are matched on normalized text (see
+:func:`~dealfinder.dedup.minhash.normalize_title`). Brands and keywords
+match any phrase of up to :data:`MAX_PHRASE_WORDS` consecutive title words.
+"""
+
+from __future__ import annotations
+
+import functools
+import math
+from collections.abc import Iterable, Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+from dealfinder.dedup.minhash import normalize_title
+from dealfinder.schemas import Deal, PricedDeal, Subscription
+
+MAX_PHRASE_WORDS = 3
+FIELDS = ("categories", "brands", "keywords")
+
+Bitset = npt.NDArray[np.uint64]
+Slots = npt.NDArray[np.int64]
+
+# Subscription vocabularies repeat heavily across users.
+_normalize_term = functools.lru_cache(maxsize=65_536)(normalize_title)
+
+
+def deal_terms(deal: Deal) -> dict[str, set[str]]:
+    """Normalized terms a deal offers to each preference field."""
+    words = normalize_title(deal.title).split()
+    phrases = {
+        " ".join(words[i : i + n])
+        for n in range(1, MAX_PHRASE_WORDS + 1)
+        for i in range(len(words) - n + 1)
+    }
+    category = normalize_title(deal.category) if deal.category else ""
+    return {"categories": {category} - {""}, "brands": phrases, "keywords": phrases}
+
+
+def discount_percent(priced: PricedDeal) -> float:
+    """Discount as a percentage of the estimate, or ``-inf`` when unknown."""
+    if priced.discount is None or not priced.estimate:
+        return -math.inf
+    return 100.0 * priced.discount / priced.estimate
+
+
+class _Posting:
+    """Slots holding one term: sorted while rare, a bitset once frequent."""
+
+    __slots__ = ("bits", "count", "slots")
+
+    def __init__(self) -> None:
+        self.slots: Slots = np.empty(0, dtype=np.int64)
+        self.bits: Bitset | None = None
+        self.count = 0
+
+
+class PreferenceIndex:
+    """Bitset inverted index over :class:`~dealfinder.schemas.Subscription`.
+
+    Args:
+        capacity: Initial number of user slots; grows by doubling.
+    """
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self._words = max(1, -(-capacity // 64))
+        self._user_ids = np.full(self.capacity, "", dtype=object)
+        self._size = 0
+        self._slots: dict[str, int] = {}
+        self._terms: dict[int, dict[str, frozenset[str]]] = {}
+        self._free: list[int] = []
+        self._active = self._bitset()
+        self._any = {field: self._bitset() for field in FIELDS}
+        self._postings: dict[str, dict[str, _Posting]] = {field: {} for field in FIELDS}
+        self._max_price = np.full(self.capacity, np.inf)
+        self._min_discount = np.full(self.capacity, -np.inf)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, user_id: object) -> bool:
+        return user_id in self._slots
+
+    @property
+    def capacity(self) -> int:
+        return self._words * 64
+
+    def _bitset(self) -> Bitset:
+        return np.zeros(self._words, dtype=np.uint64)
+
+    @property
+    def posting_nbytes(self) -> int:
+        """Bytes held by term postings."""
+        return sum(
+            posting.slots.nbytes if posting.bits is None else posting.bits.nbytes
+            for postings in self._postings.values()
+            for posting in postings.values()
+        )
+
+    @property
+    def _dense_at(self) -> int:
+        # A sorted int64 array outgrows the bitset at one slot in 64. Postings
+        # go back to arrays only at half that, so a term near the line does
+        # not flip on every update.
+        return self._words
+
+    @staticmethod
+    def _set(bits: Bitset, slots: Sequence[int] | Slots) -> None:
+        index = np.asarray(slots, dtype=np.int64)
+        np.bitwise_or.at(bits, index >> 6, np.uint64(1) << (index & 63).astype(np.uint64))
+
+    @staticmethod
+    def _clear(bits: Bitset, slot: int) -> None:
+        bits[slot >> 6] &= ~np.uint64(1 << (slot & 63))
+
+    def _sparsify(self, posting: _Posting) -> None:
+        assert posting.bits is not None
+        bits = np.unpackbits(posting.bits.view(np.uint8), bitorder="little")
+        posting.slots = np.flatnonzero(bits).astype(np.int64)
+        posting.bits = None
+
+    def _add_members(self, posting: _Posting, members: Sequence[int]) -> None:
+        posting.count += len(members)
+        if posting.bits is not None:
+            self._set(posting.bits, members)
+            return
+        posting.slots = np.union1d(posting.slots, np.asarray(members, dtype=np.int64))
+        if posting.count >= self._dense_at:
+            posting.bits = self._bitset()
+            self._set(posting.bits, posting.slots)
+            posting.slots = np.empty(0, dtype=np.int64)
+
+    def _remove_member(self, posting: _Posting, slot: int) -> None:
+        posting.count -= 1
+        if posting.bits is None:
+            posting.slots = np.delete(posting.slots, np.searchsorted(posting.slots, slot))
+            return
+        self._clear(posting.bits, slot)
+        if posting.count < self._dense_at // 2:
+            self._sparsify(posting)
+
+    def _grow(self) -> None:
+        """Double the slot capacity of every bitset and column.
+
+        Dense postings that are now below the density threshold go back to
+        sorted arrays instead of being widened.
+        """
+        old = self._words
+        self._words *= 2
+
+        def widen(bits: Bitset) -> Bitset:
+            wide = self._bitset()
+            wide[:old] = bits
+            return wide
+
+        self._active = widen(self._active)
+        self._any = {field: widen(bits) for field, bits in self._any.items()}
+        for postings in self._postings.values():
+            for posting in postings.values():
+                if posting.bits is None:
+                    continue
+                if posting.count < self._dense_at // 2:
+                    self._sparsify(posting)
+                else:
+                    posting.bits = widen(posting.bits)
+        self._user_ids = np.concatenate([self._user_ids, np.full(old * 64, "", dtype=object)])
+        self._max_price = np.concatenate([self._max_price, np.full(old * 64, np.inf)])
+        self._min_discount = np.concatenate([self._min_discount, np.full(old * 64, -np.inf)])
+
+    def upsert(self, subscription: Subscription) -> None:
+        """Add a subscription, replacing any previous one for the same user."""
+        self.extend([subscription])
+
+    def extend(self, subscriptions: Iterable[Subscription]) -> None:
+        """Upsert many subscriptions, setting each posting's bits in one pass.
+
+        If a user appears more than once, the last subscription wins.
+        """
+        latest = {subscription.user_id: subscription for subscription in subscriptions}
+        terms = {
+            user_id: {
+                field: frozenset(_normalize_term(t) for t in getattr(subscription, field)) - {""}
+                for field in FIELDS
+            }
+            for user_id, subscription in latest.items()
+        }
+        for fields in terms.values():
+            for phrase in fields["brands"] | fields["keywords"]:
+                if len(phrase.split()) > MAX_PHRASE_WORDS:
+                    raise ValueError(f"{phrase!r} is longer than {MAX_PHRASE_WORDS} words")
+
+        slots: list[int] = []
+        wildcard: dict[str, list[int]] = {field: [] for field in FIELDS}
+        postings: dict[tuple[str, str], list[int]] = {}
+        for user_id, subscription in latest.items():
+            self.remove(user_id)
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot = self._size
+                self._size += 1
+                if slot >= self.capacity:
+                    self._grow()
+            slots.append(slot)
+            self._user_ids[slot] = user_id
+            self._slots[user_id] = slot
+            self._terms[slot] = terms[user_id]
+            for field, values in terms[user_id].items():
+                if not values:
+                    wildcard[field].append(slot)
+                for term in values:
+                    postings.setdefault((field, term), []).append(slot)
+            if subscription.max_price is not None:
+                self._max_price[slot] = subscription.max_price
+            if subscription.min_discount_pct is not None:
+                self._min_discount[slot] = subscription.min_discount_pct
+
+        self._set(self._active, slots)
+        for field, members in wildcard.items():
+            self._set(self._any[field], members)
+        for (field, term), members in postings.items():
+            posting = self._postings[field].get(term)
+            if posting is None:
+                posting = self._postings[field][term] = _Posting()
+            self._add_members(posting, members)
+
+    def remove(self, user_id: str) -> bool:
+        """Drop a user's subscription. Returns ``False`` if there was none."""
+        slot = self._slots.pop(user_id, None)
+        if slot is None:
+            return False
+        self._clear(self._active, slot)
+        for field, values in self._terms.pop(slot).items():
+            self._clear(self._any[field], slot)
+            postings = self._postings[field]
+            for term in values:
+                posting = postings[term]
+                if posting.count == 1:
+                    del postings[term]
+                else:
+                    self._remove_member(posting, slot)
+        self._max_price[slot] = np.inf
+        self._min_discount[slot] = -np.inf
+        self._user_ids[slot] = ""
+        self._free.append(slot)
+        return True
+
+    def candidates(self, deal: Deal) -> Bitset:
+        """Bitset of slots whose category, brand and keyword predicates match."""
+        mask = self._active.copy()
+        for field, terms in deal_terms(deal).items():
+            postings = self._postings[field]
+            allowed = self._any[field].copy()
+            sparse: list[Slots] = []
+            for term in terms:
+                posting = postings.get(term)
+                if posting is None:
+                    continue
+                if posting.bits is not None:
+                    allowed |= posting.bits
+                else:
+                    sparse.append(posting.slots)
+            if sparse:
+                self._set(allowed, np.concatenate(sparse))
+            mask &= allowed
+        return mask
+
+    def match(self, priced: PricedDeal) -> list[str]:
+        """User IDs whose subscriptions all accept this priced deal."""
+        mask = self.candidates(priced.deal)
+        bits = np.unpackbits(mask.view(np.uint8), bitorder="little")
+        slots = np.nonzero(bits.view(np.bool_))[0]
+        keep = (self._max_price[slots] >= priced.deal.price) & (
+            self._min_discount[slots] <= discount_percent(priced)
+        )
+        user_ids: list[str] = self._user_ids[slots[keep]].tolist()
+        return user_ids
@@ -0,0 +1,231 @@
+"""MessagingAgent: one LLM-written template per deal and segment, personalized locally.
+
+Notification text used to be generated by one LLM call per opportunity
+per user. Messages for a deal differ between users only in a few fields,
+so the agent instead asks the model once per deal per :class:`Segment`
+(locale, tone and channel length limit) for a template with ``{slot}``
+placeholders, caches it by deal ID and segment, and fills the slots for
+each recipient in-process. LLM calls scale with segments rather than
+users, and concurrent requests for the same template share one call.
+
+Model output is validated: templates with unknown or malformed slots, or
+whose fixed text alone exceeds the length limit, are replaced by a
+deterministic fallback so a bad completion never blocks delivery.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import string
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Mapping, Sequence
+from dataclasses import dataclass
+from typing import Protocol
+
+from dealfinder.notify import Notification
+from dealfinder.schemas import PricedDeal
+
+logger = logging.getLogger(__name__)
+
+SLOTS = frozenset({"name", "title", "price", "estimate", "discount", "url"})
+DEFAULT_LENGTH = 200
+LENGTH_LIMITS: Mapping[str, int] = {"sns": 160, "pushover": 200, "slack": 200, "ses": 200}
+FALLBACK_TEMPLATE = "{name}, {title} is now {price} ({discount} off). {url}"
+ELLIPSIS = "…"
+
+_FORMATTER = string.Formatter()
+
+
+class TextGenerator(Protocol):
+    """Completes a prompt, e.g. a Bedrock Claude client."""
+
+    async def generate(self, prompt: str) -> str: ...
+
+
+@dataclass(frozen=True, slots=True)
+class Segment:
+    """Recipients who can share one generated template."""
+
+    locale: str = "en-US"
+    tone: str = "friendly"
+    max_length: int = DEFAULT_LENGTH
+
+
+@dataclass(frozen=True, slots=True)
+class Recipient:
+    """A user to notify about a deal on one channel."""
+
+    user_id: str
+    channel: str
+    address: str
+    name: str | None = None
+    locale: str = "en-US"
+    tone: str = "friendly"
+
+    @property
+    def segment(self) -> Segment:
+        return Segment(self.locale, self.tone, LENGTH_LIMITS.get(self.channel, DEFAULT_LENGTH))
+
+
+def template_slots(text: str) -> set[str]:
+    """Placeholder names in ``text``; raises ``ValueError`` if malformed."""
+    slots = set()
+    for _, field_name, format_spec, conversion in _FORMATTER.parse(text):
+        if field_name is None:
+            continue
+        if not field_name or format_spec or conversion:
+            raise ValueError(f"unsupported placeholder in {text!r}")
+        slots.add(field_name)
+    return slots
+
+
+@dataclass(frozen=True, slots=True)
+class MessageTemplate:
+    """A deal message with ``{slot}`` placeholders for one segment."""
+
+    text: str
+    segment: Segment
+    fallback: bool = False
+
+    def render(self, values: Mapping[str, str]) -> str:
+        """Fill the slots, shortening the title and then the whole message to fit."""
+        limit = self.segment.max_length
+        message = self.text.format_map(values)
+        if len(message) > limit and "{title}" in self.text:
+            title = values.get("title", "")
+            excess = len(message) - limit
+            shortened = title[: max(0, len(title) - excess - len(ELLIPSIS))].rstrip()
+            message = self.text.format_map({**values, "title": shortened + ELLIPSIS})
+        if len(message) > limit:
+            message = message[: limit - len(ELLIPSIS)].rstrip() + ELLIPSIS
+        return message
+
+
+def build_prompt(priced: PricedDeal, segment: Segment) -> str:
+    """Prompt asking the model for a slot template for one deal and segment."""
+    deal = priced.deal
+    return (
+        f"Write a {segment.tone} push notification in {segment.locale} announcing this deal. "
+        f"It must be at most {segment.max_length} characters after the placeholders are "
+        "filled in. Use these placeholders exactly as written instead of the values: "
+        "{name} for the recipient's first name, {title} for the product, {price} for the "
+        "deal price, {estimate} for the usual price, {discount} for the saving and {url} "
+        "for the link. Use no other braces. Reply with the message only.\n\n"
+        f"Product: {deal.title}\n"
+        f"Category: {deal.category or 'unknown'}\n"
+        f"Description: {(deal.description or '')[:500]}"
+    )
+
+
+def slot_values(priced: PricedDeal, name: str | None) -> dict[str, str]:
+    """Per-recipient values for every slot."""
+    deal = priced.deal
+    return {
+        "name": name or "Hi",
+        "title": deal.title,
+        "price": f"${deal.price:,.2f}",
+        "estimate": f"${priced.estimate:,.2f}" if priced.estimate is not None else "",
+        "discount": f"${priced.discount:,.2f}" if priced.discount is not None else "",
+        "url": deal.url or "",
+    }
+
+
+class MessagingAgent:
+    """Writes notification text for opportunities.
+
+    Args:
+        generator: LLM client used once per deal and segment.
+        cache_size: Templates kept in memory.
+        ttl: Seconds a template is reused.
+        clock: Source of the current time, overridable in tests.
+    """
+
+    def __init__(
+        self,
+        generator: TextGenerator,
+        *,
+        cache_size: int = 10_000,
+        ttl: float = 24 * 3600,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.generator = generator
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self._clock = clock
+        self._templates: OrderedDict[tuple[str, Segment], tuple[float, MessageTemplate]] = (
+            OrderedDict()
+        )
+        self._inflight: dict[tuple[str, Segment], asyncio.Task[MessageTemplate]] = {}
+        self.llm_calls = 0
+        self.hits = 0
+
+    def _validate(self, text: str, segment: Segment) -> str:
+        text = text.strip().strip('"').strip()
+        slots = template_slots(text)
+        if not text or not slots <= SLOTS:
+            raise ValueError(f"template uses unknown slots {sorted(slots - SLOTS)}")
+        fixed = _FORMATTER.vformat(text, (), {slot: "" for slot in slots})
+        if len(fixed) > segment.max_length:
+            raise ValueError("template text exceeds the length limit")
+        return text
+
+    async def _generate(self, priced: PricedDeal, segment: Segment) -> MessageTemplate:
+        self.llm_calls += 1
+        try:
+            text = await self.generator.generate(build_prompt(priced, segment))
+            return MessageTemplate(self._validate(text, segment), segment)
+        except Exception as exc:  # noqa: BLE001 - any model failure falls back
+            logger.warning(
+                "Using fallback message template",
+                extra={"deal_id": priced.deal.id, "segment": segment, "error": str(exc)},
+            )
+            return MessageTemplate(FALLBACK_TEMPLATE, segment, fallback=True)
+
+    async def template_for(self, priced: PricedDeal, segment: Segment) -> MessageTemplate:
+        """Return the cached template for a deal and segment, generating it once."""
+        key = (priced.deal.id, segment)
+        now = self._clock()
+        cached = self._templates.get(key)
+        if cached is not None and cached[0] > now:
+            self._templates.move_to_end(key)
+            self.hits += 1
+            return cached[1]
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.create_task(self._generate(priced, segment))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        template = await asyncio.shield(task)
+        if not template.fallback:
+            self._templates[key] = (now + self.ttl, template)
+            self._templates.move_to_end(key)
+            while len(self._templates) > self.cache_size:
+                self._templates.popitem(last=False)
+        return template
+
+    async def compose(
+        self, priced: PricedDeal, recipients: Sequence[Recipient]
+    ) -> list[Notification]:
+        """Render one notification per recipient, generating each segment's template once."""
+        segments = list(dict.fromkeys(recipient.segment for recipient in recipients))
+        templates = dict(
+            zip(
+                segments,
+                await asyncio.gather(*(self.template_for(priced, s) for s in segments)),
+                strict=True,
+            )
+        )
+        deal = priced.deal
+        return [
+            Notification(
+                id=f"{deal.id}:{recipient.user_id}:{recipient.channel}",
+                user_id=recipient.user_id,
+                channel=recipient.channel,
+                recipient=recipient.address,
+                body=templates[recipient.segment].render(slot_values(priced, recipient.name)),
+                subject=deal.title,
+                data={"deal_id": deal.id, **({"url": deal.url} if deal.url else {})},
+            )
+            for recipient in recipients
+        ]
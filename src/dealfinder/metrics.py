@@ -0,0 +1,78 @@
+"""Lightweight in-process metrics.
+
+These are cheap enough to update on every request and are read by the
+components that adapt to them (hedge delays, concurrency limits) as well as
+exported to CloudWatch/Prometheus by the caller.
+"""
+
+from __future__ import annotations
+
+import bisect
+import math
+from collections.abc import Mapping
+from typing import Protocol
+
+
+class Gauge(Protocol):
+    """Receives point-in-time readings, e.g. a CloudWatch EMF or Prometheus adapter."""
+
+    def __call__(self, name: str, value: float, labels: Mapping[str, str]) -> None: ...
+
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram with exponential forgetting.
+
+    Bucket upper bounds grow geometrically from ``min_value`` to
+    ``max_value`` so relative precision is constant across the range. Every
+    ``half_life`` samples all counts are halved, so quantiles track the
+    recent latency distribution rather than the whole process lifetime.
+
+    Args:
+        min_value: Upper bound of the first bucket, in seconds.
+        max_value: Upper bound of the last finite bucket, in seconds.
+        growth: Ratio between consecutive bucket bounds.
+        half_life: Samples after which older observations weigh half.
+    """
+
+    def __init__(
+        self,
+        *,
+        min_value: float = 0.001,
+        max_value: float = 120.0,
+        growth: float = 1.2,
+        half_life: int = 1000,
+    ) -> None:
+        if not 0 < min_value < max_value or growth <= 1:
+            raise ValueError("require 0 < min_value < max_value and growth > 1")
+        steps = math.ceil(math.log(max_value / min_value, growth))
+        self.bounds = [min_value * growth**i for i in range(steps + 1)]
+        self._counts = [0.0] * (len(self.bounds) + 1)
+        self._total = 0.0
+        self._since_decay = 0
+        self.half_life = half_life
+        self.count = 0
+
+    def record(self, value: float) -> None:
+        """Add one observation, in seconds."""
+        self._counts[bisect.bisect_left(self.bounds, value)] += 1.0
+        self._total += 1.0
+        self.count += 1
+        self._since_decay += 1
+        if self._since_decay >= self.half_life:
+            self._counts = [c / 2 for c in self._counts]
+            self._total /= 2
+            self._since_decay = 0
+
+    def quantile(self, q: float) -> float | None:
+        """Return the bucket upper bound at quantile ``q``, or ``None`` if empty."""
+        if not 0 <= q <= 1:
+            raise ValueError("q must be within [0, 1]")
+        if self._total == 0:
+            return None
+        target = q * self._total
+        cumulative = 0.0
+        for index, count in enumerate(self._counts):
+            cumulative += count
+            if count and cumulative >= target:
+                return self.bounds[min(index, len(self.bounds) - 1)]
+        return self.bounds[-1]
@@ -0,0 +1,10 @@
+"""In-process pricing model runtimes."""
+
+from dealfinder.models.neural import (
+    HashingFeaturizer,
+    NeuralPriceModel,
+    export_weights,
+    quantize_int8,
+)
+
+__all__ = ["HashingFeaturizer", "NeuralPriceModel", "export_weights", "quantize_int8"]
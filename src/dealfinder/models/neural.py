@@ -0,0 +1,170 @@
+"""CPU-only quantized inference for the neural-network price model.
+
+The PyTorch price model is trained offline and its weights exported with
+:func:`export_weights` to a single file that is memory-mapped at load time.
+Inference is a pure NumPy forward pass over a batch, so the 0.1-weight
+neural estimate runs in-process with no SageMaker round trip and no PyTorch
+import on cold start. Worker processes mapping the same file share its pages.
+
+The file is a :mod:`dealfinder.vectors.snapshot` with magic ``b"DFNN"``:
+one section per tensor, and the model metadata (featurizer settings and
+target transform) in the header.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import zlib
+from collections.abc import Mapping, Sequence
+from pathlib import Path
+from typing import Any, Literal
+
+import numpy as np
+import numpy.typing as npt
+
+from dealfinder.schemas import Deal
+from dealfinder.vectors.snapshot import Snapshot, write_snapshot
+
+FloatArray = npt.NDArray[np.float32]
+WeightDType = Literal["float32", "float16", "int8"]
+
+MAGIC = b"DFNN"
+FORMAT_VERSION = 2
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def quantize_int8(weight: npt.ArrayLike) -> tuple[npt.NDArray[np.int8], FloatArray]:
+    """Symmetric per-output-row int8 quantization.
+
+    Returns ``(quantized, scale)`` with ``weight ≈ quantized * scale[:, None]``.
+    """
+    w = np.asarray(weight, dtype=np.float32)
+    scale = np.abs(w).max(axis=1) / 127.0
+    scale[scale == 0] = 1.0
+    quantized = np.clip(np.rint(w / scale[:, None]), -127, 127).astype(np.int8)
+    return quantized, scale.astype(np.float32)
+
+
+def export_weights(
+    path: str | os.PathLike[str],
+    layers: Sequence[tuple[npt.ArrayLike, npt.ArrayLike]],
+    *,
+    dtype: WeightDType = "int8",
+    metadata: Mapping[str, Any] | None = None,
+) -> None:
+    """Write an MLP's weights in the memory-mappable format.
+
+    Args:
+        path: Destination file; written atomically via a temporary file.
+        layers: ``(weight, bias)`` per linear layer with PyTorch's
+            ``(out_features, in_features)`` weight layout, e.g. from
+            ``state_dict()`` tensors converted with ``.numpy()``.
+        dtype: Storage type for weights. Biases and int8 scales are always
+            float32.
+        metadata: JSON-serializable model settings stored in the header.
+    """
+    tensors: dict[str, npt.NDArray[Any]] = {}
+    for index, (weight, bias) in enumerate(layers):
+        if dtype == "int8":
+            quantized, scale = quantize_int8(weight)
+            tensors[f"layers.{index}.weight"] = quantized
+            tensors[f"layers.{index}.scale"] = scale
+        else:
+            tensors[f"layers.{index}.weight"] = np.asarray(weight, dtype=dtype)
+        tensors[f"layers.{index}.bias"] = np.asarray(bias, dtype=np.float32)
+
+    header = {"dtype": dtype, "num_layers": len(layers), "metadata": dict(metadata or {})}
+    write_snapshot(path, MAGIC, FORMAT_VERSION, header, tensors)
+
+
+class HashingFeaturizer:
+    """Signed feature hashing of word unigrams and bigrams, L2-normalized.
+
+    Must match the featurizer used to train the exported model; its
+    settings are read from the weight file metadata.
+    """
+
+    def __init__(self, n_features: int, *, ngram_range: tuple[int, int] = (1, 2)) -> None:
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+
+    def transform(self, texts: Sequence[str]) -> FloatArray:
+        features = np.zeros((len(texts), self.n_features), dtype=np.float32)
+        low, high = self.ngram_range
+        for row, text in enumerate(texts):
+            tokens = _TOKEN.findall(text.lower())
+            for n in range(low, high + 1):
+                for i in range(len(tokens) - n + 1):
+                    h = zlib.crc32(" ".join(tokens[i : i + n]).encode())
+                    sign = 1.0 if h & 0x80000000 else -1.0
+                    features[row, h % self.n_features] += sign
+        norms = np.linalg.norm(features, axis=1, keepdims=True)
+        np.divide(features, norms, out=features, where=norms > 0)
+        return features
+
+
+class NeuralPriceModel:
+    """Memory-mapped quantized MLP price model.
+
+    Hidden layers use ReLU; the final layer is linear and its output is
+    mapped back to dollars with the target transform from the metadata
+    (``"log1p"`` or ``"identity"``).
+
+    Args:
+        path: Weight file written by :func:`export_weights`.
+        keep_dequantized: Keep float32 copies of the weights after the first
+            batch. Faster per batch, but gives up the shared read-only pages.
+    """
+
+    def __init__(self, path: str | os.PathLike[str], *, keep_dequantized: bool = False) -> None:
+        self.path = Path(path)
+        snapshot = Snapshot(self.path, magic=MAGIC, version=FORMAT_VERSION, kind="weight file")
+        self._mmap = snapshot.mmap
+        header = snapshot.header
+        self._tensors = {name: snapshot.section(name) for name in header["sections"]}
+        self.dtype: WeightDType = header["dtype"]
+        self.num_layers: int = header["num_layers"]
+        self.metadata: dict[str, Any] = header["metadata"]
+        self.keep_dequantized = keep_dequantized
+        self._dequantized: dict[int, FloatArray] = {}
+
+        n_features = self.metadata.get("n_features")
+        self.featurizer = (
+            HashingFeaturizer(
+                n_features, ngram_range=tuple(self.metadata.get("ngram_range", (1, 2)))
+            )
+            if n_features
+            else None
+        )
+
+    def _weight(self, index: int) -> FloatArray:
+        cached = self._dequantized.get(index)
+        if cached is not None:
+            return cached
+        raw = self._tensors[f"layers.{index}.weight"]
+        weight = raw.astype(np.float32)
+        if self.dtype == "int8":
+            weight *= self._tensors[f"layers.{index}.scale"][:, None]
+        if self.keep_dequantized:
+            self._dequantized[index] = weight
+        return weight
+
+    def predict(self, features: npt.ArrayLike) -> FloatArray:
+        """Run the forward pass on a ``(batch, in_features)`` matrix."""
+        x = np.asarray(features, dtype=np.float32)
+        for index in range(self.num_layers):
+            x = x @ self._weight(index).T + self._tensors[f"layers.{index}.bias"]
+            if index < self.num_layers - 1:
+                np.maximum(x, 0.0, out=x)
+        out: FloatArray = x[:, 0] if x.ndim == 2 else x
+        if self.metadata.get("target") == "log1p":
+            out = np.expm1(out)
+        return out
+
+    async def estimate_batch(self, deals: Sequence[Deal]) -> list[float | None]:
+        """Price deals from their title and description (``PriceModel`` protocol)."""
+        if self.featurizer is None:
+            raise ValueError("weight file metadata has no featurizer settings")
+        texts = [" ".join(filter(None, [deal.title, deal.description])) for deal in deals]
+        return [float(value) for value in self.predict(self.featurizer.transform(texts))]
@@ -0,0 +1,33 @@
+"""Notification delivery: channels, rate limits, digests and the dispatcher."""
+
+from dealfinder.notify.channels import (
+    Channel,
+    DeliveryError,
+    FakeChannel,
+    Notification,
+    PushoverChannel,
+    SESChannel,
+    SlackChannel,
+    SNSChannel,
+)
+from dealfinder.notify.digest import DigestCoalescer, render_digest
+from dealfinder.notify.dispatcher import ChannelStats, Dispatcher
+from dealfinder.notify.ratelimit import TokenBucket
+from dealfinder.notify.timerwheel import TimerWheel
+
+__all__ = [
+    "Channel",
+    "ChannelStats",
+    "DeliveryError",
+    "DigestCoalescer",
+    "Dispatcher",
+    "FakeChannel",
+    "Notification",
+    "PushoverChannel",
+    "SESChannel",
+    "SNSChannel",
+    "SlackChannel",
+    "TimerWheel",
+    "TokenBucket",
+    "render_digest",
+]
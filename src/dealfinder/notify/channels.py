@@ -0,0 +1,375 @@
+"""Outbound notification channels.
+
+Each channel sends a batch of notifications in as few requests as its API
+allows and reports one outcome per notification: ``None`` on success or a
+:class:`DeliveryError` saying whether a retry could help. SNS topic
+broadcasts and SES use their bulk APIs (``PublishBatch`` with 10 entries,
+SESv2 ``SendBulkEmail`` with 50 destinations) through a shared boto3 client whose connection pool
+is sized for the dispatcher's workers; direct SMS, Pushover and Slack,
+which have no bulk endpoint, send a batch concurrently.
+:class:`FakeChannel` stands in for all of them in throughput tests.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+from abc import ABC, abstractmethod
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass, field
+from typing import Any, Protocol
+
+import boto3
+import httpx
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+# SESv2 BulkEmailEntryResult statuses worth retrying.
+_SES_RETRYABLE = frozenset({"TRANSIENT_FAILURE", "ACCOUNT_THROTTLED", "FAILED"})
+
+
+@dataclass(frozen=True, slots=True)
+class Notification:
+    """One message for one user on one channel.
+
+    ``recipient`` is the channel address: an email address, Pushover user
+    key, Slack webhook URL, phone number, or an SNS topic ARN to broadcast to. ``data`` carries template
+    fields and message attributes.
+    """
+
+    id: str
+    user_id: str
+    channel: str
+    recipient: str
+    body: str
+    subject: str | None = None
+    data: Mapping[str, str] = field(default_factory=dict)
+
+
+class DeliveryError(Exception):
+    """A notification was not delivered.
+
+    Args:
+        message: Provider error description.
+        retryable: Whether sending the same notification again may succeed.
+    """
+
+    def __init__(self, message: str, *, retryable: bool = True) -> None:
+        super().__init__(message)
+        self.retryable = retryable
+
+
+Outcome = DeliveryError | None
+
+
+class Channel(Protocol):
+    """A delivery backend that accepts up to ``max_batch_size`` notifications per call."""
+
+    name: str
+    max_batch_size: int
+
+    async def send_batch(self, notifications: Sequence[Notification]) -> Sequence[Outcome]: ...
+
+    async def aclose(self) -> None: ...
+
+
+def _aws_client(service: str, max_pool_connections: int) -> Any:
+    return boto3.client(service, config=Config(max_pool_connections=max_pool_connections))
+
+
+class SNSChannel:
+    """Sends SMS through SNS, to each phone number or broadcast to a topic.
+
+    A notification whose ``recipient`` is a phone number is published
+    straight to it, a batch concurrently; the dispatcher's rate limit for
+    the channel paces these sends. A ``recipient`` that is a topic ARN is a
+    broadcast to every subscriber of that topic, and broadcasts to one
+    topic go out in ``PublishBatch`` calls. Topics are never used to reach
+    one user: that would need a filter policy per recipient, and SNS caps
+    filter policies per topic and account.
+
+    Args:
+        client: Optional boto3 SNS client.
+        max_pool_connections: HTTP connections kept by a created client.
+    """
+
+    name = "sns"
+    max_batch_size = 10
+
+    def __init__(self, *, client: Any = None, max_pool_connections: int = 10):
+        self._client = client if client is not None else _aws_client("sns", max_pool_connections)
+
+    @staticmethod
+    def is_topic(recipient: str) -> bool:
+        return recipient.startswith("arn:aws:sns:")
+
+    @staticmethod
+    def _message(notification: Notification) -> dict[str, Any]:
+        attributes = {"user_id": notification.user_id, **notification.data}
+        message: dict[str, Any] = {
+            "Message": notification.body,
+            "MessageAttributes": {
+                key: {"DataType": "String", "StringValue": value}
+                for key, value in attributes.items()
+            },
+        }
+        if notification.subject:
+            message["Subject"] = notification.subject
+        return message
+
+    async def _publish(self, notification: Notification) -> Outcome:
+        try:
+            await asyncio.to_thread(
+                self._client.publish,
+                PhoneNumber=notification.recipient,
+                **self._message(notification),
+            )
+        except ClientError as exc:
+            error = exc.response.get("Error", {})
+            status = exc.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 500)
+            return DeliveryError(
+                error.get("Message") or error.get("Code", "SNS error"),
+                retryable=status == 429 or status >= 500,
+            )
+        return None
+
+    async def _broadcast(
+        self, topic_arn: str, notifications: Sequence[Notification]
+    ) -> list[Outcome]:
+        entries = [
+            {"Id": str(i), **self._message(notification)}
+            for i, notification in enumerate(notifications)
+        ]
+        response = await asyncio.to_thread(
+            self._client.publish_batch, TopicArn=topic_arn, PublishBatchRequestEntries=entries
+        )
+        outcomes: list[Outcome] = [None] * len(notifications)
+        for failed in response.get("Failed", []):
+            outcomes[int(failed["Id"])] = DeliveryError(
+                failed.get("Message") or failed["Code"], retryable=not failed.get("SenderFault")
+            )
+        return outcomes
+
+    async def send_batch(self, notifications: Sequence[Notification]) -> list[Outcome]:
+        topics: dict[str, list[int]] = {}
+        direct: list[int] = []
+        for index, notification in enumerate(notifications):
+            if self.is_topic(notification.recipient):
+                topics.setdefault(notification.recipient, []).append(index)
+            else:
+                direct.append(index)
+        broadcasts, published = await asyncio.gather(
+            asyncio.gather(
+                *(
+                    self._broadcast(arn, [notifications[i] for i in items])
+                    for arn, items in topics.items()
+                )
+            ),
+            asyncio.gather(*(self._publish(notifications[i]) for i in direct)),
+        )
+        outcomes: list[Outcome] = [None] * len(notifications)
+        for items, reply in zip(topics.values(), broadcasts, strict=True):
+            for index, outcome in zip(items, reply, strict=True):
+                outcomes[index] = outcome
+        for index, outcome in zip(direct, published, strict=True):
+            outcomes[index] = outcome
+        return outcomes
+
+    async def aclose(self) -> None:
+        self._client.close()
+
+
+class SESChannel:
+    """Sends templated email with SESv2 ``SendBulkEmail``.
+
+    Each notification's ``subject``, ``body`` and ``data`` become the
+    replacement template data for its destination.
+
+    Args:
+        source: Verified sender address.
+        template: SES template name.
+        client: Optional boto3 ``sesv2`` client.
+        configuration_set: Optional SES configuration set for event tracking.
+        max_pool_connections: HTTP connections kept by a created client.
+    """
+
+    name = "ses"
+    max_batch_size = 50
+
+    def __init__(
+        self,
+        source: str,
+        template: str,
+        *,
+        client: Any = None,
+        configuration_set: str | None = None,
+        max_pool_connections: int = 10,
+    ) -> None:
+        self.source = source
+        self.template = template
+        self.configuration_set = configuration_set
+        self._client = client if client is not None else _aws_client("sesv2", max_pool_connections)
+
+    async def send_batch(self, notifications: Sequence[Notification]) -> list[Outcome]:
+        request: dict[str, Any] = {
+            "FromEmailAddress": self.source,
+            "DefaultContent": {"Template": {"TemplateName": self.template, "TemplateData": "{}"}},
+            "BulkEmailEntries": [
+                {
+                    "Destination": {"ToAddresses": [n.recipient]},
+                    "ReplacementEmailContent": {
+                        "ReplacementTemplate": {
+                            "ReplacementTemplateData": json.dumps(
+                                {"subject": n.subject or "", "body": n.body, **n.data}
+                            )
+                        }
+                    },
+                }
+                for n in notifications
+            ],
+        }
+        if self.configuration_set:
+            request["ConfigurationSetName"] = self.configuration_set
+        response = await asyncio.to_thread(self._client.send_bulk_email, **request)
+        outcomes: list[Outcome] = []
+        for result in response["BulkEmailEntryResults"]:
+            status = result.get("Status", "FAILED")
+            if status == "SUCCESS":
+                outcomes.append(None)
+            else:
+                message = result.get("Error") or status
+                outcomes.append(DeliveryError(message, retryable=status in _SES_RETRYABLE))
+        return outcomes
+
+    async def aclose(self) -> None:
+        self._client.close()
+
+
+class _HTTPChannel(ABC):
+    """Base for webhook-style APIs without a bulk endpoint."""
+
+    name = "http"
+    max_batch_size = 20
+
+    def __init__(
+        self,
+        *,
+        max_connections: int = 20,
+        timeout: float = 10.0,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections, max_keepalive_connections=max_connections
+            ),
+            timeout=timeout,
+            transport=transport,
+        )
+
+    @abstractmethod
+    async def _send(self, notification: Notification) -> httpx.Response:
+        """Make the API request for one notification."""
+
+    async def _deliver(self, notification: Notification) -> Outcome:
+        try:
+            response = await self._send(notification)
+        except httpx.TransportError as exc:
+            return DeliveryError(str(exc) or type(exc).__name__)
+        if response.is_success:
+            return None
+        retryable = response.status_code == 429 or response.status_code >= 500
+        return DeliveryError(f"HTTP {response.status_code}", retryable=retryable)
+
+    async def send_batch(self, notifications: Sequence[Notification]) -> list[Outcome]:
+        return list(await asyncio.gather(*(self._deliver(n) for n in notifications)))
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+class PushoverChannel(_HTTPChannel):
+    """Pushover push notifications; ``recipient`` is the Pushover user key."""
+
+    name = "pushover"
+    url = "https://api.pushover.net/1/messages.json"
+
+    def __init__(self, token: str, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.token = token
+
+    async def _send(self, notification: Notification) -> httpx.Response:
+        form = {"token": self.token, "user": notification.recipient, "message": notification.body}
+        if notification.subject:
+            form["title"] = notification.subject
+        if "url" in notification.data:
+            form["url"] = notification.data["url"]
+        return await self._client.post(self.url, data=form)
+
+
+class SlackChannel(_HTTPChannel):
+    """Slack incoming webhooks; ``recipient`` is the webhook URL."""
+
+    name = "slack"
+
+    async def _send(self, notification: Notification) -> httpx.Response:
+        return await self._client.post(notification.recipient, json={"text": notification.body})
+
+
+class FakeChannel:
+    """In-memory channel for tests and throughput benchmarks.
+
+    Args:
+        name: Channel name notifications are routed by.
+        max_batch_size: Notifications accepted per call.
+        latency: Seconds each call takes.
+        failure_rate: Probability a notification fails retryably.
+        permanent_failure_rate: Probability a notification fails permanently.
+        seed: Seed for failure injection.
+    """
+
+    def __init__(
+        self,
+        name: str = "fake",
+        *,
+        max_batch_size: int = 10,
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        permanent_failure_rate: float = 0.0,
+        seed: int | None = None,
+    ) -> None:
+        self.name = name
+        self.max_batch_size = max_batch_size
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.permanent_failure_rate = permanent_failure_rate
+        self._rng = random.Random(seed)
+        self.delivered: list[Notification] = []
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def send_batch(self, notifications: Sequence[Notification]) -> list[Outcome]:
+        if len(notifications) > self.max_batch_size:
+            raise ValueError(f"batch of {len(notifications)} exceeds {self.max_batch_size}")
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        outcomes: list[Outcome] = []
+        for notification in notifications:
+            roll = self._rng.random()
+            if roll < self.permanent_failure_rate:
+                outcomes.append(DeliveryError("rejected", retryable=False))
+            elif roll < self.permanent_failure_rate + self.failure_rate:
+                outcomes.append(DeliveryError("unavailable"))
+            else:
+                self.delivered.append(notification)
+                outcomes.append(None)
+        return outcomes
+
+    async def aclose(self) -> None:
+        return None
@@ -0,0 +1,136 @@
+"""Per-user coalescing of notification bursts into ranked digests.
+
+During a burst one user can match dozens of opportunities a minute, and
+sending each as its own push burns channel quota and rate limit. The
+:class:`DigestCoalescer` holds a user's notifications on a channel for a
+short window that starts with the first one, then emits a single digest
+of the highest-scoring items. The window never extends, so the first
+match still leaves within the delivery SLA, and a user with only one
+match in the window gets that notification unchanged.
+
+Windows are tracked on a :class:`~dealfinder.notify.timerwheel.TimerWheel`
+rather than one ``asyncio`` timer per user, so holding a notification is
+O(1) with hundreds of thousands of users pending.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+from dealfinder.notify.channels import Notification
+from dealfinder.notify.timerwheel import TimerWheel
+
+DigestKey = tuple[str, str]
+
+
+@dataclass(slots=True)
+class _Held:
+    items: list[tuple[float, Notification]] = field(default_factory=list)
+
+
+class DigestCoalescer:
+    """Holds notifications per user and channel and releases them as digests.
+
+    Args:
+        window: Seconds to hold a user's notifications after the first one.
+        sla: End-to-end delivery target in seconds.
+        delivery_budget: Seconds reserved for everything after the
+            coalescer; ``window`` is capped at ``sla - delivery_budget``.
+        max_items: Items listed in a digest; the rest are counted.
+        tick: Timer wheel resolution, and how often :meth:`run` polls.
+        clock: Monotonic time source, overridable in tests.
+    """
+
+    def __init__(
+        self,
+        *,
+        window: float = 20.0,
+        sla: float = 30.0,
+        delivery_budget: float = 5.0,
+        max_items: int = 5,
+        tick: float = 0.1,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.window = min(window, sla - delivery_budget)
+        if self.window < 0 or max_items < 1:
+            raise ValueError("window must fit within the SLA and max_items be at least 1")
+        self.max_items = max_items
+        self._clock = clock
+        self._wheel: TimerWheel[DigestKey] = TimerWheel(tick, start=clock())
+        self._held: dict[DigestKey, _Held] = {}
+        self.received = 0
+        self.digests = 0
+
+    def __len__(self) -> int:
+        """Users and channels with notifications on hold."""
+        return len(self._held)
+
+    def add(self, notification: Notification, score: float = 0.0) -> None:
+        """Hold a notification; higher ``score`` ranks earlier in the digest."""
+        key = (notification.user_id, notification.channel)
+        held = self._held.get(key)
+        if held is None:
+            held = self._held[key] = _Held()
+            self._wheel.schedule(key, self._clock() + self.window)
+        held.items.append((score, notification))
+        self.received += 1
+
+    def poll(self) -> list[Notification]:
+        """Release every hold whose window has ended."""
+        return [self._release(key) for key in self._wheel.advance(self._clock())]
+
+    def flush(self) -> list[Notification]:
+        """Release every hold now, e.g. on shutdown."""
+        keys = list(self._held)
+        for key in keys:
+            self._wheel.cancel(key)
+        return [self._release(key) for key in keys]
+
+    async def run(self, sink: Callable[[Notification], object]) -> None:
+        """Poll every tick and pass released notifications to ``sink``.
+
+        ``sink`` is typically :meth:`Dispatcher.submit
+        <dealfinder.notify.Dispatcher.submit>`. Runs until cancelled.
+        """
+        while True:
+            for notification in self.poll():
+                sink(notification)
+            await asyncio.sleep(self._wheel.tick)
+
+    def _release(self, key: DigestKey) -> Notification:
+        items = self._held.pop(key).items
+        if len(items) == 1:
+            return items[0][1]
+        self.digests += 1
+        return render_digest(
+            [notification for _, notification in sorted(items, key=lambda item: -item[0])],
+            self.max_items,
+        )
+
+
+def render_digest(ranked: list[Notification], max_items: int) -> Notification:
+    """One notification listing the first ``max_items`` of ``ranked``."""
+    first = ranked[0]
+    shown, hidden = ranked[:max_items], len(ranked) - max_items
+    lines = [f"• {notification.body}" for notification in shown]
+    if hidden > 0:
+        lines.append(f"+{hidden} more")
+    ids = sorted(notification.id for notification in ranked)
+    digest_id = hashlib.sha256("\n".join(ids).encode()).hexdigest()[:16]
+    deal_ids = [n.data["deal_id"] for n in ranked if "deal_id" in n.data]
+    return Notification(
+        id=f"digest:{first.user_id}:{first.channel}:{digest_id}",
+        user_id=first.user_id,
+        channel=first.channel,
+        recipient=first.recipient,
+        body="\n".join(lines),
+        subject=f"{len(ranked)} new deals",
+        data={
+            "deal_ids": ",".join(deal_ids),
+            **({"url": first.data["url"]} if "url" in first.data else {}),
+        },
+    )
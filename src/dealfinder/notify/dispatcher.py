@@ -0,0 +1,241 @@
+"""Asyncio notification dispatcher with batching, rate limits and ordered retries.
+
+Notifications are queued per channel in per-user FIFO lanes. A pool of
+workers per channel repeatedly takes the head of up to ``max_batch_size``
+ready lanes, waits for that many tokens from the channel's bucket and
+sends them in one channel call. A lane has at most one notification in
+flight, so a user's messages on a channel are delivered in submission order
+even across retries: a retryable failure keeps the notification at the
+head of its lane and parks the lane for a jittered exponential backoff
+while other users' lanes keep flowing.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from collections.abc import Callable, Iterable, Mapping
+from dataclasses import dataclass, field
+from types import TracebackType
+from typing import Self
+
+from dealfinder.metrics import LatencyHistogram
+from dealfinder.notify.channels import Channel, DeliveryError, Notification
+from dealfinder.notify.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class ChannelStats:
+    """Delivery counters and submit-to-delivery latency for one channel."""
+
+    sent: int = 0
+    failed: int = 0
+    retries: int = 0
+    batches: int = 0
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+
+@dataclass(slots=True)
+class _Pending:
+    notification: Notification
+    submitted: float
+    attempts: int = 0
+
+
+@dataclass(slots=True)
+class _ChannelState:
+    channel: Channel
+    bucket: TokenBucket | None
+    batch_size: int
+    stats: ChannelStats = field(default_factory=ChannelStats)
+    lanes: dict[str, deque[_Pending]] = field(default_factory=dict)
+    ready: deque[str] = field(default_factory=deque)
+    wake: asyncio.Event = field(default_factory=asyncio.Event)
+    workers: list[asyncio.Task[None]] = field(default_factory=list)
+
+
+class Dispatcher:
+    """Delivers notifications across channels with per-user ordering.
+
+    Args:
+        channels: Channels keyed by the name notifications route to.
+        rate_limits: Optional ``(per second, burst)`` limits per channel.
+        workers: Concurrent channel calls per channel.
+        linger: Seconds a worker waits for a partial batch to fill.
+        max_attempts: Sends per notification before it is dead-lettered.
+        base_delay: First retry backoff ceiling, in seconds.
+        max_delay: Largest retry backoff, in seconds.
+        seed: Seed for retry jitter.
+        clock: Monotonic time source for latency measurement.
+    """
+
+    def __init__(
+        self,
+        channels: Mapping[str, Channel],
+        *,
+        rate_limits: Mapping[str, tuple[float, int]] | None = None,
+        workers: int = 4,
+        linger: float = 0.005,
+        max_attempts: int = 5,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        seed: int | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if workers < 1 or max_attempts < 1:
+            raise ValueError("workers and max_attempts must be at least 1")
+        rate_limits = rate_limits or {}
+        self._states: dict[str, _ChannelState] = {}
+        for name, channel in channels.items():
+            bucket = None
+            batch_size = channel.max_batch_size
+            if name in rate_limits:
+                rate, burst = rate_limits[name]
+                bucket = TokenBucket(rate, burst)
+                batch_size = min(batch_size, burst)
+            self._states[name] = _ChannelState(channel, bucket, batch_size)
+        self.workers = workers
+        self.linger = linger
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._rng = random.Random(seed)
+        self._clock = clock
+        self._outstanding = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._started = False
+        self.dead_letters: list[tuple[Notification, DeliveryError]] = []
+
+    @property
+    def stats(self) -> dict[str, ChannelStats]:
+        return {name: state.stats for name, state in self._states.items()}
+
+    @property
+    def outstanding(self) -> int:
+        """Notifications submitted but not yet delivered or dead-lettered."""
+        return self._outstanding
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        await self.aclose(drain=exc_type is None)
+
+    def _start(self) -> None:
+        for state in self._states.values():
+            state.workers = [asyncio.create_task(self._work(state)) for _ in range(self.workers)]
+        self._started = True
+
+    def submit(self, notification: Notification) -> None:
+        """Queue a notification behind the user's earlier ones on its channel."""
+        state = self._states.get(notification.channel)
+        if state is None:
+            raise KeyError(f"unknown channel {notification.channel!r}")
+        if not self._started:
+            self._start()
+        lane = state.lanes.get(notification.user_id)
+        if lane is None:
+            lane = state.lanes[notification.user_id] = deque()
+            state.ready.append(notification.user_id)
+            state.wake.set()
+        lane.append(_Pending(notification, self._clock()))
+        self._outstanding += 1
+        self._idle.clear()
+
+    def submit_many(self, notifications: Iterable[Notification]) -> None:
+        for notification in notifications:
+            self.submit(notification)
+
+    async def drain(self) -> None:
+        """Wait until every submitted notification is delivered or dead-lettered."""
+        await self._idle.wait()
+
+    async def aclose(self, *, drain: bool = True) -> None:
+        """Optionally drain, then stop workers and close every channel."""
+        if drain:
+            await self.drain()
+        workers = [task for state in self._states.values() for task in state.workers]
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for state in self._states.values():
+            await state.channel.aclose()
+
+    async def _work(self, state: _ChannelState) -> None:
+        while True:
+            while not state.ready:
+                state.wake.clear()
+                await state.wake.wait()
+            if len(state.ready) < state.batch_size and self.linger > 0:
+                await asyncio.sleep(self.linger)
+            batch: list[tuple[str, _Pending]] = []
+            while state.ready and len(batch) < state.batch_size:
+                user_id = state.ready.popleft()
+                batch.append((user_id, state.lanes[user_id][0]))
+            if not batch:
+                continue
+            if state.bucket is not None:
+                await state.bucket.acquire(len(batch))
+            notifications = [pending.notification for _, pending in batch]
+            try:
+                outcomes = list(await state.channel.send_batch(notifications))
+                if len(outcomes) != len(batch):
+                    raise DeliveryError(f"{len(outcomes)} outcomes for {len(batch)} notifications")
+            except Exception as exc:  # noqa: BLE001 - every notification in the batch is retried
+                error = exc if isinstance(exc, DeliveryError) else DeliveryError(repr(exc))
+                outcomes = [error] * len(batch)
+            state.stats.batches += 1
+            for (user_id, pending), outcome in zip(batch, outcomes, strict=True):
+                self._settle(state, user_id, pending, outcome)
+
+    def _settle(
+        self, state: _ChannelState, user_id: str, pending: _Pending, outcome: DeliveryError | None
+    ) -> None:
+        pending.attempts += 1
+        if outcome is not None and outcome.retryable and pending.attempts < self.max_attempts:
+            state.stats.retries += 1
+            ceiling = min(self.max_delay, self.base_delay * 2 ** (pending.attempts - 1))
+            asyncio.get_running_loop().call_later(
+                self._rng.uniform(0, ceiling), self._release, state, user_id
+            )
+            return
+
+        state.lanes[user_id].popleft()
+        if outcome is None:
+            state.stats.sent += 1
+            state.stats.latency.record(self._clock() - pending.submitted)
+        else:
+            state.stats.failed += 1
+            self.dead_letters.append((pending.notification, outcome))
+            logger.warning(
+                "Notification dead-lettered",
+                extra={
+                    "notification_id": pending.notification.id,
+                    "channel": state.channel.name,
+                    "attempts": pending.attempts,
+                    "error": str(outcome),
+                },
+            )
+        self._release(state, user_id)
+        self._outstanding -= 1
+        if self._outstanding == 0:
+            self._idle.set()
+
+    def _release(self, state: _ChannelState, user_id: str) -> None:
+        """Make a lane ready for its next head, or drop it when empty."""
+        if state.lanes[user_id]:
+            state.ready.append(user_id)
+            state.wake.set()
+        else:
+            del state.lanes[user_id]
@@ -0,0 +1,50 @@
+"""Token-bucket rate limiting for outbound channels."""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections.abc import Callable
+
+
+class TokenBucket:
+    """Async token bucket: ``rate`` tokens per second, holding at most ``burst``.
+
+    Args:
+        rate: Tokens added per second.
+        burst: Bucket capacity, and the largest single acquisition.
+        clock: Monotonic time source, overridable in tests.
+    """
+
+    def __init__(
+        self, rate: float, burst: int, *, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: int = 1) -> bool:
+        """Take ``tokens`` if available now."""
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens: int = 1) -> None:
+        """Wait until ``tokens`` are available and take them, first come first served."""
+        if tokens > self.burst:
+            raise ValueError(f"cannot acquire {tokens} tokens from a bucket of {self.burst}")
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
@@ -0,0 +1,105 @@
+"""Hierarchical timer wheel for very many short-lived deadlines.
+
+One ``asyncio`` timer per pending item costs a heap entry and a callback
+each, and rescheduling is O(log n). A timer wheel quantizes time into
+``tick``-second slots instead: level 0 has one bucket per tick, and each
+higher level has one bucket per full rotation of the level below. A timer
+goes into the coarsest level whose span still covers its delay and is
+cascaded down into finer buckets as the wheel turns. Scheduling and
+cancelling are O(1) dict operations, and advancing costs O(1) per tick plus
+the timers that expire or cascade.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Hashable
+
+
+class TimerWheel[K: Hashable]:
+    """Deadlines keyed by ``K``, expired in batches by :meth:`advance`.
+
+    Deadlines are rounded up to whole ticks, so a timer fires at most one
+    tick late and never early.
+
+    Args:
+        tick: Seconds per level-0 slot.
+        slots: Buckets per level; a power of two.
+        levels: Number of levels. The wheel spans ``tick * slots**levels``
+            seconds.
+        start: Time the wheel starts at.
+    """
+
+    def __init__(
+        self, tick: float = 0.1, slots: int = 64, levels: int = 4, *, start: float = 0.0
+    ) -> None:
+        if tick <= 0 or levels < 1 or slots < 2 or slots & (slots - 1):
+            raise ValueError("tick must be positive, slots a power of two and levels at least 1")
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self._bits = slots.bit_length() - 1
+        self._mask = slots - 1
+        self._buckets: list[list[dict[K, int]]] = [
+            [{} for _ in range(slots)] for _ in range(levels)
+        ]
+        self._where: dict[K, dict[K, int]] = {}
+        self._now = int(start // tick)
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._where
+
+    @property
+    def horizon(self) -> float:
+        """Longest delay the wheel can hold, in seconds."""
+        return self.tick * ((1 << (self._bits * self.levels)) - 1)
+
+    def _place(self, key: K, due: int) -> None:
+        delay = due - self._now
+        for level in range(self.levels):
+            if delay < 1 << (self._bits * (level + 1)):
+                bucket = self._buckets[level][(due >> (self._bits * level)) & self._mask]
+                bucket[key] = due
+                self._where[key] = bucket
+                return
+        raise ValueError(f"deadline is beyond the wheel horizon of {self.horizon}s")
+
+    def schedule(self, key: K, deadline: float) -> None:
+        """Fire ``key`` at ``deadline``, replacing any timer it already has."""
+        self.cancel(key)
+        self._place(key, max(-int(-deadline // self.tick), self._now + 1))
+
+    def cancel(self, key: K) -> bool:
+        """Remove ``key``'s timer. Returns ``False`` if it had none."""
+        bucket = self._where.pop(key, None)
+        if bucket is None:
+            return False
+        del bucket[key]
+        return True
+
+    def advance(self, now: float) -> list[K]:
+        """Turn the wheel to ``now`` and return the keys that expired, in tick order."""
+        target = int(now // self.tick)
+        expired: list[K] = []
+        while self._now < target:
+            if not self._where:
+                self._now = target
+                break
+            self._now += 1
+            for level in range(1, self.levels):
+                if self._now & ((1 << (self._bits * level)) - 1):
+                    break
+                index = (self._now >> (self._bits * level)) & self._mask
+                bucket = self._buckets[level][index]
+                self._buckets[level][index] = {}
+                for key, due in bucket.items():
+                    self._place(key, due)
+            bucket = self._buckets[0][self._now & self._mask]
+            if bucket:
+                self._buckets[0][self._now & self._mask] = {}
+                for key in bucket:
+                    del self._where[key]
+                expired.extend(bucket)
+        return expired
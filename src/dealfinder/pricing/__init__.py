@@ -0,0 +1,41 @@
+"""EnsembleAgent pricing: batched model calls, ensemble weighting and caching."""
+
+from dealfinder.pricing.cache import (
+    CachedEnsembleAgent,
+    CachedEstimate,
+    PriceCache,
+    product_key,
+)
+from dealfinder.pricing.ensemble import (
+    DEFAULT_THRESHOLD,
+    DEFAULT_WEIGHTS,
+    BatchPricing,
+    EnsembleAgent,
+    PriceModel,
+    combine_estimates,
+)
+from dealfinder.pricing.prompt_cache import (
+    CachedPrice,
+    PromptCache,
+    PromptCacheStats,
+    SemanticCachedModel,
+    normalize_prompt,
+)
+
+__all__ = [
+    "DEFAULT_THRESHOLD",
+    "DEFAULT_WEIGHTS",
+    "BatchPricing",
+    "CachedEnsembleAgent",
+    "CachedEstimate",
+    "CachedPrice",
+    "EnsembleAgent",
+    "PriceCache",
+    "PriceModel",
+    "PromptCache",
+    "PromptCacheStats",
+    "SemanticCachedModel",
+    "combine_estimates",
+    "normalize_prompt",
+    "product_key",
+]
@@ -0,0 +1,304 @@
+"""Price-estimate cache keyed on canonical product identity.
+
+The same product (same ASIN, UPC/EAN or model number) comes through the
+feeds many times a day from different sources and retailers. Ensemble
+estimates are product-level, so they are cached under a canonical product
+key and only the discount is recomputed against each deal's own price.
+
+Lookups go through an in-process LRU and then a shared Redis tier. Redis
+entries live longer for products whose listed price is stable and shorter
+for volatile ones, and keys are namespaced by model version so a retrained
+ensemble never serves estimates from its predecessor.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import re
+import statistics
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Mapping, Sequence
+from dataclasses import dataclass
+from typing import cast
+
+import numpy as np
+from redis.asyncio import Redis
+
+from dealfinder.dedup.minhash import normalize_title
+from dealfinder.pricing.ensemble import BatchPricing, EnsembleAgent, combine_estimates
+from dealfinder.schemas import Deal
+
+logger = logging.getLogger(__name__)
+
+_ASIN = re.compile(r"(?:/dp/|/gp/product/|\basin[=:\s]+|\b)(B0[A-Z0-9]{8})\b", re.IGNORECASE)
+_GTIN = re.compile(r"\b(\d{12,14})\b")
+_MODEL = re.compile(r"\b(?=[A-Z0-9-]*\d)(?=[A-Z0-9-]*[A-Z])[A-Z0-9][A-Z0-9-]{3,}\b")
+_SPEC = re.compile(r"^\d+(?:GB|TB|MB|MM|CM|HZ|MHZ|GHZ|W|V|MAH|IN|K|P|OZ|LB|LBS|QT|PK|PC|PCS)$")
+_PRICE = re.compile(r"\$\s?\d[\d,]*(?:\.\d+)?|\d+(?:\.\d+)?\s?%|\b\d+(?:\.\d{2})\b")
+
+
+def _valid_gtin(digits: str) -> bool:
+    """Check the GS1 mod-10 check digit of a UPC-A/EAN-13/GTIN-14."""
+    body, check = digits[:-1], int(digits[-1])
+    total = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(body)))
+    return (10 - total % 10) % 10 == check
+
+
+def product_key(deal: Deal) -> str:
+    """Return a canonical identity for the product a deal is selling.
+
+    Extracted identifiers are preferred in order of reliability: Amazon
+    ASIN, then a checksum-valid UPC/EAN, then a brand-qualified model
+    number. Deals without any fall back to a hash of the normalized title
+    with prices, percentages and word order removed.
+    """
+    text = " ".join(filter(None, [deal.title, deal.description or ""]))
+    for source in filter(None, [deal.url, text]):
+        asin = _ASIN.search(source)
+        if asin:
+            return f"asin:{asin.group(1).upper()}"
+    for match in _GTIN.finditer(text):
+        digits = match.group(1).zfill(14)
+        if _valid_gtin(digits):
+            return f"gtin:{digits}"
+    for token in _MODEL.findall(deal.title):
+        if not _SPEC.match(token):
+            brand = deal.title.split()[0].lower()
+            return f"model:{brand}:{token.replace('-', '').lower()}"
+    words = sorted(set(normalize_title(_PRICE.sub(" ", deal.title)).split()))
+    digest = hashlib.sha1(" ".join(words).encode(), usedforsecurity=False).hexdigest()[:16]
+    return f"title:{digest}"
+
+
+@dataclass(frozen=True, slots=True)
+class CachedEstimate:
+    """Per-model estimates for a product, as cached."""
+
+    model_estimates: dict[str, float | None]
+    cached_at: float
+
+    def to_json(self) -> str:
+        return json.dumps({"model_estimates": self.model_estimates, "cached_at": self.cached_at})
+
+    @classmethod
+    def from_json(cls, raw: str | bytes) -> CachedEstimate:
+        data = json.loads(raw)
+        return cls(model_estimates=data["model_estimates"], cached_at=data["cached_at"])
+
+
+class PriceCache:
+    """Two-tier (process LRU + Redis) cache of ensemble estimates by product.
+
+    Args:
+        redis: Async Redis client.
+        model_version: Version of the deployed pricing models; part of every
+            Redis key so a rollout never reads stale estimates.
+        l1_size: Entries kept in the in-process LRU.
+        l1_ttl: Seconds an LRU entry is trusted before Redis is consulted.
+        min_ttl: Redis TTL for the most volatile products.
+        max_ttl: Redis TTL for products whose price never moves.
+        default_ttl: Redis TTL while too little price history is known.
+        volatility_scale: How quickly TTL shrinks with the coefficient of
+            variation of recent listed prices.
+        history: Listed prices kept per product to measure volatility.
+        clock: Source of the current time, overridable in tests.
+    """
+
+    prefix = "pricing"
+
+    def __init__(
+        self,
+        redis: Redis,
+        *,
+        model_version: str,
+        l1_size: int = 10_000,
+        l1_ttl: float = 300.0,
+        min_ttl: int = 15 * 60,
+        max_ttl: int = 24 * 3600,
+        default_ttl: int = 6 * 3600,
+        volatility_scale: float = 20.0,
+        history: int = 20,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self._redis = redis
+        self.model_version = model_version
+        self.l1_size = l1_size
+        self.l1_ttl = l1_ttl
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.default_ttl = default_ttl
+        self.volatility_scale = volatility_scale
+        self.history = history
+        self._clock = clock
+        self._l1: OrderedDict[str, tuple[float, CachedEstimate]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _estimate_key(self, product: str) -> str:
+        return f"{self.prefix}:estimate:{self.model_version}:{product}"
+
+    def _history_key(self, product: str) -> str:
+        return f"{self.prefix}:prices:{product}"
+
+    def ttl_for(self, prices: Sequence[float]) -> int:
+        """Redis TTL for a product given its recent listed prices."""
+        if len(prices) < 3:
+            return self.default_ttl
+        mean = statistics.fmean(prices)
+        cv = statistics.pstdev(prices) / mean if mean > 0 else 1.0
+        ttl = self.max_ttl / (1 + self.volatility_scale * cv)
+        return int(min(self.max_ttl, max(self.min_ttl, ttl)))
+
+    def _l1_get(self, product: str, now: float) -> CachedEstimate | None:
+        item = self._l1.get(product)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= now:
+            del self._l1[product]
+            return None
+        self._l1.move_to_end(product)
+        return value
+
+    def _l1_put(self, product: str, value: CachedEstimate, ttl: float, now: float) -> None:
+        self._l1[product] = (now + min(ttl, self.l1_ttl), value)
+        self._l1.move_to_end(product)
+        while len(self._l1) > self.l1_size:
+            self._l1.popitem(last=False)
+
+    async def get_many(self, products: Sequence[str]) -> dict[str, CachedEstimate]:
+        """Look up products in the LRU, then fetch the rest with one ``MGET``."""
+        now = self._clock()
+        found: dict[str, CachedEstimate] = {}
+        remote: list[str] = []
+        for product in dict.fromkeys(products):
+            value = self._l1_get(product, now)
+            if value is not None:
+                found[product] = value
+            else:
+                remote.append(product)
+        if remote:
+            raw = await self._redis.mget([self._estimate_key(p) for p in remote])
+            for product, payload in zip(remote, raw, strict=True):
+                if payload is not None:
+                    value = CachedEstimate.from_json(payload)
+                    found[product] = value
+                    self._l1_put(product, value, self.l1_ttl, now)
+        self.hits += len(found)
+        self.misses += len(set(products)) - len(found)
+        return found
+
+    async def set_many(
+        self,
+        estimates: Mapping[str, Mapping[str, float | None]],
+        prices: Mapping[str, float],
+    ) -> None:
+        """Cache fresh estimates, recording each product's listed price.
+
+        The price history is appended first so the TTL of the new entry
+        reflects the latest observation.
+        """
+        if not estimates:
+            return
+        now = self._clock()
+        products = list(estimates)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for product in products:
+                key = self._history_key(product)
+                pipe.lpush(key, prices[product])
+                pipe.ltrim(key, 0, self.history - 1)
+                pipe.expire(key, 7 * 24 * 3600)
+                pipe.lrange(key, 0, -1)
+            replies = await pipe.execute()
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for index, product in enumerate(products):
+                history = [float(p) for p in cast(list[bytes], replies[index * 4 + 3])]
+                ttl = self.ttl_for(history)
+                value = CachedEstimate(dict(estimates[product]), now)
+                pipe.set(self._estimate_key(product), value.to_json(), ex=ttl)
+                self._l1_put(product, value, ttl, now)
+            await pipe.execute()
+
+    async def invalidate(self, products: Sequence[str]) -> None:
+        """Drop cached estimates for specific products."""
+        for product in products:
+            self._l1.pop(product, None)
+        if products:
+            await self._redis.delete(*(self._estimate_key(p) for p in products))
+
+    def rollout(self, model_version: str) -> None:
+        """Switch to a newly deployed model version.
+
+        Subsequent reads and writes use the new version's key namespace and
+        the LRU is cleared; the previous version's Redis entries simply age
+        out through their TTL.
+        """
+        if model_version != self.model_version:
+            logger.info(
+                "Price cache model version changed",
+                extra={"previous": self.model_version, "current": model_version},
+            )
+            self.model_version = model_version
+            self._l1.clear()
+
+
+class CachedEnsembleAgent:
+    """Wrap an :class:`EnsembleAgent` so cached products skip the model calls.
+
+    Deals are grouped by :func:`product_key`; only products missing from the
+    cache are sent to the models, one representative deal per product.
+    Partial ensemble results (some model missed its deadline) are returned
+    but not cached.
+    """
+
+    def __init__(self, agent: EnsembleAgent, cache: PriceCache) -> None:
+        self.agent = agent
+        self.cache = cache
+
+    async def price_batch(self, deals: Sequence[Deal]) -> BatchPricing:
+        deals = list(deals)
+        keys = [product_key(deal) for deal in deals]
+        cached = await self.cache.get_many(keys)
+
+        representatives: dict[str, Deal] = {}
+        for key, deal in zip(keys, deals, strict=True):
+            if key not in cached:
+                representatives.setdefault(key, deal)
+        fresh = await self.agent.price_batch(list(representatives.values()))
+
+        names = self.agent.names
+        by_product: dict[str, list[float]] = {
+            key: [np.nan if (v := c.model_estimates.get(n)) is None else v for n in names]
+            for key, c in cached.items()
+        }
+        to_cache: dict[str, dict[str, float | None]] = {}
+        for column, key in enumerate(representatives):
+            row = fresh.model_estimates[:, column]
+            by_product[key] = row.tolist()
+            if not fresh.partial[column]:
+                to_cache[key] = {
+                    name: float(value) for name, value in zip(names, row.tolist(), strict=True)
+                }
+        await self.cache.set_many(to_cache, {key: representatives[key].price for key in to_cache})
+
+        model_estimates = (
+            np.array([by_product[key] for key in keys], dtype=np.float64)
+            .reshape(len(deals), len(names))
+            .T
+        )
+        prices = np.fromiter((deal.price for deal in deals), dtype=np.float64, count=len(deals))
+        estimates, discounts, is_opportunity = combine_estimates(
+            model_estimates, self.agent.weights, prices, self.agent.threshold
+        )
+        return BatchPricing(
+            deals=deals,
+            models=names,
+            model_estimates=model_estimates,
+            estimates=estimates,
+            discounts=discounts,
+            is_opportunity=is_opportunity,
+            partial=np.isnan(model_estimates).any(axis=0),
+        )
@@ -0,0 +1,297 @@
+"""Batched ensemble pricing for the EnsembleAgent.
+
+Each pricing model is called once per batch instead of once per deal, and
+the weighting, discount and threshold steps (Step Functions steps 7-9) are
+computed over the whole batch as NumPy array operations.
+
+Model calls run concurrently under an optional deadline. A call still
+outstanding after that model's recent p95 latency is hedged with a second
+identical request, and when the deadline passes each deal's ensemble is
+computed from whichever models answered for its chunk, with the deal
+flagged as partial if any were missing.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass
+from typing import Protocol
+
+import numpy as np
+import numpy.typing as npt
+
+from dealfinder.metrics import LatencyHistogram
+from dealfinder.schemas import Deal, PricedDeal
+
+logger = logging.getLogger(__name__)
+
+FloatArray = npt.NDArray[np.float64]
+BoolArray = npt.NDArray[np.bool_]
+
+DEFAULT_WEIGHTS: Mapping[str, float] = {"frontier": 0.8, "specialist": 0.1, "neural": 0.1}
+DEFAULT_THRESHOLD = 50.0
+
+
+class PriceModel(Protocol):
+    """A pricing model that estimates a batch of deals in one call.
+
+    Implementations return one estimate per deal, in order, using ``None``
+    (or NaN) for deals they could not price.
+    """
+
+    async def estimate_batch(self, deals: Sequence[Deal]) -> Sequence[float | None]: ...
+
+
+@dataclass(slots=True)
+class BatchPricing:
+    """Ensemble output for a batch, column-aligned with ``deals``.
+
+    ``model_estimates`` has one row per model in ``models`` order; missing
+    estimates are NaN. ``estimates`` and ``discounts`` are NaN for deals no
+    model could price, and ``partial`` marks deals priced without every
+    model.
+    """
+
+    deals: Sequence[Deal]
+    models: tuple[str, ...]
+    model_estimates: FloatArray
+    estimates: FloatArray
+    discounts: FloatArray
+    is_opportunity: BoolArray
+    partial: BoolArray
+
+    def __len__(self) -> int:
+        return len(self.deals)
+
+    def results(self) -> list[PricedDeal]:
+        """Convert to per-deal :class:`~dealfinder.schemas.PricedDeal` records."""
+        rows = self.model_estimates.T.tolist()
+        return [
+            PricedDeal(
+                deal=deal,
+                estimate=_optional(estimate),
+                discount=_optional(discount),
+                is_opportunity=bool(flag),
+                partial=bool(partial),
+                model_estimates={
+                    name: _optional(value) for name, value in zip(self.models, row, strict=True)
+                },
+            )
+            for deal, estimate, discount, flag, partial, row in zip(
+                self.deals,
+                self.estimates.tolist(),
+                self.discounts.tolist(),
+                self.is_opportunity.tolist(),
+                self.partial.tolist(),
+                rows,
+                strict=True,
+            )
+        ]
+
+    def opportunities(self) -> list[PricedDeal]:
+        return [result for result in self.results() if result.is_opportunity]
+
+
+def _optional(value: float) -> float | None:
+    return None if np.isnan(value) else float(value)
+
+
+def combine_estimates(
+    model_estimates: FloatArray,
+    weights: FloatArray,
+    prices: FloatArray,
+    threshold: float,
+) -> tuple[FloatArray, FloatArray, BoolArray]:
+    """Weight per-model estimates and compute discounts for a batch.
+
+    Args:
+        model_estimates: ``(models, deals)`` matrix, NaN where missing.
+        weights: ``(models,)`` ensemble weights.
+        prices: ``(deals,)`` listed deal prices.
+        threshold: Minimum discount (estimate minus price) for an opportunity.
+
+    Returns:
+        ``(estimates, discounts, is_opportunity)``. Weights are renormalized
+        per deal over the models that answered, so a missing estimate does
+        not drag the ensemble towards zero.
+    """
+    present = ~np.isnan(model_estimates)
+    effective = weights[:, np.newaxis] * present
+    total = effective.sum(axis=0)
+    weighted = np.where(present, model_estimates, 0.0) * effective
+    with np.errstate(invalid="ignore", divide="ignore"):
+        estimates = weighted.sum(axis=0) / total
+    estimates[total == 0] = np.nan
+    discounts = estimates - prices
+    is_opportunity = np.nan_to_num(discounts, nan=-np.inf) > threshold
+    return estimates, discounts, is_opportunity
+
+
+class EnsembleAgent:
+    """Price deals with a weighted ensemble of models, a batch at a time.
+
+    Args:
+        models: Pricing models keyed by name (``frontier``, ``specialist``,
+            ``neural``).
+        weights: Ensemble weight per model name; defaults to 0.8/0.1/0.1.
+        threshold: Dollar discount above which a deal is an opportunity.
+        max_batch_size: Largest batch sent to a model in one call; bigger
+            inputs are split and the chunks sent concurrently.
+        deadline: Seconds to wait for model replies before pricing from the
+            models that answered. ``None`` waits for every model.
+        hedge_quantile: Latency quantile after which an outstanding call is
+            hedged with a duplicate request. ``None`` disables hedging.
+        min_hedge_samples: Observations a model needs before it is hedged.
+    """
+
+    def __init__(
+        self,
+        models: Mapping[str, PriceModel],
+        *,
+        weights: Mapping[str, float] = DEFAULT_WEIGHTS,
+        threshold: float = DEFAULT_THRESHOLD,
+        max_batch_size: int = 64,
+        deadline: float | None = None,
+        hedge_quantile: float | None = 0.95,
+        min_hedge_samples: int = 20,
+    ) -> None:
+        missing = set(models) - set(weights)
+        if missing:
+            raise ValueError(f"no ensemble weight for models: {sorted(missing)}")
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.models = dict(models)
+        self.names = tuple(self.models)
+        self.weights = np.array([weights[name] for name in self.names], dtype=np.float64)
+        self.threshold = threshold
+        self.max_batch_size = max_batch_size
+        self.deadline = deadline
+        self.hedge_quantile = hedge_quantile
+        self.min_hedge_samples = min_hedge_samples
+        self.latency = {name: LatencyHistogram() for name in self.names}
+        self.hedges_sent = dict.fromkeys(self.names, 0)
+
+    def hedge_delay(self, name: str) -> float | None:
+        """Seconds to wait before hedging a call to ``name``, if hedging applies."""
+        histogram = self.latency[name]
+        if self.hedge_quantile is None or histogram.count < self.min_hedge_samples:
+            return None
+        return histogram.quantile(self.hedge_quantile)
+
+    async def _timed(self, name: str, chunk: Sequence[Deal]) -> Sequence[float | None]:
+        started = time.perf_counter()
+        try:
+            reply = await self.models[name].estimate_batch(chunk)
+        except asyncio.CancelledError:
+            # A call cut off by a winning hedge or the deadline took at least
+            # this long; leaving it out would drag the hedge quantile down.
+            self.latency[name].record(time.perf_counter() - started)
+            raise
+        self.latency[name].record(time.perf_counter() - started)
+        return reply
+
+    async def _call(self, name: str, chunk: Sequence[Deal]) -> Sequence[float | None]:
+        """Call one model, hedging with a duplicate request if it runs slow.
+
+        The first successful reply wins and the other attempt is cancelled.
+        A primary that fails before the hedge fires is retried immediately.
+        """
+        attempts: set[asyncio.Task[Sequence[float | None]]] = {
+            asyncio.ensure_future(self._timed(name, chunk))
+        }
+        hedged = False
+        error: BaseException | None = None
+        try:
+            delay = self.hedge_delay(name)
+            while attempts:
+                timeout = None if hedged or delay is None else delay
+                done, attempts = await asyncio.wait(
+                    attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                if not hedged and (delay is not None or not attempts):
+                    # Either the hedge delay elapsed or the only attempt failed.
+                    hedged = True
+                    self.hedges_sent[name] += 1
+                    attempts.add(asyncio.ensure_future(self._timed(name, chunk)))
+            assert error is not None
+            raise error
+        finally:
+            for task in attempts:
+                task.cancel()
+
+    async def _estimate(self, name: str, chunk: Sequence[Deal]) -> FloatArray:
+        """One model's estimates for a chunk, NaN where it could not price."""
+        estimates = np.full(len(chunk), np.nan)
+        try:
+            reply = await self._call(name, chunk)
+        except Exception as exc:  # noqa: BLE001 - a failed model is treated as missing
+            logger.warning("Pricing model failed", extra={"model": name, "error": str(exc)})
+            return estimates
+        if len(reply) != len(chunk):
+            logger.warning(
+                "Pricing model returned wrong number of estimates",
+                extra={"model": name, "expected": len(chunk), "received": len(reply)},
+            )
+            return estimates
+        estimates[:] = [np.nan if value is None else value for value in reply]
+        return estimates
+
+    async def price_batch(self, deals: Sequence[Deal]) -> BatchPricing:
+        """Price every deal, calling each model once per chunk concurrently.
+
+        Every (model, chunk) call is its own task, so the deadline only
+        drops the chunks still outstanding when it passes. A model that
+        fails, returns a malformed reply or misses the deadline is treated
+        as missing for the deals in that chunk; the remaining weights are
+        renormalized and those deals are flagged ``partial``.
+        """
+        deals = list(deals)
+        model_estimates = np.full((len(self.names), len(deals)), np.nan)
+        tasks: dict[asyncio.Future[FloatArray], tuple[int, int]] = {}
+        for row, name in enumerate(self.names):
+            for start in range(0, len(deals), self.max_batch_size):
+                chunk = deals[start : start + self.max_batch_size]
+                tasks[asyncio.ensure_future(self._estimate(name, chunk))] = (row, start)
+        if tasks:
+            done, pending = await asyncio.wait(tasks, timeout=self.deadline)
+            for task in pending:
+                task.cancel()
+            missed = dict.fromkeys(self.names, 0)
+            for task, (row, start) in tasks.items():
+                if task in done:
+                    estimates = task.result()
+                    model_estimates[row, start : start + len(estimates)] = estimates
+                else:
+                    missed[self.names[row]] += min(self.max_batch_size, len(deals) - start)
+            for name, count in missed.items():
+                if count:
+                    logger.warning(
+                        "Pricing model missed deadline",
+                        extra={"model": name, "deadline": self.deadline, "deals": count},
+                    )
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        prices = np.fromiter((deal.price for deal in deals), dtype=np.float64, count=len(deals))
+        estimates, discounts, is_opportunity = combine_estimates(
+            model_estimates, self.weights, prices, self.threshold
+        )
+        return BatchPricing(
+            deals=deals,
+            models=self.names,
+            model_estimates=model_estimates,
+            estimates=estimates,
+            discounts=discounts,
+            is_opportunity=is_opportunity,
+            partial=np.isnan(model_estimates).any(axis=0),
+        )
+
+    async def price(self, deal: Deal) -> PricedDeal:
+        """Price a single deal under the same deadline and hedging rules."""
+        return (await self.price_batch([deal])).results()[0]
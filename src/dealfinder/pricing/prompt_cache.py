@@ -0,0 +1,305 @@
+"""Semantic response cache for Frontier pricing prompts.
+
+Frontier (Bedrock/Claude) pricing prompts for the same product often differ
+only in the retailer, a coupon string or a tracking URL. Prompts are
+normalized to strip those, then looked up exactly by hash in Redis and, on a
+miss, by embedding cosine similarity against recently cached prompts. Hits
+return the cached estimate with its age so callers can decide how much to
+trust it. Each entry's embedding is stored under its own key, read only by
+:meth:`PromptCache.warm`, so exact lookups fetch just the estimate.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import re
+import time
+from collections.abc import Callable, Iterable, Sequence
+from dataclasses import dataclass
+from typing import cast
+
+import numpy as np
+from redis.asyncio import Redis
+
+from dealfinder.embeddings import Embedder, Embeddings, normalize_rows
+from dealfinder.pricing.ensemble import PriceModel
+from dealfinder.schemas import Deal
+
+_URL = re.compile(r"https?://\S+")
+_COUPON = re.compile(
+    r"\b(?:(?:use|with|enter|apply)\s+)?(?:promo|coupon|discount|voucher)?\s*code"
+    r"\s*[:\-]?\s*[A-Z0-9][A-Z0-9_-]{2,}\b"
+    r"|\b(?:clip|apply)\s+(?:the\s+)?(?:\$?\d+%?\s+)?(?:off\s+)?coupon\b",
+    re.IGNORECASE,
+)
+_WHITESPACE = re.compile(r"\s+")
+
+DEFAULT_RETAILERS = (
+    "amazon",
+    "walmart",
+    "target",
+    "best buy",
+    "bestbuy",
+    "newegg",
+    "costco",
+    "ebay",
+    "b&h",
+    "home depot",
+    "lowe's",
+    "woot",
+)
+
+
+def normalize_prompt(prompt: str, retailers: Iterable[str] = DEFAULT_RETAILERS) -> str:
+    """Strip retailer names, coupon strings and URLs, and collapse whitespace."""
+    text = _COUPON.sub(" ", _URL.sub(" ", prompt))
+    names = sorted((re.escape(r) for r in retailers), key=len, reverse=True)
+    if names:
+        retailer = re.compile(
+            r"\b(?:at|from|via|@)?\s*(?:" + "|".join(names) + r")(?:\.com)?\b", re.IGNORECASE
+        )
+        text = retailer.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+@dataclass(frozen=True, slots=True)
+class CachedPrice:
+    """A cached Frontier estimate returned for a prompt."""
+
+    estimate: float
+    age: float
+    similarity: float
+    exact: bool
+
+
+@dataclass(slots=True)
+class PromptCacheStats:
+    """Hit/miss counters and an estimate of model latency avoided."""
+
+    exact_hits: int = 0
+    near_hits: int = 0
+    misses: int = 0
+    latency_saved: float = 0.0
+    mean_miss_latency: float | None = None
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.exact_hits + self.near_hits + self.misses
+        return (self.exact_hits + self.near_hits) / total if total else 0.0
+
+    def record_miss_latency(self, seconds: float, smoothing: float = 0.1) -> None:
+        if self.mean_miss_latency is None:
+            self.mean_miss_latency = seconds
+        else:
+            self.mean_miss_latency += smoothing * (seconds - self.mean_miss_latency)
+
+    def record_hit(self, exact: bool) -> None:
+        if exact:
+            self.exact_hits += 1
+        else:
+            self.near_hits += 1
+        self.latency_saved += self.mean_miss_latency or 0.0
+
+
+class PromptCache:
+    """Exact plus embedding-similarity cache of Frontier price estimates.
+
+    Exact entries live in Redis and are shared by every instance. Near-hit
+    search runs over an in-process matrix of the most recent prompt
+    embeddings; :meth:`warm` seeds it from Redis so a new instance also
+    benefits from entries written by others.
+
+    Args:
+        redis: Async Redis client.
+        embedder: Embedding backend for near-hit lookups.
+        threshold: Minimum cosine similarity for a near hit.
+        ttl: Seconds a cached estimate stays valid.
+        capacity: Embeddings held in memory for near-hit search.
+        clock: Source of the current time, overridable in tests.
+    """
+
+    prefix = "pricing:prompt"
+
+    def __init__(
+        self,
+        redis: Redis,
+        embedder: Embedder,
+        *,
+        threshold: float = 0.95,
+        ttl: int = 6 * 3600,
+        capacity: int = 10_000,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        if not -1 <= threshold <= 1:
+            raise ValueError("threshold must be a cosine similarity in [-1, 1]")
+        self._redis = redis
+        self.embedder = embedder
+        self.threshold = threshold
+        self.ttl = ttl
+        self.capacity = capacity
+        self._clock = clock
+        self.stats = PromptCacheStats()
+        self._vectors: Embeddings | None = None
+        self._estimates = np.zeros(capacity, dtype=np.float64)
+        self._created = np.full(capacity, -np.inf)
+        self._size = 0
+        self._next = 0
+
+    @property
+    def _recent_key(self) -> str:
+        return f"{self.prefix}:recent"
+
+    def _entry_key(self, digest: str) -> str:
+        return f"{self.prefix}:entry:{digest}"
+
+    def _embedding_key(self, digest: str) -> str:
+        return f"{self.prefix}:embedding:{digest}"
+
+    @staticmethod
+    def digest(normalized: str) -> str:
+        return hashlib.sha256(normalized.encode()).hexdigest()
+
+    def _remember(self, vector: Embeddings, estimate: float, created: float) -> None:
+        if self._vectors is None:
+            self._vectors = np.zeros((self.capacity, vector.shape[-1]), dtype=np.float32)
+        slot = self._next
+        self._vectors[slot] = vector
+        self._estimates[slot] = estimate
+        self._created[slot] = created
+        self._next = (slot + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def _nearest(self, vectors: Embeddings, oldest: float) -> list[tuple[int, float] | None]:
+        if self._vectors is None or self._size == 0:
+            return [None] * len(vectors)
+        scores = vectors @ self._vectors[: self._size].T
+        scores[:, self._created[: self._size] < oldest] = -np.inf
+        best = scores.argmax(axis=1)
+        return [
+            (int(slot), float(scores[row, slot])) if scores[row, slot] >= self.threshold else None
+            for row, slot in enumerate(best)
+        ]
+
+    async def lookup_many(
+        self, prompts: Sequence[str], *, max_age: float | None = None
+    ) -> list[CachedPrice | None]:
+        """Return a cached estimate per prompt, or ``None`` on a miss.
+
+        Entries older than ``max_age`` seconds count as misses.
+        """
+        if not prompts:
+            return []
+        now = self._clock()
+        oldest = now - min(self.ttl, math.inf if max_age is None else max_age)
+        normalized = [normalize_prompt(p) for p in prompts]
+        raw = await self._redis.mget([self._entry_key(self.digest(n)) for n in normalized])
+        results: list[CachedPrice | None] = [None] * len(prompts)
+        pending: list[int] = []
+        for index, payload in enumerate(raw):
+            if payload is None:
+                pending.append(index)
+                continue
+            data = json.loads(payload)
+            if data["created"] < oldest:
+                pending.append(index)
+                continue
+            results[index] = CachedPrice(data["estimate"], now - data["created"], 1.0, True)
+            self.stats.record_hit(exact=True)
+
+        if pending:
+            vectors = normalize_rows(await self.embedder.embed([normalized[i] for i in pending]))
+            for index, match in zip(pending, self._nearest(vectors, oldest), strict=True):
+                if match is None:
+                    self.stats.misses += 1
+                    continue
+                slot, score = match
+                age = now - float(self._created[slot])
+                results[index] = CachedPrice(float(self._estimates[slot]), age, score, False)
+                self.stats.record_hit(exact=False)
+        return results
+
+    async def store_many(self, prompts: Sequence[str], estimates: Sequence[float]) -> None:
+        """Cache fresh estimates for their prompts."""
+        if not prompts:
+            return
+        now = self._clock()
+        normalized = [normalize_prompt(p) for p in prompts]
+        vectors = normalize_rows(await self.embedder.embed(normalized))
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for text, vector, estimate in zip(normalized, vectors, estimates, strict=True):
+                digest = self.digest(text)
+                payload = {"estimate": estimate, "created": now}
+                pipe.set(self._entry_key(digest), json.dumps(payload), ex=self.ttl)
+                pipe.set(
+                    self._embedding_key(digest), vector.astype(np.float32).tobytes(), ex=self.ttl
+                )
+                pipe.zadd(self._recent_key, {digest: now})
+                self._remember(vector, estimate, now)
+            pipe.zremrangebyscore(self._recent_key, "-inf", now - self.ttl)
+            pipe.zremrangebyrank(self._recent_key, 0, -self.capacity - 1)
+            await pipe.execute()
+
+    async def warm(self) -> int:
+        """Load the most recent shared entries into the near-hit index."""
+        digests = cast(list[bytes], await self._redis.zrange(self._recent_key, -self.capacity, -1))
+        if not digests:
+            return 0
+        keys = [d.decode() for d in digests]
+        raw = await self._redis.mget(
+            [self._entry_key(d) for d in keys] + [self._embedding_key(d) for d in keys]
+        )
+        loaded = 0
+        for payload, embedding in zip(raw[: len(keys)], raw[len(keys) :], strict=True):
+            if payload is not None and embedding is not None:
+                data = json.loads(payload)
+                vector = np.frombuffer(cast(bytes, embedding), dtype=np.float32)
+                self._remember(vector, data["estimate"], data["created"])
+                loaded += 1
+        return loaded
+
+
+class SemanticCachedModel:
+    """Put a :class:`PromptCache` in front of a Frontier ``PriceModel``.
+
+    Args:
+        model: The wrapped pricing model.
+        cache: Prompt cache to consult.
+        prompt: Builds the pricing prompt sent to the model for a deal.
+        max_age: Cached estimates older than this are treated as misses.
+    """
+
+    def __init__(
+        self,
+        model: PriceModel,
+        cache: PromptCache,
+        prompt: Callable[[Deal], str],
+        *,
+        max_age: float | None = None,
+    ) -> None:
+        self.model = model
+        self.cache = cache
+        self.prompt = prompt
+        self.max_age = max_age
+
+    async def estimate_batch(self, deals: Sequence[Deal]) -> list[float | None]:
+        prompts = [self.prompt(deal) for deal in deals]
+        cached = await self.cache.lookup_many(prompts, max_age=self.max_age)
+        results: list[float | None] = [None if hit is None else hit.estimate for hit in cached]
+        misses = [i for i, value in enumerate(results) if value is None]
+        if not misses:
+            return results
+
+        started = time.perf_counter()
+        fresh = await self.model.estimate_batch([deals[i] for i in misses])
+        self.cache.stats.record_miss_latency(time.perf_counter() - started)
+        store_prompts: list[str] = []
+        store_estimates: list[float] = []
+        for index, value in zip(misses, fresh, strict=True):
+            results[index] = value
+            if value is not None and not np.isnan(value):
+                store_prompts.append(prompts[index])
+                store_estimates.append(value)
+        await self.cache.store_many(store_prompts, store_estimates)
+        return results
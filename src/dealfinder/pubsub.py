@@ -0,0 +1,127 @@
+"""Redis pub/sub subscription that survives connection loss.
+
+The realtime hub, stream hub and API cache each keep one subscription
+open for the life of the process. ``pubsub.listen()`` raises once the
+connection drops (a Redis failover, an idle timeout at a proxy), and a
+bare listener task then ends without a trace while every instance quietly
+stops receiving fan-out. :class:`PubSubRelay` logs the failure and
+resubscribes with exponential backoff until it is closed. Messages
+published while it was disconnected are lost, as with any pub/sub
+subscriber; ``on_reconnect`` lets the owner account for that.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+from collections.abc import Callable
+from typing import Any
+
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+
+class PubSubRelay:
+    """Passes each message on a Redis channel to ``handler``, reconnecting as needed.
+
+    Args:
+        redis: Async Redis client.
+        channel: Channel to subscribe to.
+        handler: Called with each message's ``data``. An exception is
+            logged and the message skipped.
+        on_reconnect: Called after resubscribing, since messages may have
+            been missed in between.
+        base_delay: First reconnect delay, in seconds.
+        max_delay: Largest reconnect delay, in seconds.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        channel: str,
+        handler: Callable[[Any], None],
+        *,
+        on_reconnect: Callable[[], None] | None = None,
+        base_delay: float = 0.1,
+        max_delay: float = 30.0,
+    ) -> None:
+        self._redis = redis
+        self.channel = channel
+        self._handler = handler
+        self._on_reconnect = on_reconnect
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._task: asyncio.Task[None] | None = None
+        self.reconnects = 0
+
+    async def start(self) -> None:
+        """Subscribe, then relay in the background until :meth:`aclose`.
+
+        The first subscription is made before returning, so messages
+        published afterwards are received.
+        """
+        if self._task is not None:
+            return
+        pubsub = await self._subscribe()
+        self._task = asyncio.create_task(self._run(pubsub))
+
+    async def _subscribe(self) -> Any:
+        pubsub: Any = self._redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(self.channel)
+        except BaseException:
+            await pubsub.aclose()
+            raise
+        return pubsub
+
+    async def _run(self, pubsub: Any) -> None:
+        delay = self.base_delay
+        while True:
+            try:
+                await self._relay(pubsub)
+                error = "subscription ended"
+            except Exception as exc:  # noqa: BLE001 - the relay must outlive the connection
+                error = str(exc) or type(exc).__name__
+            finally:
+                with contextlib.suppress(Exception):
+                    await pubsub.aclose()
+            logger.warning(
+                "Redis pub/sub subscription lost, reconnecting",
+                extra={"channel": self.channel, "error": error, "retry_in": delay},
+            )
+            while True:
+                await asyncio.sleep(delay)
+                delay = min(self.max_delay, delay * 2)
+                try:
+                    pubsub = await self._subscribe()
+                except Exception as exc:  # noqa: BLE001 - keep retrying until closed
+                    logger.warning(
+                        "Redis pub/sub resubscribe failed",
+                        extra={"channel": self.channel, "error": str(exc), "retry_in": delay},
+                    )
+                    continue
+                break
+            delay = self.base_delay
+            self.reconnects += 1
+            logger.info("Redis pub/sub resubscribed", extra={"channel": self.channel})
+            if self._on_reconnect is not None:
+                self._on_reconnect()
+
+    async def _relay(self, pubsub: Any) -> None:
+        async for message in pubsub.listen():
+            try:
+                self._handler(message["data"])
+            except Exception as exc:  # noqa: BLE001 - one bad message must not stop the relay
+                logger.warning(
+                    "Dropped malformed pub/sub message",
+                    extra={"channel": self.channel, "error": str(exc)},
+                )
+
+    async def aclose(self) -> None:
+        """Stop relaying and close the subscription."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,264 @@
+"""WebSocket fan-out hub for pushing opportunities to connected clients.
+
+One opportunity can go to tens of thousands of sockets, so the hub
+serializes each message once into a JSON frame and hands the same string
+to every subscriber of its topic. Each connection has a bounded send
+queue drained by its own writer task. A slow consumer therefore never
+blocks a publish: when its queue is full the hub either drops the oldest
+queued frame or disconnects the client, depending on ``overflow``.
+
+With a Redis client the hub fans out across instances. :meth:`Hub.publish`
+sends the frame to a pub/sub channel, and every instance, including the
+publisher, delivers it to its local subscribers. Without Redis, publishes
+are delivered locally.
+
+Clients choose topics by message, so every topic a client asks for is
+checked with the hub's ``authorize`` callback against the user the
+session was authenticated as.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import logging
+from collections import deque
+from collections.abc import Callable, Iterable
+from typing import Any, Literal
+
+from redis.asyncio import Redis
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from dealfinder.pubsub import PubSubRelay
+
+logger = logging.getLogger(__name__)
+
+Overflow = Literal["drop_oldest", "disconnect"]
+Authorize = Callable[[str, str], bool]
+
+# RFC 6455 "Try Again Later", sent to consumers that fall too far behind.
+CLOSE_TOO_SLOW = 1013
+
+
+def check_topic(topic: str) -> str:
+    """Return ``topic`` if it is valid; the pub/sub envelope ends the topic at a newline."""
+    if not topic or "\n" in topic:
+        raise ValueError(f"invalid topic {topic!r}")
+    return topic
+
+
+def encode_message(topic: str, data: Any) -> str:
+    """The JSON frame sent to clients for one message."""
+    return json.dumps({"topic": topic, "data": data}, separators=(",", ":"), default=str)
+
+
+class Connection:
+    """One client socket with its topics and bounded send queue."""
+
+    __slots__ = ("_waiter", "_writer", "dropped", "overflowed", "queue", "topics", "websocket")
+
+    def __init__(self, websocket: WebSocket, max_queue: int) -> None:
+        self.websocket = websocket
+        self.topics: set[str] = set()
+        self.queue: deque[str] = deque(maxlen=max_queue)
+        self.overflowed = False
+        self.dropped = 0
+        self._waiter: asyncio.Future[None] | None = None
+        self._writer: asyncio.Task[None] | None = None
+
+    def _wake(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def offer(self, frame: str, overflow: Overflow) -> bool:
+        """Queue a frame without blocking. Returns ``False`` if a frame was lost."""
+        full = len(self.queue) == self.queue.maxlen
+        if full and overflow == "disconnect":
+            self.overflowed = True
+            self._wake()
+            return False
+        if full:
+            self.dropped += 1
+        self.queue.append(frame)
+        self._wake()
+        return not full
+
+    async def _write(self) -> None:
+        """Send queued frames until the connection overflows or fails."""
+        loop = asyncio.get_running_loop()
+        while not self.overflowed:
+            if not self.queue:
+                self._waiter = loop.create_future()
+                await self._waiter
+                self._waiter = None
+                continue
+            await self.websocket.send_text(self.queue.popleft())
+        self.queue.clear()
+        await self.websocket.close(code=CLOSE_TOO_SLOW)
+
+
+class Hub:
+    """Topic-based WebSocket publisher.
+
+    Args:
+        redis: Optional async Redis client for cross-instance fan-out.
+        channel: Redis pub/sub channel shared by all instances.
+        max_queue: Frames buffered per connection.
+        overflow: ``"drop_oldest"`` to discard a slow client's oldest
+            frames, or ``"disconnect"`` to close it.
+        authorize: ``authorize(user_id, topic)`` decides whether a client
+            may subscribe to a topic it asks for. Without it clients keep
+            the topics :meth:`serve` was given.
+    """
+
+    def __init__(
+        self,
+        redis: Redis | None = None,
+        *,
+        channel: str = "realtime",
+        max_queue: int = 256,
+        overflow: Overflow = "drop_oldest",
+        authorize: Authorize | None = None,
+    ) -> None:
+        if max_queue < 1:
+            raise ValueError("max_queue must be at least 1")
+        self._redis = redis
+        self.channel = channel
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.authorize = authorize
+        self._topics: dict[str, set[Connection]] = {}
+        self._connections: set[Connection] = set()
+        self._relay = None if redis is None else PubSubRelay(redis, channel, self._relayed)
+        self.published = 0
+        self.deliveries = 0
+        self.dropped = 0
+        self.disconnected = 0
+
+    def __len__(self) -> int:
+        """Open connections."""
+        return len(self._connections)
+
+    def subscribers(self, topic: str) -> int:
+        return len(self._topics.get(topic, ()))
+
+    async def start(self) -> None:
+        """Start relaying Redis pub/sub messages to local subscribers."""
+        if self._relay is not None:
+            await self._relay.start()
+
+    def _relayed(self, data: bytes | str) -> None:
+        envelope = data.decode() if isinstance(data, bytes) else data
+        topic, _, frame = envelope.partition("\n")
+        self.deliver(topic, frame)
+
+    async def aclose(self) -> None:
+        """Stop the Redis relay and close every connection."""
+        if self._relay is not None:
+            await self._relay.aclose()
+        for connection in list(self._connections):
+            if connection._writer is not None:
+                connection._writer.cancel()
+            # The client may already be gone.
+            with contextlib.suppress(Exception):
+                await connection.websocket.close()
+            self._drop(connection)
+
+    async def connect(self, websocket: WebSocket, topics: Iterable[str] = ()) -> Connection:
+        """Accept a socket, subscribe it to ``topics`` and start its writer."""
+        await websocket.accept()
+        connection = Connection(websocket, self.max_queue)
+        self._connections.add(connection)
+        for topic in topics:
+            self.subscribe(connection, topic)
+        connection._writer = asyncio.create_task(connection._write())
+        connection._writer.add_done_callback(lambda task: self._writer_done(connection, task))
+        return connection
+
+    def _writer_done(self, connection: Connection, task: asyncio.Task[None]) -> None:
+        if connection.overflowed:
+            self.disconnected += 1
+            logger.warning(
+                "Disconnected slow WebSocket consumer", extra={"topics": connection.topics}
+            )
+        elif not task.cancelled() and task.exception() is not None:
+            logger.info("WebSocket send failed", extra={"error": str(task.exception())})
+        self._drop(connection)
+
+    def disconnect(self, connection: Connection) -> None:
+        """Unsubscribe a connection and stop its writer."""
+        if connection._writer is not None:
+            connection._writer.cancel()
+        self._drop(connection)
+
+    def _drop(self, connection: Connection) -> None:
+        self._connections.discard(connection)
+        for topic in list(connection.topics):
+            self.unsubscribe(connection, topic)
+
+    def subscribe(self, connection: Connection, topic: str) -> None:
+        self._topics.setdefault(check_topic(topic), set()).add(connection)
+        connection.topics.add(topic)
+
+    def unsubscribe(self, connection: Connection, topic: str) -> None:
+        connection.topics.discard(topic)
+        subscribers = self._topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(connection)
+            if not subscribers:
+                del self._topics[topic]
+
+    async def serve(self, websocket: WebSocket, user_id: str, topics: Iterable[str] = ()) -> None:
+        """Run an authenticated client session until it disconnects.
+
+        Clients may send ``{"subscribe": [...]}`` or ``{"unsubscribe": [...]}``
+        to change topics; other messages are ignored, as are subscriptions
+        ``authorize`` refuses for ``user_id``.
+        """
+        connection = await self.connect(websocket, topics)
+        try:
+            while True:
+                try:
+                    request = json.loads(await websocket.receive_text())
+                except json.JSONDecodeError:
+                    continue
+                if not isinstance(request, dict):
+                    continue
+                for topic in request.get("subscribe", ()):
+                    self._subscribe_as(user_id, connection, str(topic))
+                for topic in request.get("unsubscribe", ()):
+                    self.unsubscribe(connection, str(topic))
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            self.disconnect(connection)
+
+    def _subscribe_as(self, user_id: str, connection: Connection, topic: str) -> None:
+        valid = bool(topic) and "\n" not in topic
+        if not (valid and self.authorize is not None and self.authorize(user_id, topic)):
+            logger.info(
+                "Refused WebSocket subscription", extra={"user_id": user_id, "topic": topic}
+            )
+            return
+        self.subscribe(connection, topic)
+
+    def deliver(self, topic: str, frame: str) -> int:
+        """Queue a pre-encoded frame for local subscribers. Returns their number."""
+        subscribers = self._topics.get(topic)
+        if not subscribers:
+            return 0
+        for connection in subscribers:
+            if not connection.offer(frame, self.overflow):
+                self.dropped += 1
+        self.deliveries += len(subscribers)
+        return len(subscribers)
+
+    async def publish(self, topic: str, data: Any) -> None:
+        """Send a message to every subscriber of ``topic`` on every instance."""
+        frame = encode_message(check_topic(topic), data)
+        self.published += 1
+        if self._redis is None:
+            self.deliver(topic, frame)
+        else:
+            await self._redis.publish(self.channel, f"{topic}\n{frame}")
@@ -0,0 +1,389 @@
+"""Vectorized business rules for opportunity evaluation.
+
+Rules are small expressions over deal columns, written in a subset of
+Python expression syntax, for example::
+
+    {"rules": [
+        {"name": "min_discount", "require": "discount > 50",
+         "when": "category not in ['books']"},
+        {"name": "books_discount", "require": "discount > 15",
+         "when": "category == 'books'"},
+        {"name": "percent_off", "require": "discount_pct >= 20"},
+        {"name": "blocked_retailers", "reject": "retailer in ['wish', 'temu']"},
+        {"name": "price_sanity", "reject": "price < 1 or estimate > 20 * price"},
+        {"name": "quiet_hours", "reject": "hour >= 1 and hour < 6"}
+    ]}
+
+Each expression is parsed once with :mod:`ast` and compiled into a closure
+of NumPy operations, so a batch of deals is evaluated column-wise with no
+per-deal Python branching. A deal passes when no in-scope ``require`` is
+false and no in-scope ``reject`` is true. String columns and literals are
+lowercased, and comparisons involving a missing (NaN) estimate or discount
+are false.
+
+:class:`RuleEngine` counts per-rule hits and reloads its rule file when it
+changes, keeping the previous rules if the new file does not compile.
+"""
+
+from __future__ import annotations
+
+import ast
+import hashlib
+import json
+import logging
+import operator
+import os
+import time
+from collections import Counter
+from collections.abc import Callable, Mapping, Sequence
+from dataclasses import dataclass, field, replace
+from datetime import UTC, datetime, tzinfo
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+
+from dealfinder.pricing.ensemble import DEFAULT_THRESHOLD, BatchPricing
+from dealfinder.schemas import Deal
+
+logger = logging.getLogger(__name__)
+
+Columns = Mapping[str, Any]
+BoolArray = npt.NDArray[np.bool_]
+Expression = Callable[[Columns], Any]
+
+COLUMNS = frozenset(
+    {
+        "price",
+        "estimate",
+        "discount",
+        "discount_pct",
+        "partial",
+        "category",
+        "retailer",
+        "source",
+        "age_hours",
+        "hour",
+        "weekday",
+    }
+)
+
+_COMPARE: dict[type[ast.cmpop], Callable[[Any, Any], Any]] = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+_ARITHMETIC: dict[type[ast.operator], Callable[[Any, Any], Any]] = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+}
+
+
+class RuleError(ValueError):
+    """Raised when a rule or rule file is invalid."""
+
+
+def _literal(node: ast.expr) -> Any:
+    if not isinstance(node, ast.Constant) or not isinstance(node.value, int | float | str):
+        raise RuleError(f"expected a literal, got {ast.unparse(node)!r}")
+    return node.value.lower() if isinstance(node.value, str) else node.value
+
+
+def _compile(node: ast.expr) -> Expression:
+    """Translate a whitelisted expression node into a column function."""
+    match node:
+        case ast.Constant(value=bool() | int() | float() | str() as value):
+            value = value.lower() if isinstance(value, str) else value
+            return lambda columns: value
+        case ast.Name(id=name):
+            if name not in COLUMNS:
+                raise RuleError(f"unknown column {name!r}")
+            return lambda columns: columns[name]
+        case ast.BoolOp(op=op, values=values):
+            parts = [_compile(value) for value in values]
+            combine = np.logical_and if isinstance(op, ast.And) else np.logical_or
+
+            def boolean(columns: Columns) -> Any:
+                result = parts[0](columns)
+                for part in parts[1:]:
+                    result = combine(result, part(columns))
+                return result
+
+            return boolean
+        case ast.UnaryOp(op=ast.Not(), operand=operand):
+            inner = _compile(operand)
+            return lambda columns: np.logical_not(inner(columns))
+        case ast.UnaryOp(op=ast.USub(), operand=operand):
+            inner = _compile(operand)
+            return lambda columns: np.negative(inner(columns))
+        case ast.BinOp(left=left, op=op, right=right) if type(op) in _ARITHMETIC:
+            fn, lhs, rhs = _ARITHMETIC[type(op)], _compile(left), _compile(right)
+            return lambda columns: fn(lhs(columns), rhs(columns))
+        case ast.Compare(left=left, ops=ops, comparators=comparators):
+            if len(ops) > 1 and any(isinstance(op, ast.In | ast.NotIn) for op in ops):
+                raise RuleError("'in' cannot be chained with other comparisons")
+            if isinstance(ops[0], ast.In | ast.NotIn):
+                if not isinstance(comparators[0], ast.List | ast.Tuple | ast.Set):
+                    raise RuleError("'in' needs a literal list")
+                members = [_literal(item) for item in comparators[0].elts]
+                invert = isinstance(ops[0], ast.NotIn)
+                subject = _compile(left)
+                return lambda columns: np.isin(subject(columns), members, invert=invert)
+            if any(type(op) not in _COMPARE for op in ops):
+                raise RuleError(f"unsupported comparison in {ast.unparse(node)!r}")
+            fns = [_COMPARE[type(op)] for op in ops]
+            operands = [_compile(operand) for operand in [left, *comparators]]
+
+            def compare(columns: Columns) -> Any:
+                values = [operand(columns) for operand in operands]
+                result = fns[0](values[0], values[1])
+                for i, fn in enumerate(fns[1:], start=1):
+                    result = np.logical_and(result, fn(values[i], values[i + 1]))
+                return result
+
+            return compare
+    raise RuleError(f"unsupported syntax {ast.unparse(node)!r}")
+
+
+def compile_expression(source: str) -> Callable[[Columns], BoolArray]:
+    """Compile a rule expression into a function of columns returning a mask."""
+    try:
+        tree = ast.parse(source, mode="eval")
+    except SyntaxError as exc:
+        raise RuleError(f"cannot parse {source!r}: {exc.msg}") from exc
+    expression = _compile(tree.body)
+
+    def predicate(columns: Columns) -> BoolArray:
+        mask: BoolArray = np.broadcast_to(
+            np.asarray(expression(columns), dtype=np.bool_), columns["price"].shape
+        )
+        return mask
+
+    return predicate
+
+
+def _strings(values: Sequence[str | None]) -> npt.NDArray[np.object_]:
+    return np.array([(value or "").strip().lower() for value in values], dtype=object)
+
+
+def _aware(value: datetime) -> datetime:
+    """Treat a naive timestamp as UTC, as the feed parser does."""
+    return value if value.tzinfo else value.replace(tzinfo=UTC)
+
+
+def deal_columns(
+    deals: Sequence[Deal],
+    estimates: npt.ArrayLike,
+    discounts: npt.ArrayLike,
+    partial: npt.ArrayLike | None = None,
+    *,
+    now: datetime | None = None,
+) -> dict[str, Any]:
+    """Build the columns rules are evaluated over.
+
+    ``hour`` and ``weekday`` (Monday is 0) describe ``now``, the evaluation
+    time, and are the same for every deal; ``age_hours`` is the time since
+    each deal was published, NaN when unknown. Naive timestamps are taken
+    to be UTC.
+    """
+    now = _aware(now) if now else datetime.now(UTC)
+    price = np.array([deal.price for deal in deals], dtype=np.float64)
+    estimate = np.asarray(estimates, dtype=np.float64)
+    discount = np.asarray(discounts, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        discount_pct = np.where(estimate > 0, 100.0 * discount / estimate, np.nan)
+    published = [deal.published_at for deal in deals]
+    age_hours = np.array(
+        [np.nan if p is None else (now - _aware(p)).total_seconds() / 3600 for p in published],
+        dtype=np.float64,
+    )
+    return {
+        "price": price,
+        "estimate": estimate,
+        "discount": discount,
+        "discount_pct": discount_pct,
+        "partial": (
+            np.zeros(len(deals), dtype=np.bool_)
+            if partial is None
+            else np.asarray(partial, dtype=np.bool_)
+        ),
+        "category": _strings([deal.category for deal in deals]),
+        "retailer": _strings([deal.retailer for deal in deals]),
+        "source": _strings([deal.source for deal in deals]),
+        "age_hours": age_hours,
+        "hour": now.hour,
+        "weekday": now.weekday(),
+    }
+
+
+@dataclass(frozen=True, slots=True)
+class Rule:
+    """One compiled business rule.
+
+    ``require`` rules reject in-scope deals whose condition is false;
+    ``reject`` rules reject in-scope deals whose condition is true. The
+    scope is every deal unless ``when`` is given.
+    """
+
+    name: str
+    action: str
+    condition: str
+    when: str | None = None
+    _condition: Callable[[Columns], BoolArray] = field(init=False, repr=False, compare=False)
+    _scope: Callable[[Columns], BoolArray] | None = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        if self.action not in ("require", "reject"):
+            raise RuleError(f"rule {self.name!r}: action must be 'require' or 'reject'")
+        object.__setattr__(self, "_condition", compile_expression(self.condition))
+        scope = compile_expression(self.when) if self.when else None
+        object.__setattr__(self, "_scope", scope)
+
+    @classmethod
+    def from_config(cls, config: Mapping[str, Any]) -> Rule:
+        actions = [key for key in ("require", "reject") if key in config]
+        if "name" not in config or len(actions) != 1:
+            raise RuleError(f"rule needs a name and exactly one of require/reject: {config!r}")
+        action = actions[0]
+        return cls(config["name"], action, config[action], config.get("when"))
+
+    def hits(self, columns: Columns) -> BoolArray:
+        """Mask of deals this rule rejects."""
+        condition = self._condition(columns)
+        hit = ~condition if self.action == "require" else condition
+        if self._scope is not None:
+            hit = hit & self._scope(columns)
+        return hit
+
+
+@dataclass(frozen=True, slots=True)
+class RuleSet:
+    """An ordered collection of rules with a content version."""
+
+    rules: tuple[Rule, ...]
+    version: str = ""
+
+    @classmethod
+    def from_config(cls, config: Mapping[str, Any]) -> RuleSet:
+        rules = tuple(Rule.from_config(rule) for rule in config.get("rules", ()))
+        names = [rule.name for rule in rules]
+        if len(set(names)) != len(names):
+            raise RuleError("rule names must be unique")
+        canonical = json.dumps(config, sort_keys=True).encode()
+        return cls(rules, hashlib.sha256(canonical).hexdigest()[:12])
+
+    @classmethod
+    def load(cls, path: str | os.PathLike[str]) -> RuleSet:
+        try:
+            config = json.loads(Path(path).read_text())
+        except json.JSONDecodeError as exc:
+            raise RuleError(f"{path}: {exc}") from exc
+        return cls.from_config(config)
+
+
+DEFAULT_RULES = RuleSet.from_config(
+    {"rules": [{"name": "min_discount", "require": f"discount > {DEFAULT_THRESHOLD}"}]}
+)
+
+
+@dataclass(slots=True)
+class RuleResult:
+    """Per-deal outcome of a rule evaluation."""
+
+    passed: BoolArray
+    hits: dict[str, BoolArray]
+
+    def rejected_by(self, index: int) -> list[str]:
+        """Names of the rules that rejected deal ``index``."""
+        return [name for name, mask in self.hits.items() if mask[index]]
+
+
+class RuleEngine:
+    """Evaluates a hot-reloadable :class:`RuleSet` over priced batches.
+
+    Args:
+        rules: Rules to start with.
+        path: Optional JSON rule file; it is loaded now and re-read when
+            its modification time changes.
+        reload_interval: Minimum seconds between checks of ``path``.
+        tz: Time zone for the ``hour`` and ``weekday`` columns.
+        clock: Source of the current time, overridable in tests.
+    """
+
+    def __init__(
+        self,
+        rules: RuleSet = DEFAULT_RULES,
+        *,
+        path: str | os.PathLike[str] | None = None,
+        reload_interval: float = 5.0,
+        tz: tzinfo = UTC,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.rules = rules
+        self.path = Path(path) if path is not None else None
+        self.reload_interval = reload_interval
+        self.tz = tz
+        self._clock = clock
+        self._mtime: int | None = None
+        self._checked = -float("inf")
+        self.hits: Counter[str] = Counter()
+        self.evaluated = 0
+        self.passed = 0
+        if self.path is not None:
+            self.rules = RuleSet.load(self.path)
+            self._mtime = os.stat(self.path).st_mtime_ns
+
+    def reload(self) -> bool:
+        """Re-read the rule file if it changed. Returns ``True`` on a swap."""
+        self._checked = self._clock()
+        if self.path is None:
+            return False
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime == self._mtime:
+                return False
+            rules = RuleSet.load(self.path)
+        except (OSError, RuleError) as exc:
+            logger.warning("Keeping rules %s", self.rules.version, extra={"error": str(exc)})
+            return False
+        self._mtime = mtime
+        if rules.version == self.rules.version:
+            return False
+        logger.info(
+            "Reloaded business rules", extra={"old": self.rules.version, "new": rules.version}
+        )
+        self.rules = rules
+        return True
+
+    def evaluate(self, columns: Columns) -> RuleResult:
+        """Evaluate the current rules over a column batch and count hits."""
+        if self._clock() - self._checked >= self.reload_interval:
+            self.reload()
+        n = len(columns["price"])
+        passed = np.ones(n, dtype=np.bool_)
+        hits: dict[str, BoolArray] = {}
+        for rule in self.rules.rules:
+            mask = rule.hits(columns)
+            hits[rule.name] = mask
+            self.hits[rule.name] += int(np.count_nonzero(mask))
+            passed &= ~mask
+        self.evaluated += n
+        self.passed += int(np.count_nonzero(passed))
+        return RuleResult(passed, hits)
+
+    def apply(self, batch: BatchPricing) -> BatchPricing:
+        """Return ``batch`` with ``is_opportunity`` decided by the rules."""
+        columns = deal_columns(
+            batch.deals,
+            batch.estimates,
+            batch.discounts,
+            batch.partial,
+            now=datetime.fromtimestamp(self._clock(), self.tz),
+        )
+        return replace(batch, is_opportunity=self.evaluate(columns).passed)
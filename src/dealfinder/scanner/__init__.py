@@ -0,0 +1,24 @@
+"""ScannerAgent components: feed fetching, parsing and poll scheduling."""
+
+from dealfinder.scanner.fetch import FeedFetcher, FeedValidators, FetchResult
+from dealfinder.scanner.parser import (
+    FeedEntry,
+    HighWaterMark,
+    HighWaterMarkStore,
+    iter_entries,
+    parse_new_entries,
+)
+from dealfinder.scanner.scheduler import FeedSchedule, PollScheduler
+
+__all__ = [
+    "FeedEntry",
+    "FeedFetcher",
+    "FeedSchedule",
+    "FeedValidators",
+    "FetchResult",
+    "HighWaterMark",
+    "HighWaterMarkStore",
+    "PollScheduler",
+    "iter_entries",
+    "parse_new_entries",
+]
@@ -0,0 +1,210 @@
+"""Concurrent RSS feed fetching for the ScannerAgent.
+
+All feeds in a scan share one pooled :class:`httpx.AsyncClient` so TCP/TLS
+connections are kept alive between polls, and every request carries the
+``ETag``/``Last-Modified`` validators from the previous response so an
+unchanged feed costs a ``304 Not Modified`` instead of a full download and
+parse.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections.abc import Iterable, MutableMapping
+from dataclasses import dataclass, field
+from types import TracebackType
+from typing import Any, Self
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_AGENT = "dealfinder-scanner/0.1 (+https://github.com/Bytes0211/dealfinder)"
+FEED_ACCEPT = "application/rss+xml, application/atom+xml, application/xml;q=0.9, */*;q=0.8"
+
+
+@dataclass(frozen=True, slots=True)
+class FeedValidators:
+    """HTTP cache validators returned by a feed server."""
+
+    etag: str | None = None
+    last_modified: str | None = None
+
+    def headers(self) -> dict[str, str]:
+        """Return the conditional request headers for these validators."""
+        headers: dict[str, str] = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def to_dict(self) -> dict[str, str]:
+        """Serialize to a plain dict for persistence in ``agent-state``."""
+        data: dict[str, str] = {}
+        if self.etag:
+            data["etag"] = self.etag
+        if self.last_modified:
+            data["last_modified"] = self.last_modified
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> FeedValidators:
+        """Rebuild validators saved with :meth:`to_dict`."""
+        return cls(etag=data.get("etag"), last_modified=data.get("last_modified"))
+
+    @classmethod
+    def from_response(cls, response: httpx.Response) -> FeedValidators:
+        """Extract validators from a ``200`` response."""
+        return cls(
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+
+
+@dataclass(slots=True)
+class FetchResult:
+    """Outcome of fetching a single feed."""
+
+    url: str
+    status: int | None
+    content: bytes | None = None
+    validators: FeedValidators = field(default_factory=FeedValidators)
+    elapsed: float = 0.0
+    error: str | None = None
+
+    @property
+    def not_modified(self) -> bool:
+        """True when the server answered ``304`` to a conditional request."""
+        return self.status == 304
+
+    @property
+    def ok(self) -> bool:
+        """True when a fresh feed body was downloaded."""
+        return self.status == 200 and self.content is not None
+
+
+class FeedFetcher:
+    """Fetch many feeds concurrently over a shared keep-alive connection pool.
+
+    Use as an async context manager so the underlying client is closed at
+    the end of the scan::
+
+        async with FeedFetcher(validators=saved) as fetcher:
+            results = await fetcher.fetch_all(feed_urls)
+
+    Args:
+        validators: Mapping of feed URL to the validators from its last
+            successful fetch. It is updated in place after every ``200``
+            response so callers can persist it between scans.
+        max_connections: Upper bound on open connections across all hosts.
+        max_connections_per_host: Concurrent requests allowed per host, so a
+            single aggregator with many feeds is not hammered.
+        keepalive_expiry: Seconds an idle pooled connection is kept open.
+        timeout: Per-request timeout in seconds.
+        transport: Optional transport override (used by tests).
+    """
+
+    def __init__(
+        self,
+        *,
+        validators: MutableMapping[str, FeedValidators] | None = None,
+        max_connections: int = 100,
+        max_connections_per_host: int = 4,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 10.0,
+        user_agent: str = DEFAULT_USER_AGENT,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        if max_connections_per_host < 1:
+            raise ValueError("max_connections_per_host must be at least 1")
+        self.validators: MutableMapping[str, FeedValidators] = (
+            validators if validators is not None else {}
+        )
+        self._max_per_host = max_connections_per_host
+        self._host_slots: dict[str, asyncio.Semaphore] = {}
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(timeout),
+            headers={"User-Agent": user_agent, "Accept": FEED_ACCEPT},
+            follow_redirects=True,
+            transport=transport,
+        )
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close every pooled connection."""
+        await self._client.aclose()
+
+    def _slot(self, url: str) -> asyncio.Semaphore:
+        host = httpx.URL(url).host
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = asyncio.Semaphore(self._max_per_host)
+        return slot
+
+    async def fetch(self, url: str) -> FetchResult:
+        """Fetch one feed, sending conditional headers when validators are known.
+
+        Network and protocol errors are captured on the result rather than
+        raised so one broken feed never aborts the rest of the scan.
+        """
+        previous = self.validators.get(url, FeedValidators())
+        started = time.perf_counter()
+        try:
+            async with self._slot(url):
+                response = await self._client.get(url, headers=previous.headers())
+        except httpx.HTTPError as exc:
+            logger.warning("Feed fetch failed", extra={"feed_url": url, "error": str(exc)})
+            return FetchResult(
+                url=url,
+                status=None,
+                validators=previous,
+                elapsed=time.perf_counter() - started,
+                error=f"{type(exc).__name__}: {exc}",
+            )
+        elapsed = time.perf_counter() - started
+
+        if response.status_code == 304:
+            return FetchResult(url=url, status=304, validators=previous, elapsed=elapsed)
+        if response.status_code != 200:
+            return FetchResult(
+                url=url,
+                status=response.status_code,
+                validators=previous,
+                elapsed=elapsed,
+                error=f"HTTP {response.status_code}",
+            )
+
+        validators = FeedValidators.from_response(response)
+        if validators.etag or validators.last_modified:
+            self.validators[url] = validators
+        else:
+            self.validators.pop(url, None)
+        return FetchResult(
+            url=url,
+            status=200,
+            content=response.content,
+            validators=validators,
+            elapsed=elapsed,
+        )
+
+    async def fetch_all(self, urls: Iterable[str]) -> list[FetchResult]:
+        """Fetch every feed concurrently, returning results in input order."""
+        return list(await asyncio.gather(*(self.fetch(url) for url in urls)))
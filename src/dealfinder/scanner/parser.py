@@ -0,0 +1,224 @@
+"""Incremental feed parsing that stops at the first already-seen entry.
+
+Feeds list entries newest-first, so once an entry we processed on a previous
+scan is reached everything after it is old too. :func:`parse_new_entries`
+feeds the document to an incremental XML pull parser in chunks and stops at
+that point, so a large aggregator feed with a handful of new deals is never
+parsed (or held in memory) in full. Documents the strict XML parser rejects
+fall back to ``feedparser``, which tolerates the malformed markup common in
+the wild.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import xml.etree.ElementTree as ET
+from calendar import timegm
+from collections.abc import Container, Iterable, Iterator
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
+from typing import Any
+
+import feedparser
+
+from dealfinder.state import StateStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 16 * 1024
+ENTRY_TAGS = frozenset({"item", "entry"})
+
+
+@dataclass(frozen=True, slots=True)
+class FeedEntry:
+    """A single item from an RSS or Atom feed."""
+
+    id: str
+    title: str
+    link: str | None = None
+    summary: str | None = None
+    published: datetime | None = None
+
+
+@dataclass(slots=True)
+class HighWaterMark:
+    """Identifiers of the newest entries already processed for one feed.
+
+    Several ids are kept rather than one so that the scan still stops if the
+    newest entry is later removed from the feed.
+    """
+
+    ids: list[str] = field(default_factory=list)
+    capacity: int = 20
+
+    def __contains__(self, entry_id: object) -> bool:
+        return entry_id in self.ids
+
+    def advance(self, new_ids: Iterable[str]) -> None:
+        """Record newly processed ids (newest first) ahead of the existing ones."""
+        merged = list(dict.fromkeys([*new_ids, *self.ids]))
+        self.ids = merged[: self.capacity]
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"ids": self.ids}
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any], *, capacity: int = 20) -> HighWaterMark:
+        return cls(ids=list(data.get("ids", []))[:capacity], capacity=capacity)
+
+
+class HighWaterMarkStore:
+    """Load and save per-feed :class:`HighWaterMark` records in ``agent-state``."""
+
+    key_prefix = "scanner#hwm#"
+
+    def __init__(self, store: StateStore, *, capacity: int = 20) -> None:
+        self._store = store
+        self._capacity = capacity
+
+    def load(self, feed_urls: Iterable[str]) -> dict[str, HighWaterMark]:
+        """Return a mark for every feed, empty for feeds never scanned."""
+        urls = list(feed_urls)
+        stored = self._store.get_many(self.key_prefix + url for url in urls)
+        marks: dict[str, HighWaterMark] = {}
+        for url in urls:
+            data = stored.get(self.key_prefix + url)
+            marks[url] = (
+                HighWaterMark.from_dict(data, capacity=self._capacity)
+                if data
+                else HighWaterMark(capacity=self._capacity)
+            )
+        return marks
+
+    def save(self, marks: dict[str, HighWaterMark]) -> None:
+        self._store.put_many({self.key_prefix + url: mark.to_dict() for url, mark in marks.items()})
+
+
+def _local(tag: str) -> str:
+    return tag.rpartition("}")[2]
+
+
+def _child_text(elem: ET.Element, name: str) -> str | None:
+    for child in elem:
+        if _local(child.tag) == name and child.text:
+            return child.text.strip()
+    return None
+
+
+def _parse_date(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=UTC)
+
+
+def _fallback_id(title: str, link: str | None) -> str:
+    return hashlib.sha1(f"{title}|{link}".encode(), usedforsecurity=False).hexdigest()
+
+
+def _entry_from_element(elem: ET.Element) -> FeedEntry:
+    link = None
+    for child in elem:
+        if _local(child.tag) == "link":
+            link = child.get("href") or (child.text or "").strip() or None
+            if child.get("rel", "alternate") == "alternate":
+                break
+    title = _child_text(elem, "title") or ""
+    entry_id = (
+        _child_text(elem, "guid")
+        or _child_text(elem, "id")
+        or elem.get("{http://www.w3.org/1999/02/22-rdf-syntax-ns#}about")
+        or link
+        or _fallback_id(title, link)
+    )
+    return FeedEntry(
+        id=entry_id,
+        title=title,
+        link=link,
+        summary=_child_text(elem, "description")
+        or _child_text(elem, "summary")
+        or _child_text(elem, "content"),
+        published=_parse_date(
+            _child_text(elem, "pubDate")
+            or _child_text(elem, "published")
+            or _child_text(elem, "updated")
+            or _child_text(elem, "date")
+        ),
+    )
+
+
+def iter_entries(content: bytes, *, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[FeedEntry]:
+    """Yield entries in document order, parsing only as far as the caller consumes.
+
+    Raises:
+        xml.etree.ElementTree.ParseError: If the document is not well-formed.
+    """
+    parser: ET.XMLPullParser[ET.Element] = ET.XMLPullParser(events=("end",))
+    for offset in range(0, len(content), chunk_size):
+        parser.feed(content[offset : offset + chunk_size])
+        yield from _drain(parser)
+    parser.close()
+    yield from _drain(parser)
+
+
+def _drain(parser: ET.XMLPullParser[ET.Element]) -> Iterator[FeedEntry]:
+    for _, elem in parser.read_events():  # type: ignore[misc]
+        if isinstance(elem, ET.Element) and _local(elem.tag) in ENTRY_TAGS:
+            yield _entry_from_element(elem)
+            elem.clear()
+
+
+def _iter_feedparser_entries(content: bytes) -> Iterator[FeedEntry]:
+    parsed = feedparser.parse(content)
+    for raw in parsed.entries:
+        title = raw.get("title", "")
+        link = raw.get("link")
+        published = raw.get("published_parsed") or raw.get("updated_parsed")
+        yield FeedEntry(
+            id=raw.get("id") or link or _fallback_id(title, link),
+            title=title,
+            link=link,
+            summary=raw.get("summary"),
+            published=datetime.fromtimestamp(timegm(published), UTC) if published else None,
+        )
+
+
+def parse_new_entries(
+    content: bytes,
+    seen: Container[str],
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> list[FeedEntry]:
+    """Return entries newer than the high-water mark, newest first.
+
+    Parsing stops at the first entry whose id or link is in ``seen``.
+
+    Args:
+        content: Raw feed document.
+        seen: Already-processed entry ids, typically a :class:`HighWaterMark`.
+        chunk_size: Bytes handed to the pull parser at a time.
+    """
+    new: list[FeedEntry] = []
+    try:
+        for entry in iter_entries(content, chunk_size=chunk_size):
+            if entry.id in seen or (entry.link is not None and entry.link in seen):
+                return new
+            new.append(entry)
+        return new
+    except ET.ParseError as exc:
+        logger.info("Falling back to feedparser", extra={"error": str(exc)})
+
+    new = []
+    for entry in _iter_feedparser_entries(content):
+        if entry.id in seen or (entry.link is not None and entry.link in seen):
+            break
+        new.append(entry)
+    return new
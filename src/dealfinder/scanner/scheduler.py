@@ -0,0 +1,228 @@
+"""Adaptive per-feed poll scheduling.
+
+Rather than sweeping every feed every five minutes, each feed gets its own
+poll interval learned from the publish timestamps of its entries: a feed
+posting every minute is polled every 30 seconds, a feed that has gone quiet
+backs off towards an hour. Next-due times are kept in a heap so the
+ScannerAgent can ask for the batch of feeds due now in ``O(k log n)``.
+"""
+
+from __future__ import annotations
+
+import heapq
+import time
+from collections.abc import Callable, Iterable, Sequence
+from dataclasses import asdict, dataclass
+from typing import Any
+
+from dealfinder.scanner.parser import FeedEntry
+from dealfinder.state import StateStore
+
+
+@dataclass(slots=True)
+class FeedSchedule:
+    """Learned polling state for one feed (times are epoch seconds)."""
+
+    url: str
+    interval: float
+    next_due: float
+    mean_gap: float | None = None
+    last_entry_at: float | None = None
+    failures: int = 0
+
+
+class PollScheduler:
+    """Priority queue of feeds ordered by next-due time.
+
+    Args:
+        min_interval: Fastest allowed poll interval for hot feeds.
+        max_interval: Slowest allowed poll interval for dead feeds.
+        initial_interval: Interval for feeds with no history yet.
+        poll_fraction: Poll this fraction of the learned publish gap, so a
+            feed publishing every 4 minutes is polled every 2.
+        smoothing: EWMA weight given to each newly observed publish gap.
+        backoff: Interval multiplier after a poll that found nothing new.
+        clock: Source of the current time, overridable in tests.
+    """
+
+    state_key = "scanner#schedule"
+
+    def __init__(
+        self,
+        *,
+        min_interval: float = 30.0,
+        max_interval: float = 3600.0,
+        initial_interval: float = 300.0,
+        poll_fraction: float = 0.5,
+        smoothing: float = 0.3,
+        backoff: float = 1.5,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        if not 0 < min_interval <= initial_interval <= max_interval:
+            raise ValueError("require 0 < min_interval <= initial_interval <= max_interval")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.initial_interval = initial_interval
+        self.poll_fraction = poll_fraction
+        self.smoothing = smoothing
+        self.backoff = backoff
+        self._clock = clock
+        self._feeds: dict[str, FeedSchedule] = {}
+        self._heap: list[tuple[float, str]] = []
+        self._in_flight: set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._feeds)
+
+    def __contains__(self, url: object) -> bool:
+        return url in self._feeds
+
+    def get(self, url: str) -> FeedSchedule | None:
+        return self._feeds.get(url)
+
+    def add_feed(self, url: str, *, due: float | None = None) -> None:
+        """Register a feed, due immediately unless ``due`` is given."""
+        if url in self._feeds:
+            return
+        schedule = FeedSchedule(
+            url=url,
+            interval=self.initial_interval,
+            next_due=self._clock() if due is None else due,
+        )
+        self._feeds[url] = schedule
+        heapq.heappush(self._heap, (schedule.next_due, url))
+
+    def remove_feed(self, url: str) -> None:
+        """Stop polling a feed. Its stale heap entry is skipped lazily."""
+        self._feeds.pop(url, None)
+        self._in_flight.discard(url)
+
+    def sync(self, urls: Iterable[str]) -> None:
+        """Make the scheduled set match the configured feed list."""
+        wanted = set(urls)
+        for url in list(self._feeds):
+            if url not in wanted:
+                self.remove_feed(url)
+        for url in wanted:
+            self.add_feed(url)
+
+    def due(self, *, limit: int | None = None, now: float | None = None) -> list[str]:
+        """Pop the feeds whose next poll time has passed, most overdue first.
+
+        Returned feeds are considered in flight until :meth:`record_poll` or
+        :meth:`record_failure` reschedules them.
+        """
+        now = self._clock() if now is None else now
+        batch: list[str] = []
+        while self._heap and (limit is None or len(batch) < limit):
+            next_due, url = self._heap[0]
+            if next_due > now:
+                break
+            heapq.heappop(self._heap)
+            schedule = self._feeds.get(url)
+            # Skip entries for removed feeds or superseded by a reschedule.
+            if schedule is None or schedule.next_due != next_due or url in self._in_flight:
+                continue
+            self._in_flight.add(url)
+            batch.append(url)
+        return batch
+
+    def next_due_at(self) -> float | None:
+        """Earliest next-due time across idle feeds, for sizing the wait."""
+        pending = [s.next_due for u, s in self._feeds.items() if u not in self._in_flight]
+        return min(pending, default=None)
+
+    def record_poll(
+        self,
+        url: str,
+        new_entries: Sequence[FeedEntry],
+        *,
+        now: float | None = None,
+    ) -> float:
+        """Learn from a successful poll and reschedule the feed.
+
+        ``new_entries`` are the entries past the high-water mark (empty for a
+        ``304`` or an unchanged feed). Returns the new interval.
+        """
+        schedule = self._feeds.get(url)
+        if schedule is None:
+            return self.initial_interval
+        now = self._clock() if now is None else now
+        schedule.failures = 0
+
+        published = sorted(e.published.timestamp() for e in new_entries if e.published)
+        if published:
+            previous = schedule.last_entry_at
+            for stamp in published:
+                if previous is not None and stamp > previous:
+                    self._observe_gap(schedule, stamp - previous)
+                previous = stamp
+            schedule.last_entry_at = max(published[-1], schedule.last_entry_at or 0.0)
+
+        if new_entries and schedule.mean_gap is not None:
+            interval = schedule.mean_gap * self.poll_fraction
+        elif new_entries:
+            interval = schedule.interval / self.backoff
+        else:
+            interval = schedule.interval * self.backoff
+            if schedule.mean_gap is not None and schedule.last_entry_at is not None:
+                # A feed that is merely between posts should not back off
+                # beyond its usual cadence until it is clearly overdue.
+                quiet_for = now - schedule.last_entry_at
+                if quiet_for < 2 * schedule.mean_gap:
+                    interval = min(interval, schedule.mean_gap * self.poll_fraction)
+        return self._reschedule(schedule, interval, now)
+
+    def record_failure(self, url: str, *, now: float | None = None) -> float:
+        """Back off exponentially after a failed fetch. Returns the delay."""
+        schedule = self._feeds.get(url)
+        if schedule is None:
+            return self.initial_interval
+        now = self._clock() if now is None else now
+        schedule.failures += 1
+        delay = min(self.max_interval, self.min_interval * 2**schedule.failures)
+        self._in_flight.discard(url)
+        schedule.next_due = now + max(delay, schedule.interval)
+        heapq.heappush(self._heap, (schedule.next_due, url))
+        return schedule.next_due - now
+
+    def _observe_gap(self, schedule: FeedSchedule, gap: float) -> None:
+        if schedule.mean_gap is None:
+            schedule.mean_gap = gap
+        else:
+            schedule.mean_gap += self.smoothing * (gap - schedule.mean_gap)
+
+    def _reschedule(self, schedule: FeedSchedule, interval: float, now: float) -> float:
+        schedule.interval = min(self.max_interval, max(self.min_interval, interval))
+        schedule.next_due = now + schedule.interval
+        self._in_flight.discard(schedule.url)
+        heapq.heappush(self._heap, (schedule.next_due, schedule.url))
+        return schedule.interval
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"feeds": [asdict(schedule) for schedule in self._feeds.values()]}
+
+    def restore(self, data: dict[str, Any]) -> None:
+        """Replace the scheduled feeds with state saved by :meth:`to_dict`.
+
+        Feeds that were in flight when the state was saved are simply due
+        at their stored time, so a crashed scan is retried.
+        """
+        self._feeds = {}
+        self._heap = []
+        self._in_flight = set()
+        for raw in data.get("feeds", []):
+            schedule = FeedSchedule(**raw)
+            self._feeds[schedule.url] = schedule
+            self._heap.append((schedule.next_due, schedule.url))
+        heapq.heapify(self._heap)
+
+    def save(self, store: StateStore) -> None:
+        """Persist the schedule to ``agent-state``."""
+        store.put(self.state_key, self.to_dict())
+
+    def load(self, store: StateStore) -> None:
+        """Restore the schedule from ``agent-state``, if one was saved."""
+        data = store.get(self.state_key)
+        if data is not None:
+            self.restore(data)
@@ -0,0 +1,58 @@
+"""Pydantic contracts shared between agents."""
+
+from __future__ import annotations
+
+from datetime import datetime
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class Deal(BaseModel):
+    """A deal discovered by the ScannerAgent."""
+
+    model_config = ConfigDict(frozen=True)
+
+    id: str
+    title: str
+    price: float = Field(ge=0)
+    url: str | None = None
+    description: str | None = None
+    source: str | None = None
+    category: str | None = None
+    retailer: str | None = None
+    published_at: datetime | None = None
+
+
+class PricedDeal(BaseModel):
+    """A deal with its ensemble price estimate and discount decision.
+
+    ``partial`` is set when some models did not answer in time and the
+    estimate was renormalized over the ones that did.
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    deal: Deal
+    estimate: float | None
+    discount: float | None
+    is_opportunity: bool
+    partial: bool = False
+    model_estimates: dict[str, float | None] = Field(default_factory=dict)
+
+
+class Subscription(BaseModel):
+    """A user's deal-alert preferences.
+
+    Empty term sets and ``None`` bounds place no constraint, so a
+    subscription with only ``keywords`` matches those keywords in any
+    category, at any price and any discount.
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    user_id: str
+    categories: frozenset[str] = frozenset()
+    brands: frozenset[str] = frozenset()
+    keywords: frozenset[str] = frozenset()
+    max_price: float | None = Field(default=None, ge=0)
+    min_discount_pct: float | None = Field(default=None, ge=0, le=100)
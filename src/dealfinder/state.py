@@ -0,0 +1,150 @@
+"""Key/value persistence for agent state.
+
+Agents keep small JSON documents (feed high-water marks, scheduler state,
+idempotency records) in the ``dealfinder-<env>-agent-state`` and
+``dealfinder-<env>-deal-state`` DynamoDB tables. :class:`StateStore` is the
+interface components depend on; :class:`DynamoDBStateStore` is the production
+implementation and :class:`InMemoryStateStore` backs local runs and tests.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+from collections.abc import Iterable, Mapping
+from typing import Any, Protocol
+
+import boto3
+
+PROJECT_NAME = "dealfinder"
+AGENT_STATE = "agent-state"
+DEAL_STATE = "deal-state"
+
+# DynamoDB caps BatchGetItem at 100 keys per request.
+_BATCH_GET_LIMIT = 100
+
+
+def table_name(table: str, environment: str = "dev") -> str:
+    """Return the Terraform-managed table name, e.g. ``dealfinder-dev-agent-state``."""
+    return f"{PROJECT_NAME}-{environment}-{table}"
+
+
+class StateStore(Protocol):
+    """Minimal key/value interface over JSON-serializable documents."""
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        """Return the document stored under ``key``, or ``None``."""
+        ...
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, dict[str, Any]]:
+        """Return the documents for every key that exists."""
+        ...
+
+    def put(self, key: str, value: Mapping[str, Any], *, ttl: int | None = None) -> None:
+        """Store ``value`` under ``key``, optionally expiring after ``ttl`` seconds."""
+        ...
+
+    def put_many(self, items: Mapping[str, Mapping[str, Any]], *, ttl: int | None = None) -> None:
+        """Store several documents at once."""
+        ...
+
+
+class InMemoryStateStore:
+    """Process-local :class:`StateStore` for tests and local development."""
+
+    def __init__(self) -> None:
+        self._items: dict[str, tuple[str, float | None]] = {}
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        payload, expires_at = item
+        if expires_at is not None and expires_at <= time.time():
+            del self._items[key]
+            return None
+        result: dict[str, Any] = json.loads(payload)
+        return result
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, dict[str, Any]]:
+        found: dict[str, dict[str, Any]] = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def put(self, key: str, value: Mapping[str, Any], *, ttl: int | None = None) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+        self._items[key] = (json.dumps(value), expires_at)
+
+    def put_many(self, items: Mapping[str, Mapping[str, Any]], *, ttl: int | None = None) -> None:
+        for key, value in items.items():
+            self.put(key, value, ttl=ttl)
+
+
+class DynamoDBStateStore:
+    """:class:`StateStore` backed by a DynamoDB table.
+
+    Items are ``{"pk": key, "data": <json string>, "expires_at": <epoch>}``.
+    Storing the document as a JSON string sidesteps DynamoDB's ``Decimal``
+    number handling; ``expires_at`` is the table's TTL attribute.
+
+    Args:
+        name: Full table name, see :func:`table_name`.
+        resource: Optional ``boto3`` DynamoDB service resource.
+    """
+
+    key_attribute = "pk"
+    data_attribute = "data"
+    ttl_attribute = "expires_at"
+
+    def __init__(self, name: str, *, resource: Any = None) -> None:
+        resource = resource if resource is not None else boto3.resource("dynamodb")
+        self._resource = resource
+        self._table = resource.Table(name)
+        self.name = name
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        response = self._table.get_item(Key={self.key_attribute: key})
+        item = response.get("Item")
+        return self._decode(item) if item else None
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, dict[str, Any]]:
+        pending = list(dict.fromkeys(keys))
+        found: dict[str, dict[str, Any]] = {}
+        while pending:
+            chunk, pending = pending[:_BATCH_GET_LIMIT], pending[_BATCH_GET_LIMIT:]
+            request: dict[str, Any] = {
+                self.name: {"Keys": [{self.key_attribute: key} for key in chunk]}
+            }
+            while request:
+                response = self._resource.batch_get_item(RequestItems=request)
+                for item in response.get("Responses", {}).get(self.name, []):
+                    value = self._decode(item)
+                    if value is not None:
+                        found[item[self.key_attribute]] = value
+                request = response.get("UnprocessedKeys") or {}
+        return found
+
+    def put(self, key: str, value: Mapping[str, Any], *, ttl: int | None = None) -> None:
+        self._table.put_item(Item=self._encode(key, value, ttl))
+
+    def put_many(self, items: Mapping[str, Mapping[str, Any]], *, ttl: int | None = None) -> None:
+        with self._table.batch_writer(overwrite_by_pkeys=[self.key_attribute]) as writer:
+            for key, value in items.items():
+                writer.put_item(Item=self._encode(key, value, ttl))
+
+    def _encode(self, key: str, value: Mapping[str, Any], ttl: int | None) -> dict[str, Any]:
+        item: dict[str, Any] = {self.key_attribute: key, self.data_attribute: json.dumps(value)}
+        if ttl is not None:
+            item[self.ttl_attribute] = int(time.time()) + ttl
+        return item
+
+    def _decode(self, item: Mapping[str, Any]) -> dict[str, Any] | None:
+        # DynamoDB TTL deletion lags expiry by up to 48h, so filter on read.
+        expires_at = item.get(self.ttl_attribute)
+        if expires_at is not None and int(expires_at) <= time.time():
+            return None
+        result: dict[str, Any] = json.loads(item[self.data_attribute])
+        return result
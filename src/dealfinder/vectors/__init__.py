@@ -0,0 +1,6 @@
+"""In-process vector search for similarity pricing."""
+
+from dealfinder.vectors.hnsw import HNSWIndex, MappedHNSW
+from dealfinder.vectors.pq import PQStore, ProductQuantizer
+
+__all__ = ["HNSWIndex", "MappedHNSW", "PQStore", "ProductQuantizer"]
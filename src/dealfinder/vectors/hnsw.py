@@ -0,0 +1,327 @@
+"""Memory-mapped HNSW nearest-neighbour index for Specialist pricing.
+
+:class:`HNSWIndex` is the mutable builder: it accepts incremental inserts
+and writes snapshots with :meth:`HNSWIndex.save`. :class:`MappedHNSW` opens a
+snapshot read-only with ``np.memmap``, so any number of worker processes
+share one copy of the graph and float16 vectors through the page cache and
+answer top-k queries in-process instead of calling a vector database.
+
+Snapshots are written to a temporary file and renamed into place, so
+readers never see a partial file; :meth:`MappedHNSW.refresh` picks up a new
+snapshot when the file has been swapped.
+
+File layout (a :mod:`dealfinder.vectors.snapshot`; sections 64-byte aligned)::
+
+    b"DFHN" | uint32 version | uint64 header length | JSON header |
+    vectors float16 (n, dim) | levels int8 (n) | layer0 int32 (n, 2*M) |
+    upper_index int64 (n) | upper int32 (rows, M) | key sections
+
+The keys are stored in the sections described in :mod:`dealfinder.vectors.keys`
+and decoded only when a search returns them.
+
+Neighbour rows are padded with ``-1``. ``upper_index[i]`` is the first row
+of node ``i``'s layer-1 links in ``upper`` (layer ``l`` is at
+``upper_index[i] + l - 1``), or ``-1`` for layer-0-only nodes.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+import os
+import random
+from collections.abc import Callable, Iterable, Sequence
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+
+from dealfinder.embeddings import normalize_rows
+from dealfinder.vectors.keys import KeyList, MappedKeys, key_sections
+from dealfinder.vectors.snapshot import Snapshot, write_snapshot
+
+MAGIC = b"DFHN"
+FORMAT_VERSION = 2
+
+Neighbor = tuple[str, float]
+NeighborFn = Callable[[int, int], list[int]]
+
+
+def _search_layer(
+    query: npt.NDArray[np.float32],
+    entry: Sequence[int],
+    ef: int,
+    level: int,
+    neighbors: NeighborFn,
+    vectors: npt.NDArray[Any],
+) -> list[tuple[float, int]]:
+    """Best-first search of one layer; returns ``(distance, node)`` ascending.
+
+    Distances are cosine distances (``1 - dot``) over unit vectors.
+    """
+    visited = set(entry)
+    distances = (1.0 - vectors[list(entry)] @ query).tolist()
+    candidates = list(zip(distances, entry, strict=True))
+    heapq.heapify(candidates)
+    results = [(-d, n) for d, n in candidates]
+    heapq.heapify(results)
+    while len(results) > ef:
+        heapq.heappop(results)
+
+    while candidates:
+        distance, node = heapq.heappop(candidates)
+        if distance > -results[0][0]:
+            break
+        fresh = [n for n in neighbors(node, level) if n not in visited]
+        if not fresh:
+            continue
+        visited.update(fresh)
+        for d, n in zip((1.0 - vectors[fresh] @ query).tolist(), fresh, strict=True):
+            if len(results) < ef or d < -results[0][0]:
+                heapq.heappush(candidates, (d, n))
+                heapq.heappush(results, (-d, n))
+                if len(results) > ef:
+                    heapq.heappop(results)
+    return sorted((-d, n) for d, n in results)
+
+
+def _search(
+    query: npt.NDArray[np.float32],
+    entry_point: int,
+    max_level: int,
+    k: int,
+    ef: int,
+    neighbors: NeighborFn,
+    vectors: npt.NDArray[Any],
+) -> list[tuple[float, int]]:
+    entry = [entry_point]
+    for level in range(max_level, 0, -1):
+        entry = [_search_layer(query, entry, 1, level, neighbors, vectors)[0][1]]
+    return _search_layer(query, entry, max(ef, k), 0, neighbors, vectors)[:k]
+
+
+class HNSWIndex:
+    """Mutable HNSW graph over unit-normalized vectors (cosine similarity).
+
+    Args:
+        dim: Vector dimensionality.
+        m: Links per node on upper layers; layer 0 keeps ``2 * m``.
+        ef_construction: Candidate list size while inserting.
+        seed: Seed for level assignment, for reproducible graphs.
+    """
+
+    def __init__(
+        self, dim: int, *, m: int = 16, ef_construction: int = 100, seed: int | None = None
+    ) -> None:
+        if dim < 1 or m < 2:
+            raise ValueError("require dim >= 1 and m >= 2")
+        self.dim = dim
+        self.m = m
+        self.m0 = 2 * m
+        self.ef_construction = ef_construction
+        self._level_mult = 1 / math.log(m)
+        self._rng = random.Random(seed)
+        self._vectors = np.zeros((16, dim), dtype=np.float32)
+        self._keys = KeyList()
+        self._links: list[list[list[int]]] = []
+        self.entry_point: int | None = None
+        self.max_level = -1
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._keys
+
+    @property
+    def vectors(self) -> npt.NDArray[np.float32]:
+        return self._vectors[: len(self._keys)]
+
+    def _neighbors(self, node: int, level: int) -> list[int]:
+        return self._links[node][level]
+
+    def _random_level(self) -> int:
+        return int(-math.log(1.0 - self._rng.random()) * self._level_mult)
+
+    def _connect(self, node: int, level: int, candidates: list[tuple[float, int]]) -> None:
+        selected = [n for _, n in candidates[: self.m]]
+        self._links[node][level] = selected
+        limit = self.m0 if level == 0 else self.m
+        for other in selected:
+            links = self._links[other][level]
+            links.append(node)
+            if len(links) > limit:
+                scores = self._vectors[links] @ self._vectors[other]
+                keep = np.argsort(-scores)[:limit]
+                self._links[other][level] = [links[i] for i in keep]
+
+    def add(self, key: str, vector: npt.ArrayLike) -> None:
+        """Insert one vector under ``key``.
+
+        Raises:
+            ValueError: If ``key`` is already indexed or the dimension is wrong.
+        """
+        if key in self._keys:
+            raise ValueError(f"{key!r} is already indexed")
+        unit = normalize_rows(vector)[0]
+        if unit.shape[0] != self.dim:
+            raise ValueError(f"expected dimension {self.dim}, got {unit.shape[0]}")
+        node = len(self._keys)
+        if node == len(self._vectors):
+            self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+        self._vectors[node] = unit
+        self._keys.append(key)
+        level = self._random_level()
+        self._links.append([[] for _ in range(level + 1)])
+
+        if self.entry_point is None:
+            self.entry_point, self.max_level = node, level
+            return
+        vectors = self.vectors
+        entry = [self.entry_point]
+        for layer in range(self.max_level, level, -1):
+            entry = [_search_layer(unit, entry, 1, layer, self._neighbors, vectors)[0][1]]
+        for layer in range(min(level, self.max_level), -1, -1):
+            found = _search_layer(
+                unit, entry, self.ef_construction, layer, self._neighbors, vectors
+            )
+            self._connect(node, layer, found)
+            entry = [n for _, n in found]
+        if level > self.max_level:
+            self.entry_point, self.max_level = node, level
+
+    def add_many(self, keys: Iterable[str], vectors: npt.ArrayLike) -> None:
+        for key, vector in zip(keys, np.atleast_2d(np.asarray(vectors)), strict=True):
+            self.add(key, vector)
+
+    def search(self, queries: npt.ArrayLike, k: int = 10, *, ef: int = 50) -> list[list[Neighbor]]:
+        """Return the top-``k`` ``(key, cosine similarity)`` pairs per query row."""
+        if self.entry_point is None:
+            return [[] for _ in np.atleast_2d(np.asarray(queries))]
+        vectors = self.vectors
+        return [
+            [
+                (self._keys[n], 1.0 - d)
+                for d, n in _search(
+                    q, self.entry_point, self.max_level, k, ef, self._neighbors, vectors
+                )
+            ]
+            for q in normalize_rows(queries)
+        ]
+
+    def save(self, path: str | os.PathLike[str]) -> None:
+        """Atomically write a snapshot readable by :class:`MappedHNSW`."""
+        n = len(self._keys)
+        levels = np.array([len(links) - 1 for links in self._links], dtype=np.int8)
+        layer0 = np.full((n, self.m0), -1, dtype=np.int32)
+        upper_index = np.full(n, -1, dtype=np.int64)
+        upper_rows: list[list[int]] = []
+        for node, links in enumerate(self._links):
+            layer0[node, : len(links[0])] = links[0]
+            if len(links) > 1:
+                upper_index[node] = len(upper_rows)
+                upper_rows.extend(links[1:])
+        upper = np.full((len(upper_rows), self.m), -1, dtype=np.int32)
+        for row, row_links in enumerate(upper_rows):
+            upper[row, : len(row_links)] = row_links
+
+        sections: dict[str, npt.NDArray[Any]] = {
+            "vectors": self.vectors.astype(np.float16),
+            "levels": levels,
+            "layer0": layer0,
+            "upper_index": upper_index,
+            "upper": upper,
+            **key_sections(self._keys),
+        }
+        header = {
+            "dim": self.dim,
+            "m": self.m,
+            "m0": self.m0,
+            "ef_construction": self.ef_construction,
+            "entry_point": self.entry_point,
+            "max_level": self.max_level,
+        }
+        write_snapshot(path, MAGIC, FORMAT_VERSION, header, sections)
+
+    @classmethod
+    def load(cls, path: str | os.PathLike[str], *, seed: int | None = None) -> HNSWIndex:
+        """Load a snapshot into a mutable index to continue inserting."""
+        mapped = MappedHNSW(path)
+        index = cls(mapped.dim, m=mapped.m, ef_construction=mapped.ef_construction, seed=seed)
+        n = len(mapped)
+        index._vectors = np.array(mapped.vectors, dtype=np.float32).reshape(n, mapped.dim)
+        if n == 0:
+            index._vectors = np.zeros((16, mapped.dim), dtype=np.float32)
+        index._keys = KeyList(mapped.keys)
+        index._links = [
+            [mapped.neighbors(node, level) for level in range(int(mapped.levels[node]) + 1)]
+            for node in range(n)
+        ]
+        index.entry_point = mapped.entry_point
+        index.max_level = mapped.max_level
+        return index
+
+
+class MappedHNSW:
+    """Read-only HNSW snapshot backed by a memory-mapped file."""
+
+    def __init__(self, path: str | os.PathLike[str]) -> None:
+        self.path = Path(path)
+        self._open()
+
+    def _open(self) -> None:
+        stat = os.stat(self.path)
+        self._identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        snapshot = Snapshot(self.path, magic=MAGIC, version=FORMAT_VERSION, kind="index")
+        header, section = snapshot.header, snapshot.section
+        self._mmap = snapshot.mmap
+        self.dim: int = header["dim"]
+        self.m: int = header["m"]
+        self.ef_construction: int = header["ef_construction"]
+        self.entry_point: int | None = header["entry_point"]
+        self.max_level: int = header["max_level"]
+        self.keys = MappedKeys.from_sections(section)
+        self.vectors = section("vectors")
+        self.levels = section("levels")
+        self._layer0 = section("layer0")
+        self._upper_index = section("upper_index")
+        self._upper = section("upper")
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def neighbors(self, node: int, level: int) -> list[int]:
+        if level == 0:
+            row = self._layer0[node]
+        else:
+            row = self._upper[self._upper_index[node] + level - 1]
+        return [n for n in row.tolist() if n >= 0]
+
+    def refresh(self) -> bool:
+        """Re-map the file if a new snapshot was swapped in. Returns ``True`` if so."""
+        stat = os.stat(self.path)
+        if (stat.st_ino, stat.st_mtime_ns, stat.st_size) == self._identity:
+            return False
+        self._open()
+        return True
+
+    def search(self, queries: npt.ArrayLike, k: int = 10, *, ef: int = 50) -> list[list[Neighbor]]:
+        """Return the top-``k`` ``(key, cosine similarity)`` pairs per query row."""
+        if self.entry_point is None:
+            return [[] for _ in np.atleast_2d(np.asarray(queries))]
+        return [
+            [
+                (self.keys[n], 1.0 - d)
+                for d, n in _search(
+                    q,
+                    self.entry_point,
+                    self.max_level,
+                    k,
+                    ef,
+                    self.neighbors,
+                    self.vectors,
+                )
+            ]
+            for q in normalize_rows(queries)
+        ]
@@ -0,0 +1,146 @@
+"""Memory-mapped key sections for the vector snapshot formats.
+
+Snapshots hold millions of deal keys. Stored as a JSON list in the header
+they cost a full parse and a Python string per key on every open, in every
+worker. They are written as sections like the vectors instead: the UTF-8
+bytes of every key concatenated, each key's end offset, and 64-bit key
+hashes sorted alongside the positions they belong to. :class:`MappedKeys`
+decodes a key only when it is read and finds a key's position by binary
+search over the hashes, so opening a snapshot touches none of them.
+
+Sections (integers little-endian)::
+
+    key_bytes uint8 (total bytes) | key_ends int64 (n) |
+    key_hashes uint64 (n), sorted | key_order int64 (n)
+"""
+
+from __future__ import annotations
+
+import hashlib
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from typing import Any, overload
+
+import numpy as np
+import numpy.typing as npt
+
+SECTIONS = ("key_bytes", "key_ends", "key_hashes", "key_order")
+
+
+def _hash(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+def key_sections(keys: Iterable[str]) -> dict[str, npt.NDArray[Any]]:
+    """Encode ``keys`` as the arrays :class:`MappedKeys` reads back."""
+    encoded = [key.encode() for key in keys]
+    hashes = np.fromiter((_hash(data) for data in encoded), dtype=np.uint64, count=len(encoded))
+    order = np.argsort(hashes, kind="stable")
+    return {
+        "key_bytes": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        "key_ends": np.cumsum([len(data) for data in encoded], dtype=np.int64),
+        "key_hashes": hashes[order],
+        "key_order": order.astype(np.int64),
+    }
+
+
+class MappedKeys(Sequence[str]):
+    """Read-only keys over the arrays written by :func:`key_sections`."""
+
+    def __init__(
+        self,
+        data: npt.NDArray[np.uint8],
+        ends: npt.NDArray[np.int64],
+        hashes: npt.NDArray[np.uint64],
+        order: npt.NDArray[np.int64],
+    ) -> None:
+        self._data = data
+        self._ends = ends
+        self._hashes = hashes
+        self._order = order
+
+    @classmethod
+    def from_sections(cls, section: Callable[[str], npt.NDArray[Any]]) -> MappedKeys:
+        """Build from a snapshot's section reader."""
+        return cls(*(section(name) for name in SECTIONS))
+
+    def __len__(self) -> int:
+        return len(self._ends)
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[str]: ...
+
+    def __getitem__(self, index: int | slice) -> str | list[str]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("key index out of range")
+        start = int(self._ends[index - 1]) if index else 0
+        return self._data[start : int(self._ends[index])].tobytes().decode()
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and self.position(key) is not None
+
+    def position(self, key: str) -> int | None:
+        """Index of ``key``, or ``None`` if it is not present."""
+        digest = np.uint64(_hash(key.encode()))
+        slot = int(np.searchsorted(self._hashes, digest))
+        while slot < len(self._hashes) and self._hashes[slot] == digest:
+            index = int(self._order[slot])
+            if self[index] == key:
+                return index
+            slot += 1
+        return None
+
+
+class KeyList(Sequence[str]):
+    """Appendable keys, optionally continuing from a :class:`MappedKeys` base.
+
+    Keys loaded from a snapshot stay memory-mapped; only keys appended
+    since are held as Python strings.
+    """
+
+    def __init__(self, base: MappedKeys | None = None) -> None:
+        self._base: Sequence[str] = base if base is not None else ()
+        self._lookup = base
+        self._added: list[str] = []
+        self._positions: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._base) + len(self._added)
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[str]: ...
+
+    def __getitem__(self, index: int | slice) -> str | list[str]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        base = len(self._base)
+        return self._base[index] if index < base else self._added[index - base]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._base
+        yield from self._added
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and self.position(key) is not None
+
+    def position(self, key: str) -> int | None:
+        """Index of ``key``, or ``None`` if it is not present."""
+        position = self._positions.get(key)
+        if position is None and self._lookup is not None:
+            position = self._lookup.position(key)
+        return position
+
+    def append(self, key: str) -> None:
+        self._positions[key] = len(self)
+        self._added.append(key)
@@ -0,0 +1,301 @@
+"""Product-quantized embedding store for the historical deal catalog.
+
+Full float32 embeddings for millions of deals do not fit in a worker, so
+:class:`ProductQuantizer` splits each unit vector into ``subspaces`` chunks
+and replaces every chunk with the index of its nearest k-means centroid,
+giving a ``subspaces``-byte code (a 384-dim float32 embedding is 1536 bytes;
+a 16-byte code is 96x smaller). :class:`PQStore` answers top-k queries with
+asymmetric distance computation: per query it builds a small
+``(subspaces, 256)`` table of query-to-centroid dot products, and scoring a
+code is then ``subspaces`` table lookups. Codes are kept column-major so
+each lookup pass reads a contiguous array.
+
+PQ scores are approximate. When the store keeps the original vectors (as
+float16, memory-mapped after :meth:`PQStore.load`, so only touched rows are
+paged in) ``search(..., rerank=n)`` re-scores an ``n``-candidate shortlist
+exactly.
+
+File layout (a :mod:`dealfinder.vectors.snapshot`; sections 64-byte aligned)::
+
+    b"DFPQ" | uint32 version | uint64 header length | JSON header |
+    codebooks float32 (subspaces, 2**bits, dim/subspaces) |
+    codes uint8 (subspaces, n) | [vectors float16 (n, dim)] | key sections
+
+The keys are stored in the sections described in :mod:`dealfinder.vectors.keys`,
+so a loaded store decodes a key only when a search returns it.
+"""
+
+from __future__ import annotations
+
+import os
+from collections.abc import Iterable
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+
+from dealfinder.embeddings import normalize_rows
+from dealfinder.vectors.keys import KeyList, MappedKeys, key_sections
+from dealfinder.vectors.snapshot import Snapshot, write_snapshot
+
+MAGIC = b"DFPQ"
+FORMAT_VERSION = 2
+
+Neighbor = tuple[str, float]
+Codes = npt.NDArray[np.uint8]
+FloatArray = npt.NDArray[np.float32]
+
+
+def _kmeans(
+    points: FloatArray, clusters: int, iterations: int, rng: np.random.Generator
+) -> FloatArray:
+    """Lloyd's k-means; empty clusters are re-seeded from random points."""
+    centroids = points[rng.choice(len(points), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _nearest(points, centroids)
+        counts = np.bincount(assignment, minlength=clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, points)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = points[rng.choice(len(points), int(empty.sum()), replace=False)]
+    return centroids
+
+
+def _nearest(points: FloatArray, centroids: FloatArray) -> npt.NDArray[np.intp]:
+    """Index of the nearest centroid (squared L2) for each point."""
+    distances = (centroids**2).sum(axis=1) - 2.0 * points @ centroids.T
+    nearest: npt.NDArray[np.intp] = distances.argmin(axis=1)
+    return nearest
+
+
+class ProductQuantizer:
+    """Product-quantization codec for unit-normalized embeddings.
+
+    Args:
+        dim: Embedding dimensionality; must be divisible by ``subspaces``.
+        subspaces: Sub-vectors per embedding, i.e. bytes per code.
+        bits: Bits per sub-code; each subspace has ``2**bits`` centroids.
+    """
+
+    def __init__(self, dim: int, *, subspaces: int = 16, bits: int = 8) -> None:
+        if subspaces < 1 or dim % subspaces:
+            raise ValueError(f"dim {dim} is not divisible into {subspaces} subspaces")
+        if not 1 <= bits <= 8:
+            raise ValueError("bits must be between 1 and 8")
+        self.dim = dim
+        self.subspaces = subspaces
+        self.bits = bits
+        self.centroids = 1 << bits
+        self.sub_dim = dim // subspaces
+        self.codebooks: FloatArray | None = None
+
+    @property
+    def trained(self) -> bool:
+        return self.codebooks is not None
+
+    def _split(self, vectors: npt.ArrayLike) -> FloatArray:
+        """Normalize and reshape to ``(subspaces, n, sub_dim)``."""
+        matrix = normalize_rows(vectors)
+        if matrix.shape[1] != self.dim:
+            raise ValueError(f"expected {self.dim}-dim vectors, got {matrix.shape[1]}")
+        return matrix.reshape(len(matrix), self.subspaces, self.sub_dim).transpose(1, 0, 2)
+
+    def _codebooks(self) -> FloatArray:
+        if self.codebooks is None:
+            raise RuntimeError("quantizer has not been trained")
+        return self.codebooks
+
+    def fit(
+        self, sample: npt.ArrayLike, *, iterations: int = 20, seed: int | None = None
+    ) -> ProductQuantizer:
+        """Train one k-means codebook per subspace on a sample of embeddings."""
+        parts = self._split(sample)
+        if parts.shape[1] < self.centroids:
+            raise ValueError(f"need at least {self.centroids} training vectors")
+        rng = np.random.default_rng(seed)
+        self.codebooks = np.stack(
+            [_kmeans(part, self.centroids, iterations, rng) for part in parts]
+        ).astype(np.float32)
+        return self
+
+    def encode(self, vectors: npt.ArrayLike) -> Codes:
+        """Encode vectors into ``(n, subspaces)`` uint8 codes."""
+        codebooks = self._codebooks()
+        parts = self._split(vectors)
+        return np.stack(
+            [_nearest(part, book) for part, book in zip(parts, codebooks, strict=True)], axis=1
+        ).astype(np.uint8)
+
+    def decode(self, codes: npt.ArrayLike) -> FloatArray:
+        """Reconstruct approximate vectors from ``(n, subspaces)`` codes."""
+        codebooks = self._codebooks()
+        codes = np.atleast_2d(np.asarray(codes, dtype=np.intp))
+        parts = [codebooks[j][codes[:, j]] for j in range(self.subspaces)]
+        return np.concatenate(parts, axis=1)
+
+    def tables(self, queries: npt.ArrayLike) -> FloatArray:
+        """Query-to-centroid dot products, shaped ``(n, subspaces, centroids)``."""
+        codebooks = self._codebooks()
+        parts = self._split(queries)
+        tables: FloatArray = np.einsum("snd,skd->nsk", parts, codebooks)
+        return tables
+
+
+class PQStore:
+    """Keyed store of PQ codes answering approximate top-k cosine queries.
+
+    Args:
+        quantizer: A trained :class:`ProductQuantizer`.
+        keep_vectors: Also keep float16 originals for exact re-ranking.
+    """
+
+    def __init__(self, quantizer: ProductQuantizer, *, keep_vectors: bool = False) -> None:
+        if not quantizer.trained:
+            raise ValueError("quantizer has not been trained")
+        self.quantizer = quantizer
+        self.keep_vectors = keep_vectors
+        self._keys = KeyList()
+        self._codes: Codes = np.zeros((quantizer.subspaces, 0), dtype=np.uint8)
+        self._vectors: npt.NDArray[np.float16] | None = (
+            np.zeros((0, quantizer.dim), dtype=np.float16) if keep_vectors else None
+        )
+        self._mmap: np.memmap[Any, Any] | None = None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._keys
+
+    @property
+    def codes(self) -> Codes:
+        """Codes for stored keys, shaped ``(n, subspaces)``."""
+        return self._codes[:, : len(self)].T
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by codes and (if kept) original vectors."""
+        size = len(self) * self.quantizer.subspaces
+        if self._vectors is not None:
+            size += len(self) * self.quantizer.dim * 2
+        return size
+
+    def _reserve(self, extra: int) -> None:
+        """Grow buffers geometrically; copies memory-mapped arrays on first write."""
+        n = len(self)
+        capacity = self._codes.shape[1]
+        if n + extra <= capacity and self._codes.flags.writeable:
+            return
+        capacity = max(n + extra, 2 * capacity, 1024)
+        codes = np.zeros((self.quantizer.subspaces, capacity), dtype=np.uint8)
+        codes[:, :n] = self._codes[:, :n]
+        self._codes = codes
+        if self._vectors is not None:
+            vectors = np.zeros((capacity, self.quantizer.dim), dtype=np.float16)
+            vectors[:n] = self._vectors[:n]
+            self._vectors = vectors
+
+    def add(self, keys: Iterable[str], vectors: npt.ArrayLike) -> None:
+        """Encode and append vectors; keys must be new."""
+        keys = list(keys)
+        matrix = normalize_rows(vectors)
+        if len(keys) != len(matrix):
+            raise ValueError("keys and vectors differ in length")
+        if len(set(keys)) != len(keys) or any(key in self._keys for key in keys):
+            raise ValueError("duplicate key")
+        if not keys:
+            return
+        codes = self.quantizer.encode(matrix)
+        self._reserve(len(keys))
+        start = len(self)
+        self._codes[:, start : start + len(keys)] = codes.T
+        if self._vectors is not None:
+            self._vectors[start : start + len(keys)] = matrix
+        for key in keys:
+            self._keys.append(key)
+
+    def scores(self, queries: npt.ArrayLike) -> FloatArray:
+        """Approximate cosine similarity of each query to every stored vector."""
+        tables = self.quantizer.tables(queries)
+        n = len(self)
+        codes = self._codes[:, :n]
+        scores = np.empty((len(tables), n), dtype=np.float32)
+        for row, table in zip(scores, tables, strict=True):
+            row[:] = table[0].take(codes[0])
+            for j in range(1, self.quantizer.subspaces):
+                row += table[j].take(codes[j])
+        return scores
+
+    def search(
+        self, queries: npt.ArrayLike, k: int = 10, *, rerank: int = 0, chunk_size: int = 32
+    ) -> list[list[Neighbor]]:
+        """Return the top-``k`` ``(key, similarity)`` pairs per query row.
+
+        With ``rerank`` > 0 the best ``max(k, rerank)`` PQ candidates are
+        re-scored against the stored originals, so similarities are exact.
+        """
+        if rerank and self._vectors is None:
+            raise ValueError("exact re-ranking requires keep_vectors=True")
+        matrix = normalize_rows(queries)
+        n = len(self)
+        if n == 0:
+            return [[] for _ in matrix]
+        shortlist = min(max(k, rerank), n)
+        results: list[list[Neighbor]] = []
+        for start in range(0, len(matrix), chunk_size):
+            block = matrix[start : start + chunk_size]
+            scores = self.scores(block)
+            if shortlist < n:
+                candidates = np.argpartition(-scores, shortlist - 1, axis=1)[:, :shortlist]
+            else:
+                candidates = np.broadcast_to(np.arange(n), (len(block), n))
+            if rerank and self._vectors is not None:
+                exact = np.einsum("qcd,qd->qc", self._vectors[candidates].astype(np.float32), block)
+            else:
+                exact = np.take_along_axis(scores, candidates, axis=1)
+            order = np.argsort(-exact, axis=1, kind="stable")[:, :k]
+            for rows, sims in zip(
+                np.take_along_axis(candidates, order, axis=1),
+                np.take_along_axis(exact, order, axis=1),
+                strict=True,
+            ):
+                results.append(
+                    [(self._keys[i], s) for i, s in zip(rows.tolist(), sims.tolist(), strict=True)]
+                )
+        return results
+
+    def save(self, path: str | os.PathLike[str]) -> None:
+        """Atomically write the codebooks, codes and (if kept) vectors."""
+        n = len(self)
+        sections: dict[str, npt.NDArray[Any]] = {
+            "codebooks": self.quantizer._codebooks(),
+            "codes": np.ascontiguousarray(self._codes[:, :n]),
+        }
+        if self._vectors is not None:
+            sections["vectors"] = self._vectors[:n]
+        sections.update(key_sections(self._keys))
+        header = {
+            "dim": self.quantizer.dim,
+            "subspaces": self.quantizer.subspaces,
+            "bits": self.quantizer.bits,
+        }
+        write_snapshot(path, MAGIC, FORMAT_VERSION, header, sections)
+
+    @classmethod
+    def load(cls, path: str | os.PathLike[str]) -> PQStore:
+        """Open a saved store with codes and vectors memory-mapped read-only."""
+        snapshot = Snapshot(path, magic=MAGIC, version=FORMAT_VERSION, kind="store")
+        header, section = snapshot.header, snapshot.section
+        quantizer = ProductQuantizer(
+            header["dim"], subspaces=header["subspaces"], bits=header["bits"]
+        )
+        quantizer.codebooks = np.array(section("codebooks"), dtype=np.float32)
+        store = cls(quantizer, keep_vectors="vectors" in snapshot)
+        store._keys = KeyList(MappedKeys.from_sections(section))
+        store._codes = section("codes")
+        if store.keep_vectors:
+            store._vectors = section("vectors")
+        store._mmap = snapshot.mmap
+        return store
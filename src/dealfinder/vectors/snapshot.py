@@ -0,0 +1,119 @@
+"""Memory-mappable snapshot files shared by the model and vector formats.
+
+The neural weight file, the HNSW index and the PQ store all use one
+layout, differing only in their magic bytes, header fields and sections::
+
+    magic (4 bytes) | uint32 format version | uint64 header length |
+    JSON header | zero padding | sections, each 64-byte aligned
+
+The header's ``"sections"`` maps each section name to its dtype, shape and
+offset from the end of the padded header. :func:`write_snapshot` writes a
+temporary file, fsyncs it and renames it into place, so readers never map
+a partial file, and leaves it world-readable so every worker can map the
+one copy. :class:`Snapshot` maps it read-only and returns sections as views.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import struct
+import tempfile
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+
+ALIGNMENT = 64
+FILE_MODE = 0o644
+_PREAMBLE = struct.Struct("<4sIQ")
+
+
+def align(offset: int) -> int:
+    """Round ``offset`` up to the section alignment."""
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_snapshot(
+    path: str | os.PathLike[str],
+    magic: bytes,
+    version: int,
+    header: Mapping[str, Any],
+    sections: Mapping[str, npt.NDArray[Any]],
+) -> None:
+    """Atomically write ``sections`` after ``header`` to ``path``.
+
+    Args:
+        path: Destination file.
+        magic: Four bytes identifying the format.
+        version: Format version, checked by :class:`Snapshot`.
+        header: JSON-serializable fields; ``"sections"`` is added.
+        sections: Arrays to store, in file order.
+    """
+    layout: dict[str, dict[str, Any]] = {}
+    offset = 0
+    for name, array in sections.items():
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = align(offset + array.nbytes)
+    encoded = json.dumps({**header, "sections": layout}).encode()
+    data_start = align(_PREAMBLE.size + len(encoded))
+
+    target = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(_PREAMBLE.pack(magic, version, len(encoded)))
+            fh.write(encoded)
+            for name, array in sections.items():
+                fh.seek(data_start + layout[name]["offset"])
+                fh.write(np.ascontiguousarray(array).tobytes())
+            fh.truncate(data_start + offset)
+            fh.flush()
+            # mkstemp creates the file 0600, readable only by the writer.
+            os.fchmod(fh.fileno(), FILE_MODE)
+            os.fsync(fh.fileno())
+        os.replace(tmp, target)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class Snapshot:
+    """A snapshot file memory-mapped read-only.
+
+    Args:
+        path: File written by :func:`write_snapshot`.
+        magic: Expected magic bytes.
+        version: Expected format version.
+        kind: What the file holds, for the error message.
+
+    Raises:
+        ValueError: If the file is not that format and version.
+    """
+
+    def __init__(
+        self, path: str | os.PathLike[str], *, magic: bytes, version: int, kind: str
+    ) -> None:
+        self.path = Path(path)
+        self.mmap = np.memmap(self.path, dtype=np.uint8, mode="r")
+        found, found_version, header_len = _PREAMBLE.unpack_from(self.mmap, 0)
+        if found != magic or found_version != version:
+            raise ValueError(f"{self.path} is not a version {version} {magic.decode()} {kind}")
+        self.header: dict[str, Any] = json.loads(
+            bytes(self.mmap[_PREAMBLE.size : _PREAMBLE.size + header_len])
+        )
+        self._data_start = align(_PREAMBLE.size + header_len)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.header["sections"]
+
+    def section(self, name: str) -> npt.NDArray[Any]:
+        """Read-only view of one section."""
+        spec = self.header["sections"][name]
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        start = self._data_start + spec["offset"]
+        array: npt.NDArray[Any] = self.mmap[start : start + count * dtype.itemsize].view(dtype)
+        return array.reshape(spec["shape"])
@@ -0,0 +1,12 @@
+"""
+Fixtures shared by the unit tests.
+"""
+
+import fakeredis
+import pytest
+
+
+@pytest.fixture
+def redis():
+    """In-memory async Redis."""
+    return fakeredis.FakeAsyncRedis()
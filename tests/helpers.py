@@ -0,0 +1,58 @@
+"""
+Helpers shared by the unit tests.
+"""
+
+import asyncio
+
+
+class FakeClock:
+    """Manually advanced clock."""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class DroppingRedis:
+    """Wraps a fake Redis so its first pub/sub connection fails while listening.
+
+    ``delay`` is how long the first connection listens before it drops.
+    """
+
+    def __init__(self, redis, delay=0.0):
+        self.redis = redis
+        self.delay = delay
+        self.pubsubs = 0
+
+    def pubsub(self, **kwargs):
+        self.pubsubs += 1
+        pubsub = self.redis.pubsub(**kwargs)
+        if self.pubsubs == 1:
+
+            async def listen():
+                await asyncio.sleep(self.delay)
+                raise ConnectionError("Connection reset by peer")
+                yield
+
+            pubsub.listen = listen
+        return pubsub
+
+    def __getattr__(self, name):
+        return getattr(self.redis, name)
+
+
+async def settle():
+    """Let background tasks run."""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def wait_for(condition, attempts=100):
+    """Poll an async condition until it holds."""
+    for _ in range(attempts):
+        if await condition():
+            return True
+        await asyncio.sleep(0.01)
+    return False
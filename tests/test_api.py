@@ -0,0 +1,545 @@
+"""
+Unit tests for the API support layer.
+"""
+
+import asyncio
+import json
+
+import fakeredis
+import httpx
+import pytest
+from fastapi import FastAPI, Header, Response
+from fastapi.testclient import TestClient
+from helpers import DroppingRedis, FakeClock, settle, wait_for
+
+from dealfinder.api import (
+    AdaptiveConcurrencyMiddleware,
+    ConcurrencyLimiter,
+    GradientLimit,
+    ResponseCache,
+    StreamHub,
+    deals_router,
+    etag_matches,
+    render_page,
+    stream_router,
+)
+from dealfinder.api.cache import _Entry
+from dealfinder.feeds import FeedStore
+from dealfinder.schemas import Deal, PricedDeal
+
+
+class CountingLoader:
+    """Async loader returning successive versions and counting calls."""
+
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {"version": self.calls}
+
+
+class TestResponseCache:
+    """Test tiering, coalescing, early refresh and invalidation."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_share_one_load(self, redis):
+        """A burst of misses for one key should call the loader once."""
+        cache = ResponseCache(redis, beta=0)
+        loader = CountingLoader(delay=0.01)
+        results = await asyncio.gather(*(cache.get("deals:u1:v1", loader) for _ in range(50)))
+        assert loader.calls == 1
+        assert results == [{"version": 1}] * 50
+        assert cache.misses == 50
+
+    @pytest.mark.asyncio
+    async def test_l1_then_redis_tiers(self, redis):
+        """Reads should come from the LRU, then Redis once the LRU entry ages out."""
+        clock = FakeClock()
+        cache = ResponseCache(redis, l1_ttl=5, beta=0, clock=clock)
+        loader = CountingLoader()
+        await cache.get("k", loader)
+        await cache.get("k", loader)
+        clock.now += 6
+        assert await cache.get("k", loader) == {"version": 1}
+        assert (cache.l1_hits, cache.redis_hits, loader.calls) == (1, 1, 1)
+
+        other = ResponseCache(redis, beta=0, clock=clock)
+        assert await other.get("k", loader) == {"version": 1}
+        assert loader.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_stale_while_revalidate(self, redis):
+        """An expired entry should be served while one refresh runs behind it."""
+        clock = FakeClock()
+        cache = ResponseCache(redis, ttl=60, stale_ttl=300, beta=0, clock=clock)
+        loader = CountingLoader()
+        await cache.get("k", loader)
+        clock.now += 61
+        assert await cache.get("k", loader) == {"version": 1}
+        assert await cache.get("k", loader) == {"version": 1}
+        await settle()
+        assert loader.calls == 2 and cache.stale_hits == 2
+        assert await cache.get("k", loader) == {"version": 2}
+
+    @pytest.mark.asyncio
+    async def test_early_refresh_probability_rises_near_expiry(self, redis):
+        """XFetch should rarely refresh a young entry and usually refresh an old one."""
+        clock = FakeClock()
+        cache = ResponseCache(redis, ttl=60, beta=1.0, seed=1, clock=clock)
+        entry = _Entry({}, created=clock.now, delta=2.0)
+        young = sum(cache._refresh_early(entry, clock.now + 10) for _ in range(1000))
+        old = sum(cache._refresh_early(entry, clock.now + 58) for _ in range(1000))
+        assert young == 0 and 300 < old < 450
+
+    @pytest.mark.asyncio
+    async def test_invalidation_reaches_other_instances(self, redis):
+        """Invalidating on one instance should clear the LRU of every instance."""
+        server = fakeredis.FakeServer()
+        caches = [ResponseCache(fakeredis.FakeAsyncRedis(server=server), beta=0) for _ in range(2)]
+        loader = CountingLoader()
+        for cache in caches:
+            await cache.start()
+            await cache.get("k", loader)
+        assert loader.calls == 1
+
+        await caches[0].invalidate(["k"])
+        for _ in range(50):
+            if "k" not in caches[1]._l1:
+                break
+            await asyncio.sleep(0.01)
+        assert await caches[1].get("k", loader) == {"version": 2}
+        for cache in caches:
+            await cache.aclose()
+
+    @pytest.mark.asyncio
+    async def test_invalidation_discards_in_flight_load(self, redis):
+        """A load that started before an invalidation must not repopulate the cache."""
+        cache = ResponseCache(redis, beta=0)
+        loader = CountingLoader(delay=0.01)
+        pending = asyncio.create_task(cache.get("k", loader))
+        await asyncio.sleep(0.005)
+        await cache.invalidate(["k"])
+        assert await pending == {"version": 1}
+        assert await redis.get("api:k") is None
+        assert await cache.get("k", loader) == {"version": 2}
+
+    @pytest.mark.asyncio
+    async def test_invalidating_other_keys_keeps_in_flight_load(self, redis):
+        """Only invalidating the loading key itself should discard its result."""
+        cache = ResponseCache(redis, beta=0)
+        pending = asyncio.create_task(cache.get("k", CountingLoader(delay=0.01)))
+        await asyncio.sleep(0.005)
+        await cache.invalidate(["other"])
+        assert await pending == {"version": 1}
+        assert await redis.get("api:k") is not None
+        assert cache._generations == {}
+
+    @pytest.mark.asyncio
+    async def test_listener_reconnects_and_clears_lru(self, redis, caplog):
+        """A dropped subscription should reconnect and forget possibly stale LRU entries."""
+        server = fakeredis.FakeServer()
+        flaky = DroppingRedis(fakeredis.FakeAsyncRedis(server=server), delay=0.02)
+        caches = [ResponseCache(fakeredis.FakeAsyncRedis(server=server), beta=0)]
+        caches.append(ResponseCache(flaky, beta=0))
+        loader = CountingLoader()
+        for cache in caches:
+            await cache.start()
+        await caches[1].get("k", loader)
+        assert "k" in caches[1]._l1
+
+        async def reconnected():
+            return caches[1]._relay.reconnects == 1
+
+        assert await wait_for(reconnected)
+        assert "k" not in caches[1]._l1 and "subscription lost" in caplog.text
+
+        await caches[1].get("k", loader)
+        await caches[0].invalidate(["k"])
+
+        async def dropped():
+            return "k" not in caches[1]._l1
+
+        assert await wait_for(dropped)
+        for cache in caches:
+            await cache.aclose()
+
+    @pytest.mark.asyncio
+    async def test_loader_failure_propagates_and_is_not_cached(self, redis):
+        """A failed load should raise for its waiters and leave the key empty."""
+        cache = ResponseCache(redis)
+
+        async def failing():
+            raise ConnectionError("opensearch down")
+
+        with pytest.raises(ConnectionError):
+            await cache.get("k", failing)
+        assert await cache.get("k", CountingLoader()) == {"version": 1}
+
+
+def priced(deal_id, discount):
+    """An opportunity with the given dollar discount."""
+    deal = Deal(id=deal_id, title=f"Deal {deal_id}", price=100.0)
+    return PricedDeal(deal=deal, estimate=100.0 + discount, discount=discount, is_opportunity=True)
+
+
+def current_user(x_user_id: str = Header()):
+    """Stand-in for the JWT-derived user dependency."""
+    return x_user_id
+
+
+class TestDealsEndpoint:
+    """Test pre-serialized feed pages and conditional requests."""
+
+    @pytest.fixture
+    def client(self):
+        """A test client over a feed with three deals for u1."""
+        store = FeedStore(fakeredis.FakeAsyncRedis())
+        app = FastAPI()
+        app.include_router(deals_router(store, current_user))
+        with TestClient(app, headers={"X-User-Id": "u1"}) as client:
+            for deal_id, discount in [("a", 60.0), ("b", 90.0), ("c", 75.0)]:
+                client.portal.call(store.publish, priced(deal_id, discount), ["u1"])
+            client.store = store
+            yield client
+
+    def test_page_is_stitched_from_stored_bytes(self, client):
+        """The response should be the stored JSON bodies joined into a page."""
+        response = client.get("/api/v1/deals", params={"limit": 2})
+        assert response.status_code == 200
+        body = response.json()
+        assert [item["deal"]["id"] for item in body["items"]] == ["b", "c"]
+        assert body["items"][0] == json.loads(priced("b", 90.0).model_dump_json())
+        assert response.headers["cache-control"] == "private, no-cache"
+
+        following = client.get("/api/v1/deals", params={"cursor": body["next_cursor"]})
+        assert [item["deal"]["id"] for item in following.json()["items"]] == ["a"]
+        assert following.json()["next_cursor"] is None
+
+    def test_if_none_match_returns_304_until_feed_changes(self, client):
+        """An unchanged page should revalidate with an empty 304."""
+        etag = client.get("/api/v1/deals").headers["etag"]
+        unchanged = client.get("/api/v1/deals", headers={"If-None-Match": etag})
+        assert unchanged.status_code == 304 and unchanged.content == b""
+        assert unchanged.headers["etag"] == etag
+
+        client.portal.call(client.store.publish, priced("d", 99.0), ["u1"])
+        changed = client.get("/api/v1/deals", headers={"If-None-Match": etag})
+        assert changed.status_code == 200 and changed.headers["etag"] != etag
+
+    def test_bad_cursor_is_rejected(self, client):
+        """A malformed cursor should be a client error."""
+        assert client.get("/api/v1/deals", params={"cursor": "!!"}).status_code == 400
+
+    def test_etag_matching(self):
+        """If-None-Match should accept lists, weak tags and the wildcard."""
+        assert etag_matches('"x", W/"abc"', '"abc"')
+        assert etag_matches("*", '"abc"')
+        assert not etag_matches('"abd"', '"abc"')
+        assert not etag_matches(None, '"abc"')
+        assert render_page([b"{}", b"[]"], None) == b'{"items":[{},[]],"next_cursor":null}'
+
+
+async def take(stream, count):
+    """The next ``count`` chunks of a stream."""
+    return [await anext(stream) for _ in range(count)]
+
+
+class TestStreamHub:
+    """Test routing, replay and slow-consumer handling of the stream hub."""
+
+    @pytest.mark.asyncio
+    async def test_events_reach_only_matched_users(self):
+        """Live events should be written to connected clients of matched users."""
+        hub = StreamHub()
+        u1, u2 = hub.stream("u1", "ndjson"), hub.stream("u2", "ndjson")
+        pending = [asyncio.create_task(anext(s)) for s in (u1, u2)]
+        await asyncio.sleep(0)
+        event_id = await hub.publish(priced("a", 60.0), ["u1"])
+        line = json.loads(await pending[0])
+        assert line["id"] == event_id and line["deal"]["deal"]["id"] == "a"
+        assert not pending[1].done()
+        pending[1].cancel()
+        await asyncio.gather(pending[1], return_exceptions=True)
+        await u1.aclose()
+        assert len(hub) == 0
+
+    @pytest.mark.asyncio
+    async def test_resume_replays_missed_events(self):
+        """A client resuming from an ID should get what it missed, then live events."""
+        hub = StreamHub()
+        for deal_id in "abc":
+            await hub.publish(priced(deal_id, 60.0), ["u1", "u2"])
+        await hub.publish(priced("other", 60.0), ["u2"])
+        stream = hub.stream("u1", "sse", last_event_id=1)
+        chunks = await take(stream, 3)
+        assert chunks[0] == b"retry: 3000\n\n"
+        assert [chunk.split(b"\n")[0] for chunk in chunks[1:]] == [b"id: 2", b"id: 3"]
+        live = asyncio.create_task(anext(stream))
+        await asyncio.sleep(0)
+        await hub.publish(priced("d", 60.0), ["u1"])
+        assert (await live).startswith(b"id: 5\nevent: deal\ndata: {")
+        await stream.aclose()
+
+    @pytest.mark.asyncio
+    async def test_resume_past_replay_buffer_signals_reset(self):
+        """A client whose cursor fell out of the buffer should be told to reload."""
+        hub = StreamHub(replay_size=2)
+        for deal_id in "abcd":
+            await hub.publish(priced(deal_id, 60.0), ["u1"])
+        stream = hub.stream("u1", "ndjson", last_event_id=0)
+        chunks = await take(stream, 3)
+        assert chunks[0] == b'{"reset":true}\n'
+        assert [json.loads(chunk)["id"] for chunk in chunks[1:]] == [3, 4]
+        await stream.aclose()
+
+    @pytest.mark.asyncio
+    async def test_slow_consumer_is_disconnected(self):
+        """A client that falls too far behind should be ended so it can resume."""
+        hub = StreamHub(max_queue=2)
+        stream = hub.stream("u1", "ndjson")
+        waiting = asyncio.create_task(anext(stream))
+        await asyncio.sleep(0)
+        for deal_id in "abcd":
+            await hub.publish(priced(deal_id, 60.0), ["u1"])
+        chunks = [await waiting] + [chunk async for chunk in stream]
+        assert [json.loads(chunk)["id"] for chunk in chunks] == [1, 2]
+        assert hub.disconnected == 1 and len(hub) == 0
+
+    @pytest.mark.asyncio
+    async def test_instances_share_events_through_redis(self):
+        """Events published on one instance should stream from another."""
+        server = fakeredis.FakeServer()
+        hubs = [StreamHub(fakeredis.FakeAsyncRedis(server=server)) for _ in range(2)]
+        for hub in hubs:
+            await hub.start()
+        stream = hubs[1].stream("u1", "ndjson")
+        pending = asyncio.create_task(anext(stream))
+        await asyncio.sleep(0)
+        event_id = await hubs[0].publish(priced("a", 60.0), ["u1"])
+        line = json.loads(await asyncio.wait_for(pending, 1))
+        assert line["id"] == event_id == 1
+        await stream.aclose()
+        for hub in hubs:
+            await hub.aclose()
+
+    @pytest.mark.asyncio
+    async def test_resume_on_instance_with_empty_buffer_signals_reset(self):
+        """An instance that never saw the missed events should not skip them silently."""
+        server = fakeredis.FakeServer()
+        publisher = StreamHub(fakeredis.FakeAsyncRedis(server=server))
+        for deal_id in "ab":
+            await publisher.publish(priced(deal_id, 60.0), ["u1"])
+        hub = StreamHub(fakeredis.FakeAsyncRedis(server=server), heartbeat=0.01)
+        await hub.start()
+
+        behind = hub.stream("u1", "ndjson", last_event_id=1)
+        assert await anext(behind) == b'{"reset":true}\n'
+        await behind.aclose()
+        current = hub.stream("u1", "ndjson", last_event_id=2)
+        assert await anext(current) == b"\n"
+        await current.aclose()
+        await hub.aclose()
+
+    @pytest.mark.asyncio
+    async def test_upstream_reconnect_resets_clients(self, caplog):
+        """Clients should be told to reload after the upstream subscription drops."""
+        server = fakeredis.FakeServer()
+        hub = StreamHub(DroppingRedis(fakeredis.FakeAsyncRedis(server=server), delay=0.02))
+        publisher = StreamHub(fakeredis.FakeAsyncRedis(server=server))
+        await hub.start()
+        stream = hub.stream("u1", "ndjson")
+        assert await asyncio.wait_for(anext(stream), 2) == b'{"reset":true}\n'
+        assert "subscription lost" in caplog.text
+
+        pending = asyncio.create_task(anext(stream))
+        await asyncio.sleep(0)
+        event_id = await publisher.publish(priced("a", 60.0), ["u1"])
+        assert json.loads(await asyncio.wait_for(pending, 1))["id"] == event_id
+        await stream.aclose()
+        await hub.aclose()
+
+    @pytest.mark.asyncio
+    async def test_endpoint_streams_sse_with_last_event_id(self):
+        """The endpoint should resume from Last-Event-ID over SSE until shutdown."""
+        hub = StreamHub()
+        app = FastAPI()
+        app.include_router(stream_router(hub, current_user))
+        for deal_id in "ab":
+            await hub.publish(priced(deal_id, 60.0), ["u1"])
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/api/v1/deals/stream",
+            "query_string": b"",
+            "headers": [(b"x-user-id", b"u1"), (b"last-event-id", b"1")],
+        }
+        messages = []
+
+        async def receive():
+            await asyncio.Event().wait()
+
+        async def send(message):
+            messages.append(message)
+
+        response = asyncio.create_task(app(scope, receive, send))
+        while len(messages) < 3:
+            await asyncio.sleep(0.001)
+        await hub.aclose()
+        await asyncio.wait_for(response, 1)
+        headers = dict(messages[0]["headers"])
+        assert headers[b"content-type"].startswith(b"text/event-stream")
+        body = b"".join(message.get("body", b"") for message in messages[1:])
+        assert body.startswith(b"retry: 3000\n\nid: 2\nevent: deal\n")
+        assert hub.disconnected == 0 and len(hub) == 0
+
+
+def drive(limit, latency, rounds=200):
+    """Run saturated request rounds at a fixed latency; return the final limit."""
+    for _ in range(rounds):
+        admitted = 0
+        while limit.try_acquire():
+            admitted += 1
+        for _ in range(admitted):
+            limit.release(latency)
+    return limit.limit
+
+
+class TestGradientLimit:
+    """Test the latency-gradient limit."""
+
+    def test_grows_while_latency_is_steady(self):
+        """A saturated route at baseline latency should raise its limit."""
+        limit = GradientLimit(initial=10, max_limit=200)
+        assert drive(limit, 0.05) == 200
+
+    def test_shrinks_when_latency_rises(self):
+        """Latency well above the baseline should pull the limit down."""
+        limit = GradientLimit(initial=10, max_limit=200)
+        drive(limit, 0.05, rounds=20)
+        grown = limit.limit
+        assert drive(limit, 0.5, rounds=20) < grown / 2
+
+    def test_failures_back_off_and_idle_routes_do_not_grow(self):
+        """Errors should cut the limit; unsaturated traffic should not raise it."""
+        limit = GradientLimit(initial=20, min_limit=4)
+        for _ in range(50):
+            assert limit.try_acquire()
+            limit.release(0.05)
+        assert limit.limit == 20
+        for _ in range(50):
+            limit.try_acquire()
+            limit.release(0.05, dropped=True)
+        assert limit.limit == 4 and limit.in_flight == 0
+
+
+class TestAdaptiveConcurrencyMiddleware:
+    """Test load shedding in front of a slow app."""
+
+    def app(self, **kwargs):
+        """An app with one slow route wrapped in the middleware."""
+        app = FastAPI()
+        gate = asyncio.Event()
+
+        @app.get("/api/v1/deals")
+        async def deals():
+            await gate.wait()
+            return {"ok": True}
+
+        @app.get("/api/v1/deals/stream")
+        async def stream():
+            await gate.wait()
+            return {"stream": True}
+
+        @app.get("/api/v1/deals/{deal_id}")
+        async def deal(deal_id: str):
+            return {"id": deal_id}
+
+        limiter = ConcurrencyLimiter(lambda: GradientLimit(initial=2, min_limit=1))
+        app.add_middleware(AdaptiveConcurrencyMiddleware, limiter=limiter, **kwargs)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://test")
+        return client, gate, limiter
+
+    @pytest.mark.asyncio
+    async def test_sheds_above_limit_with_retry_after(self):
+        """Requests beyond the limit should fail fast with 503."""
+        client, gate, limiter = self.app(retry_after=2)
+        slow = [asyncio.create_task(client.get("/api/v1/deals")) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        shed = await client.get("/api/v1/deals")
+        assert shed.status_code == 503 and shed.headers["retry-after"] == "2"
+        gate.set()
+        assert [r.status_code for r in await asyncio.gather(*slow)] == [200, 200]
+        stats = limiter.snapshot()["GET /api/v1/deals"]
+        assert (stats.limit, stats.in_flight, stats.rejected) == (2, 0, 1)
+
+    @pytest.mark.asyncio
+    async def test_serves_fallback_before_rejecting(self):
+        """A cached response should be preferred over a 503."""
+
+        async def cached(request):
+            return Response(b'{"items":[]}', media_type="application/json")
+
+        client, gate, limiter = self.app(fallback=cached)
+        slow = [asyncio.create_task(client.get("/api/v1/deals")) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        shed = await client.get("/api/v1/deals")
+        assert shed.status_code == 200 and shed.json() == {"items": []}
+        gate.set()
+        await asyncio.gather(*slow)
+        assert limiter.snapshot()["GET /api/v1/deals"].fallbacks == 1
+
+    @pytest.mark.asyncio
+    async def test_excluded_paths_are_not_limited(self):
+        """Long-lived routes listed in ``exclude`` should bypass the limit."""
+        client, gate, limiter = self.app(exclude=["/api/v1/deals/stream"])
+        streams = [asyncio.create_task(client.get("/api/v1/deals/stream")) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        gate.set()
+        assert all(r.status_code == 200 for r in await asyncio.gather(*streams))
+        assert limiter.snapshot() == {}
+
+    @pytest.mark.asyncio
+    async def test_routes_are_keyed_by_template(self):
+        """Path parameters and unknown paths should not create a limit per URL."""
+        client, _, limiter = self.app()
+        for deal_id in range(5):
+            assert (await client.get(f"/api/v1/deals/{deal_id}")).status_code == 200
+        for path in ("/wp-login.php", "/.env", "/admin"):
+            assert (await client.get(path)).status_code == 404
+        assert set(limiter.snapshot()) == {"GET /api/v1/deals/{deal_id}", "GET *"}
+
+    def test_idle_routes_are_evicted_past_max_routes(self):
+        """The least recently used idle route should be forgotten first."""
+        limiter = ConcurrencyLimiter(max_routes=2)
+        busy = limiter.route("GET /a")
+        busy.try_acquire()
+        limiter.route("GET /b")
+        limiter.route("GET /c")
+        assert set(limiter.snapshot()) == {"GET /a", "GET /c"}
+        limiter.route("GET /c")
+        limiter.route("GET /d")
+        assert len(limiter) == 2 and "GET /a" in limiter.snapshot()
+
+    def test_limits_are_reported_to_the_gauge(self):
+        """Limit changes and :meth:`report` should reach the gauge."""
+        readings = []
+        limiter = ConcurrencyLimiter(
+            lambda: GradientLimit(initial=4, min_limit=1),
+            gauge=lambda name, value, labels: readings.append((name, value, labels["route"])),
+        )
+        limit = limiter.route("GET /a")
+        limit.try_acquire()
+        limiter.release("GET /a", limit, 0.05, dropped=True)
+        assert readings == [("concurrency_limit", limit.limit, "GET /a")]
+        assert limit.limit < 4
+        readings.clear()
+        limiter.report()
+        assert {name for name, _, _ in readings} == {
+            "concurrency_limit",
+            "concurrency_in_flight",
+            "concurrency_rejected",
+            "concurrency_fallbacks",
+        }
@@ -0,0 +1,201 @@
+"""
+Unit tests for deal duplicate detection.
+"""
+
+import pytest
+from helpers import FakeClock
+
+from dealfinder.dedup import (
+    BloomParameters,
+    MinHasher,
+    NearDuplicateIndex,
+    SlicedBloomFilter,
+    lsh_bands,
+    normalize_title,
+)
+from dealfinder.dedup.minhash import similarity
+
+
+class TestBloomParameters:
+    """Test Bloom filter sizing."""
+
+    def test_optimal_parameters(self):
+        """10k keys at 0.1% should need about 144k bits and 10 hashes."""
+        params = BloomParameters.optimal(10_000, 0.001)
+        assert 143_000 < params.bits < 144_500
+        assert params.hashes == 10
+
+    def test_rejects_invalid_error_rate(self):
+        """Error rate must be a probability strictly between 0 and 1."""
+        with pytest.raises(ValueError):
+            BloomParameters.optimal(100, 1.5)
+
+
+class TestSlicedBloomFilter:
+    """Test the time-sliced Redis Bloom filter."""
+
+    @pytest.mark.asyncio
+    async def test_new_keys_are_not_duplicates(self, redis):
+        """Keys never seen before should pass."""
+        bloom = SlicedBloomFilter(redis, clock=FakeClock())
+        assert await bloom.check_and_add(["deal-1", "deal-2"]) == [False, False]
+
+    @pytest.mark.asyncio
+    async def test_repeat_within_window_is_duplicate(self, redis):
+        """A key seen earlier in the window should be flagged."""
+        clock = FakeClock()
+        bloom = SlicedBloomFilter(redis, clock=clock)
+        await bloom.check_and_add(["deal-1"])
+        clock.now += 5 * 3600
+        assert await bloom.check_and_add(["deal-1", "deal-2"]) == [True, False]
+
+    @pytest.mark.asyncio
+    async def test_repeat_within_batch_is_duplicate(self, redis):
+        """Only the first occurrence in a batch should pass."""
+        bloom = SlicedBloomFilter(redis, clock=FakeClock())
+        assert await bloom.check_and_add(["a", "b", "a"]) == [False, False, True]
+
+    @pytest.mark.asyncio
+    async def test_keys_age_out_after_window(self, redis):
+        """Slices older than the window should no longer be consulted."""
+        clock = FakeClock()
+        bloom = SlicedBloomFilter(redis, clock=clock)
+        await bloom.check_and_add(["deal-1"])
+        clock.now += 25 * 3600
+        assert await bloom.contains(["deal-1"]) == [False]
+
+    @pytest.mark.asyncio
+    async def test_contains_does_not_insert(self, redis):
+        """Membership checks alone should not record keys."""
+        bloom = SlicedBloomFilter(redis, clock=FakeClock())
+        assert await bloom.contains(["deal-1"]) == [False]
+        assert await bloom.check_and_add(["deal-1"]) == [False]
+
+    @pytest.mark.asyncio
+    async def test_false_positives_are_rejected_by_exact_set(self, redis):
+        """A saturated bitmap should not cause new deals to be dropped."""
+        clock = FakeClock()
+        bloom = SlicedBloomFilter(redis, capacity_per_slice=1, error_rate=0.5, clock=clock)
+        await bloom.check_and_add([f"old-{i}" for i in range(50)])
+        clock.now += 3600
+        fresh = [f"new-{i}" for i in range(50)]
+        assert await bloom.check_and_add(fresh) == [False] * 50
+
+    @pytest.mark.asyncio
+    async def test_contains_confirms_current_slice_positives(self, redis):
+        """Lookups without insert should check the current slice's exact set too."""
+        bloom = SlicedBloomFilter(redis, capacity_per_slice=1, error_rate=0.5, clock=FakeClock())
+        await bloom.check_and_add([f"old-{i}" for i in range(50)])
+        assert await bloom.contains(["old-3", "new-1", "new-2"]) == [True, False, False]
+
+    @pytest.mark.asyncio
+    async def test_empty_batch(self, redis):
+        """An empty batch should not touch Redis."""
+        bloom = SlicedBloomFilter(redis, clock=FakeClock())
+        assert await bloom.check_and_add([]) == []
+
+    @pytest.mark.asyncio
+    async def test_slices_expire(self, redis):
+        """Slice keys should carry a TTL covering the window."""
+        bloom = SlicedBloomFilter(redis, clock=FakeClock())
+        await bloom.check_and_add(["deal-1"])
+        keys = await redis.keys("dedup:deals:*")
+        assert len(keys) == 2
+        for key in keys:
+            assert 0 < await redis.ttl(key) <= 25 * 3600
+
+
+class TestNormalizeTitle:
+    """Test title normalization before shingling."""
+
+    def test_folds_case_punctuation_and_filler(self):
+        """Dashes, case and retailer filler words should be removed."""
+        assert (
+            normalize_title("Sony XM5 Headphones – $248 at Amazon")
+            == "sony xm5 headphones $248 amazon"
+        )
+
+
+class TestLshBands:
+    """Test LSH band selection."""
+
+    def test_bands_fit_signature(self):
+        """Bands times rows should never exceed the signature length."""
+        for threshold in (0.3, 0.5, 0.8):
+            bands, rows = lsh_bands(128, threshold)
+            assert bands * rows <= 128
+            assert (1 / bands) ** (1 / rows) <= threshold
+
+
+class TestNearDuplicateIndex:
+    """Test MinHash/LSH near-duplicate detection."""
+
+    TITLE = "Sony WH-1000XM5 Wireless Noise Cancelling Headphones $248"
+    REPOST = "Sony WH-1000XM5 Wireless Noise Canceling Headphones - $248 @ Amazon"
+
+    def test_signature_similarity_tracks_jaccard(self):
+        """Identical titles should have similarity 1 and unrelated ones near 0."""
+        hasher = MinHasher()
+        same = similarity(hasher.signature("sony xm5"), hasher.signature("sony xm5"))
+        other = similarity(hasher.signature("sony xm5"), hasher.signature("lego castle set"))
+        assert same == 1.0
+        assert other < 0.1
+
+    def test_detects_cross_feed_repost(self):
+        """A reworded repost of the same deal should match the original."""
+        index = NearDuplicateIndex(clock=FakeClock())
+        assert index.check_and_add("slickdeals-1", self.TITLE, price=248.0) is None
+        match = index.check_and_add("dealnews-9", self.REPOST, price=248.0)
+        assert match is not None and match.deal_id == "slickdeals-1"
+        assert "dealnews-9" not in index
+
+    def test_different_products_do_not_match(self):
+        """Unrelated deals should both be indexed."""
+        index = NearDuplicateIndex(clock=FakeClock())
+        index.check_and_add("a", self.TITLE)
+        assert index.check_and_add("b", "LEGO Star Wars Millennium Falcon 75375 $67") is None
+        assert len(index) == 2
+
+    def test_price_change_is_not_a_duplicate(self):
+        """The same product at a clearly different price is a new deal."""
+        index = NearDuplicateIndex(clock=FakeClock())
+        index.check_and_add("a", self.TITLE, price=248.0)
+        assert index.check_and_add("b", self.TITLE.replace("248", "198"), price=198.0) is None
+
+    def test_entries_expire_after_window(self):
+        """Deals older than the window should no longer match."""
+        clock = FakeClock()
+        index = NearDuplicateIndex(clock=clock)
+        index.add("a", self.TITLE)
+        clock.now += 24 * 3600 + 1
+        assert index.query(self.REPOST) == []
+        assert len(index) == 0
+
+    def test_remove_clears_buckets(self):
+        """Removed deals should not be returned by queries."""
+        index = NearDuplicateIndex(clock=FakeClock())
+        index.add("a", self.TITLE)
+        index.remove("a")
+        assert index.query(self.TITLE) == []
+
+    @pytest.mark.asyncio
+    async def test_snapshot_round_trip(self, redis):
+        """A restored index should answer the same queries."""
+        clock = FakeClock()
+        index = NearDuplicateIndex(clock=clock)
+        index.add("a", self.TITLE, price=248.0)
+        index.add("b", "LEGO Star Wars Millennium Falcon 75375 $67")
+        await index.snapshot(redis)
+
+        restored = NearDuplicateIndex(clock=clock)
+        assert await restored.restore(redis) == 2
+        assert [m.deal_id for m in restored.query(self.REPOST, price=248.0)] == ["a"]
+
+    @pytest.mark.asyncio
+    async def test_restore_rejects_incompatible_snapshot(self, redis):
+        """Signatures from a different seed cannot be compared."""
+        index = NearDuplicateIndex(clock=FakeClock())
+        index.add("a", self.TITLE)
+        await index.snapshot(redis)
+        with pytest.raises(ValueError):
+            await NearDuplicateIndex(seed=2, clock=FakeClock()).restore(redis)
@@ -0,0 +1,135 @@
+"""
+Unit tests for the batching embedding service.
+"""
+
+import asyncio
+
+import fakeredis
+import numpy as np
+import pytest
+
+from dealfinder.embeddings import BatchingEmbedder, content_hash
+
+
+class RecordingEmbedder:
+    """Backend that embeds text lengths and records every batch."""
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    async def embed(self, texts):
+        self.batches.append(list(texts))
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError("backend unavailable")
+        return np.array([[len(t), t.count(" "), 1.0] for t in texts], dtype=np.float32)
+
+
+class TestBatchingEmbedder:
+    """Test micro-batching and the two cache tiers."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_callers_share_one_batch(self):
+        """Texts from concurrent callers should reach the backend in one call."""
+        backend = RecordingEmbedder()
+        embedder = BatchingEmbedder(backend, "test", max_delay=0.01)
+        first, second, third = await asyncio.gather(
+            embedder.embed(["usb cable", "laptop"]),
+            embedder.embed(["laptop stand"]),
+            embedder.embed(["usb cable"]),
+        )
+        assert len(backend.batches) == 1
+        assert sorted(backend.batches[0]) == ["laptop", "laptop stand", "usb cable"]
+        np.testing.assert_array_equal(first[0], third[0])
+        assert second.tolist() == [[12.0, 1.0, 1.0]]
+
+    @pytest.mark.asyncio
+    async def test_full_batch_flushes_without_waiting(self):
+        """Reaching max_batch_size should flush immediately in chunks."""
+        backend = RecordingEmbedder()
+        embedder = BatchingEmbedder(backend, "test", max_batch_size=4, max_delay=60)
+        texts = [f"deal {i}" for i in range(10)]
+        result = await asyncio.wait_for(embedder.embed(texts), timeout=1)
+        assert [len(b) for b in backend.batches] == [4, 4, 2]
+        assert result.shape == (10, 3)
+
+    @pytest.mark.asyncio
+    async def test_repeats_are_served_from_lru(self):
+        """Repeated and duplicated texts should be embedded once."""
+        backend = RecordingEmbedder()
+        embedder = BatchingEmbedder(backend, "test", max_delay=0)
+        result = await embedder.embed(["a b", "a b", "c"])
+        await embedder.embed(["c", "a b"])
+        assert backend.batches == [["a b", "c"]]
+        assert result.shape == (3, 3)
+        assert (embedder.hits, embedder.misses) == (2, 2)
+
+    @pytest.mark.asyncio
+    async def test_lru_evicts_oldest(self):
+        """The in-process tier should hold at most cache_size vectors."""
+        backend = RecordingEmbedder()
+        embedder = BatchingEmbedder(backend, "test", max_delay=0, cache_size=2)
+        await embedder.embed(["a", "b", "c"])
+        await embedder.embed(["c", "a"])
+        assert backend.batches[-1] == ["a"]
+
+    @pytest.mark.asyncio
+    async def test_redis_tier_is_shared_across_instances(self):
+        """A second instance should find vectors written by the first."""
+        redis = fakeredis.FakeAsyncRedis()
+        backend = RecordingEmbedder()
+        writer = BatchingEmbedder(backend, "test", redis, max_delay=0)
+        expected = await writer.embed(["usb cable"])
+
+        reader = BatchingEmbedder(backend, "test", redis, max_delay=0)
+        np.testing.assert_array_equal(await reader.embed(["usb cable"]), expected)
+        assert len(backend.batches) == 1 and reader.redis_hits == 1
+        assert await redis.ttl(f"embeddings:test:{content_hash('usb cable', 'test')}") > 0
+
+        other_model = BatchingEmbedder(backend, "test-v2", redis, max_delay=0)
+        await other_model.embed(["usb cable"])
+        assert len(backend.batches) == 2
+
+    @pytest.mark.asyncio
+    async def test_redis_outage_falls_back_to_backend(self):
+        """Failed cache reads and writes should not fail callers."""
+        server = fakeredis.FakeServer()
+        server.connected = False
+        backend = RecordingEmbedder()
+        embedder = BatchingEmbedder(
+            backend, "test", fakeredis.FakeAsyncRedis(server=server), max_delay=0
+        )
+        vectors = await embedder.embed(["usb cable", "hdmi"])
+        np.testing.assert_array_equal(vectors[:, 0], [9, 4])
+        assert len(backend.batches) == 1 and embedder.redis_hits == 0
+
+        server.connected = True
+        await embedder.embed(["dock"])
+        assert len(backend.batches) == 2
+
+    @pytest.mark.asyncio
+    async def test_backend_failure_reaches_every_caller(self):
+        """A failed batch should raise in all waiting callers and allow retries."""
+        backend = RecordingEmbedder(fail=True)
+        embedder = BatchingEmbedder(backend, "test", max_delay=0.01)
+        results = await asyncio.gather(
+            embedder.embed(["a"]), embedder.embed(["a", "b"]), return_exceptions=True
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+        backend.fail = False
+        assert (await embedder.embed(["a"])).shape == (1, 3)
+        assert len(backend.batches) == 2
+
+    @pytest.mark.asyncio
+    async def test_cancelled_caller_does_not_cancel_others(self):
+        """Cancelling one waiter should leave the shared batch running."""
+        backend = RecordingEmbedder()
+        embedder = BatchingEmbedder(backend, "test", max_delay=0.01)
+        doomed = asyncio.create_task(embedder.embed(["shared"]))
+        survivor = asyncio.create_task(embedder.embed(["shared"]))
+        await asyncio.sleep(0)
+        doomed.cancel()
+        assert (await survivor).shape == (1, 3)
+        await embedder.aclose()
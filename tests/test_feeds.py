@@ -0,0 +1,98 @@
+"""
+Unit tests for materialized deal feeds.
+"""
+
+import pytest
+
+from dealfinder.feeds import FeedStore, decode_cursor, encode_cursor
+from dealfinder.schemas import Deal, PricedDeal
+
+
+def priced(deal_id, discount):
+    """An opportunity with the given dollar discount."""
+    deal = Deal(id=deal_id, title=f"Deal {deal_id}", price=100.0)
+    return PricedDeal(deal=deal, estimate=100.0 + discount, discount=discount, is_opportunity=True)
+
+
+async def read_all(store, user_id, limit):
+    """Follow cursors through a whole feed."""
+    pages, cursor = [], None
+    while True:
+        page = await store.page(user_id, limit=limit, cursor=cursor)
+        pages.append([item.deal.id for item in page.items])
+        if page.next_cursor is None:
+            return pages
+        cursor = page.next_cursor
+
+
+class TestFeedStore:
+    """Test fan-out, trimming and cursor pagination."""
+
+    @pytest.mark.asyncio
+    async def test_fan_out_orders_by_discount(self, redis):
+        """Each matching user's feed should list deals best discount first."""
+        store = FeedStore(redis, chunk_size=2)
+        users = [f"u{i}" for i in range(5)]
+        for deal_id, discount in [("a", 60.0), ("b", 90.0), ("c", 75.0)]:
+            await store.publish(priced(deal_id, discount), users)
+        for user in users:
+            page = await store.page(user)
+            assert [item.deal.id for item in page.items] == ["b", "c", "a"]
+            assert page.next_cursor is None
+        assert (await store.page("nobody")).items == []
+
+    @pytest.mark.asyncio
+    async def test_feed_is_trimmed_to_cap(self, redis):
+        """Only the best ``cap`` deals should be kept."""
+        store = FeedStore(redis, cap=3)
+        for i in range(6):
+            await store.publish(priced(f"d{i}", 50.0 + i), ["u1"])
+        assert await redis.zcard("feed:u1") == 3
+        assert [item.deal.id for item in (await store.page("u1")).items] == ["d5", "d4", "d3"]
+        assert 0 < await redis.ttl("feed:u1") <= store.ttl
+
+    @pytest.mark.asyncio
+    async def test_cursor_pages_through_ties_without_repeats(self, redis):
+        """Pagination should visit every deal once, even across equal scores."""
+        store = FeedStore(redis)
+        discounts = [60.0, 60.0, 60.0, 70.0, 70.0, 55.0, 80.0]
+        for i, discount in enumerate(discounts):
+            await store.publish(priced(f"d{i}", discount), ["u1"])
+        pages = await read_all(store, "u1", limit=2)
+        assert [deal for page in pages for deal in page] == [
+            "d6",
+            "d4",
+            "d3",
+            "d2",
+            "d1",
+            "d0",
+            "d5",
+        ]
+        assert all(len(page) == 2 for page in pages[:-1])
+
+    @pytest.mark.asyncio
+    async def test_new_deals_do_not_shift_later_pages(self, redis):
+        """A deal published mid-pagination should not repeat earlier items."""
+        store = FeedStore(redis)
+        for i in range(4):
+            await store.publish(priced(f"d{i}", 50.0 + i), ["u1"])
+        first = await store.page("u1", limit=2)
+        await store.publish(priced("new", 99.0), ["u1"])
+        second = await store.page("u1", limit=2, cursor=first.next_cursor)
+        assert [item.deal.id for item in second.items] == ["d1", "d0"]
+
+    @pytest.mark.asyncio
+    async def test_pruned_deals_are_dropped_from_feeds(self, redis):
+        """Readers should skip and remove entries whose bodies were pruned."""
+        store = FeedStore(redis)
+        for deal_id, discount in [("a", 60.0), ("b", 90.0)]:
+            await store.publish(priced(deal_id, discount), ["u1"])
+        await store.prune(["b"])
+        assert [item.deal.id for item in (await store.page("u1")).items] == ["a"]
+        assert await redis.zrange("feed:u1", 0, -1) == [b"a"]
+
+    def test_cursor_round_trip_and_validation(self):
+        """Cursors should round-trip and reject garbage."""
+        assert decode_cursor(encode_cursor(60.5, "deal:1")) == (60.5, "deal:1")
+        with pytest.raises(ValueError):
+            decode_cursor("not a cursor")
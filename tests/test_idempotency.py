@@ -0,0 +1,186 @@
+"""
+Unit tests for the idempotency ledger.
+"""
+
+import asyncio
+import threading
+
+import pytest
+from helpers import FakeClock
+
+from dealfinder.idempotency import IdempotencyLedger, idempotency_key
+from dealfinder.state import InMemoryStateStore
+
+
+class CountingStore(InMemoryStateStore):
+    """In-memory store counting reads and optionally failing writes."""
+
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+        self.fail_writes = 0
+
+    def get_many(self, keys):
+        self.reads += 1
+        return super().get_many(keys)
+
+    def put_many(self, items, *, ttl=None):
+        if self.fail_writes:
+            self.fail_writes -= 1
+            raise ConnectionError("throttled")
+        super().put_many(items, ttl=ttl)
+
+
+def ledger(redis, store=None, **kwargs):
+    """Ledger with a fake clock and large flush thresholds by default."""
+    kwargs.setdefault("flush_size", 1000)
+    kwargs.setdefault("flush_interval", 3600)
+    return IdempotencyLedger(redis, store or CountingStore(), clock=FakeClock(), **kwargs)
+
+
+async def flushed(subject):
+    """Wait for a write-behind flush a claim started in the background."""
+    if subject._flushing is not None:
+        await subject._flushing
+
+
+class TestIdempotencyLedger:
+    """Test claiming, write-behind and recovery."""
+
+    @pytest.mark.asyncio
+    async def test_claims_once_per_window(self, redis):
+        """A key should be claimable once, including within one batch."""
+        subject = ledger(redis, window=60)
+        a, b = idempotency_key("u1", "d1", "sns"), idempotency_key("u2", "d1", "sns")
+        assert await subject.claim_many([a, b, a]) == [True, True, False]
+        assert await subject.claim_many([b]) == [False]
+        assert 59_000 < await redis.pttl(f"idempotency:{a}") <= 60_000
+        assert (subject.claimed, subject.duplicates) == (2, 2)
+
+    @pytest.mark.asyncio
+    async def test_write_behind_flushes_by_size_and_interval(self, redis):
+        """Claims should reach the store once enough are buffered or time passes."""
+        store = CountingStore()
+        subject = ledger(redis, store, flush_size=3, flush_interval=5)
+        await subject.claim_many(["k1", "k2"])
+        assert store.get("idempotency#k1") is None
+        await subject.claim_many(["k3"])
+        await flushed(subject)
+        assert store.get("idempotency#k3") == {"claimed_at": 1_000_000.0}
+
+        await subject.claim("k4")
+        subject._clock.now += 5
+        await subject.claim("k5")
+        await flushed(subject)
+        assert store.get("idempotency#k4") is not None
+
+    @pytest.mark.asyncio
+    async def test_claims_do_not_wait_for_the_store(self, redis):
+        """A slow durable write should not delay the claim that triggered it."""
+        store = CountingStore()
+        release = threading.Event()
+        put_many = store.put_many
+
+        def slow_put_many(items, *, ttl=None):
+            release.wait(5)
+            put_many(items, ttl=ttl)
+
+        store.put_many = slow_put_many
+        subject = ledger(redis, store, flush_size=1)
+        assert await asyncio.wait_for(subject.claim_many(["k1"]), 1) == [True]
+        assert store.get("idempotency#k1") is None
+        release.set()
+        await subject.aclose()
+        assert store.get("idempotency#k1") is not None
+
+    @pytest.mark.asyncio
+    async def test_failed_flush_keeps_claims_buffered(self, redis):
+        """A store error should not lose buffered claims."""
+        store = CountingStore()
+        store.fail_writes = 1
+        subject = ledger(redis, store)
+        await subject.claim_many(["k1", "k2"])
+        assert await subject.flush() == 0
+        assert await subject.flush() == 2
+        assert set(store.get_many(["idempotency#k1", "idempotency#k2"])) == {
+            "idempotency#k1",
+            "idempotency#k2",
+        }
+
+    @pytest.mark.asyncio
+    async def test_rebuilds_from_store_after_failover(self, redis):
+        """After Redis loses its data, flushed claims must still block duplicates."""
+        store = CountingStore()
+        subject = ledger(redis, store, window=600)
+        await subject.claim_many(["k1", "k2"])
+        await subject.aclose()
+        await redis.flushall()
+        store.reads = 0
+
+        subject._clock.now += 100
+        assert await subject.claim_many(["k1", "k3"]) == [False, True]
+        assert subject.recovering and store.reads == 1
+        assert 499_000 < await redis.pttl("idempotency:k1") <= 500_000
+
+        assert await subject.claim_many(["k1"]) == [False]
+        assert store.reads == 1
+
+        subject._clock.now += 600
+        assert not subject.recovering
+
+    @pytest.mark.asyncio
+    async def test_recovery_is_shared_between_instances(self, redis):
+        """An instance that did not see the failover should still verify claims."""
+        store, clock = CountingStore(), FakeClock()
+        first, second = (IdempotencyLedger(redis, store, window=600, clock=clock) for _ in range(2))
+        await first.claim_many(["k0"])
+        clock.now += 700
+        await first.claim_many(["k1"])
+        assert not first.recovering
+        await first.flush()
+        await redis.flushall()
+
+        assert await second.claim_many(["k2"]) == [True]
+        assert second.recovering
+        assert await first.claim_many(["k1"]) == [False]
+        assert first.recovering
+
+    @pytest.mark.asyncio
+    async def test_explicit_recover_reaches_other_instances(self, redis):
+        """recover() on one instance should put every instance into recovery."""
+        store, clock = CountingStore(), FakeClock()
+        first, second = (IdempotencyLedger(redis, store, window=600, clock=clock) for _ in range(2))
+        await first.claim_many(["k0"])
+        clock.now += 700
+        await first.claim_many(["k1"])
+        await first.flush()
+        await redis.delete("idempotency:k1")
+        await second.recover()
+        assert await first.claim_many(["k1"]) == [False]
+
+    @pytest.mark.asyncio
+    async def test_timer_flushes_without_further_claims(self, redis):
+        """Buffered claims should become durable on the timer and on close."""
+        store = CountingStore()
+        subject = ledger(redis, store, flush_interval=0.01)
+        await subject.start()
+        await subject.claim_many(["k1"])
+        await asyncio.sleep(0.05)
+        assert store.get("idempotency#k1") is not None
+
+        subject.flush_interval = 3600
+        await subject.claim_many(["k2"])
+        await subject.aclose()
+        assert store.get("idempotency#k2") is not None
+
+    @pytest.mark.asyncio
+    async def test_release_allows_retry_even_after_failover(self, redis):
+        """Released keys should be claimable again, durably."""
+        subject = ledger(redis)
+        assert await subject.claim("k1")
+        await subject.release(["k1"])
+        assert await subject.claim("k1")
+        await subject.release(["k1"])
+        await subject.flush()
+        await redis.flushall()
+        assert await subject.claim("k1")
@@ -0,0 +1,198 @@
+"""
+Unit tests for the subscription preference index.
+"""
+
+import random
+import statistics
+import time
+
+import pytest
+
+from dealfinder.dedup.minhash import normalize_title
+from dealfinder.matching import PreferenceIndex, deal_terms, discount_percent
+from dealfinder.schemas import Deal, PricedDeal, Subscription
+
+
+def priced(title, price=100.0, estimate=200.0, category="Electronics"):
+    """A priced deal with the given discount inputs."""
+    deal = Deal(id=title, title=title, price=price, category=category)
+    discount = None if estimate is None else estimate - price
+    return PricedDeal(deal=deal, estimate=estimate, discount=discount, is_opportunity=True)
+
+
+def brute_force(subscriptions, item):
+    """Reference matcher scanning every subscription."""
+    terms = deal_terms(item.deal)
+    pct = discount_percent(item)
+
+    def accepts(sub):
+        for field in ("categories", "brands", "keywords"):
+            wanted = {normalize_title(t) for t in getattr(sub, field)}
+            if wanted and not wanted & terms[field]:
+                return False
+        if sub.max_price is not None and item.deal.price > sub.max_price:
+            return False
+        return sub.min_discount_pct is None or pct >= sub.min_discount_pct
+
+    return sorted(sub.user_id for sub in subscriptions if accepts(sub))
+
+
+class TestPreferenceIndex:
+    """Test predicate semantics and incremental updates."""
+
+    def test_field_predicates(self):
+        """Each constrained field must match; empty fields match anything."""
+        index = PreferenceIndex()
+        index.extend(
+            [
+                Subscription(user_id="any"),
+                Subscription(user_id="cat", categories=frozenset({"electronics"})),
+                Subscription(user_id="home", categories=frozenset({"Home"})),
+                Subscription(user_id="brand", brands=frozenset({"Sony"})),
+                Subscription(user_id="phrase", keywords=frozenset({"Noise Cancelling"})),
+                Subscription(user_id="miss", keywords=frozenset({"laptop"})),
+                Subscription(
+                    user_id="both", brands=frozenset({"bose"}), keywords=frozenset({"headphones"})
+                ),
+            ]
+        )
+        item = priced("Sony WH-1000XM5 Noise-Cancelling Headphones")
+        assert sorted(index.match(item)) == ["any", "brand", "cat", "phrase"]
+
+    def test_price_and_discount_bounds(self):
+        """Max price and min discount percent should filter candidates."""
+        index = PreferenceIndex()
+        index.extend(
+            [
+                Subscription(user_id="cheap", max_price=50),
+                Subscription(user_id="budget", max_price=100),
+                Subscription(user_id="deep", min_discount_pct=60),
+                Subscription(user_id="half", min_discount_pct=50),
+            ]
+        )
+        assert sorted(index.match(priced("Desk lamp"))) == ["budget", "half"]
+        assert index.match(priced("Desk lamp", estimate=None)) == ["budget"]
+
+    def test_upsert_replaces_and_remove_frees_slot(self):
+        """Updating a user should drop old postings; removed slots are reused."""
+        index = PreferenceIndex(capacity=64)
+        index.upsert(Subscription(user_id="u1", keywords=frozenset({"laptop"})))
+        index.upsert(Subscription(user_id="u1", keywords=frozenset({"tablet"})))
+        assert index.match(priced("Gaming laptop")) == []
+        assert index.match(priced("Android tablet")) == ["u1"]
+        assert len(index) == 1
+
+        assert index.remove("u1") and not index.remove("u1")
+        assert "u1" not in index and index.match(priced("Android tablet")) == []
+        index.upsert(Subscription(user_id="u2"))
+        assert index.capacity == 64
+
+    def test_grows_past_initial_capacity(self):
+        """Adding more users than slots should widen every bitset."""
+        index = PreferenceIndex(capacity=64)
+        index.extend(
+            Subscription(user_id=f"u{i}", keywords=frozenset({f"kw{i % 3}"})) for i in range(200)
+        )
+        assert index.capacity >= 200
+        assert len(index.match(priced("Bundle kw1"))) == len(range(1, 200, 3))
+
+    def test_rejects_long_phrases(self):
+        """Phrases longer than deal_terms generates could never match."""
+        with pytest.raises(ValueError):
+            PreferenceIndex().upsert(
+                Subscription(user_id="u1", keywords=frozenset({"a very long keyword phrase"}))
+            )
+
+    def test_matches_brute_force(self):
+        """The index should agree with a per-subscription scan."""
+        rng = random.Random(7)
+        words = ["sony", "bose", "laptop", "tablet", "usb", "cable", "apple", "watch"]
+        subscriptions = [
+            Subscription(
+                user_id=f"u{i}",
+                categories=frozenset(rng.sample(["electronics", "home"], rng.randint(0, 1))),
+                brands=frozenset(rng.sample(words[:2], rng.randint(0, 1))),
+                keywords=frozenset(rng.sample(words, rng.randint(0, 2))),
+                max_price=rng.choice([None, 50, 150]),
+                min_discount_pct=rng.choice([None, 20, 60]),
+            )
+            for i in range(150)
+        ]
+        index = PreferenceIndex()
+        index.extend(subscriptions)
+        for _ in range(20):
+            item = priced(
+                " ".join(rng.sample(words, 3)),
+                price=rng.uniform(10, 200),
+                category=rng.choice(["Electronics", "Home"]),
+            )
+            assert sorted(index.match(item)) == brute_force(subscriptions, item)
+
+    def test_rare_terms_stay_sparse(self):
+        """Postings for rare terms should cost bytes per member, not per user."""
+        index = PreferenceIndex()
+        index.extend(
+            Subscription(user_id=f"u{i}", keywords=frozenset({f"kw{i}"})) for i in range(5000)
+        )
+        assert index.posting_nbytes == 5000 * 8
+        assert index.match(priced("Bundle kw42")) == ["u42"]
+
+    def test_postings_switch_representation(self):
+        """Terms crossing the density threshold both ways should keep matching."""
+        rng = random.Random(3)
+        words = ["common", "usual"] + [f"rare{i}" for i in range(40)]
+        subscriptions = {
+            f"u{i}": Subscription(
+                user_id=f"u{i}",
+                keywords=frozenset(rng.sample(words[:2], 1) + rng.sample(words[2:], 1)),
+            )
+            for i in range(400)
+        }
+        index = PreferenceIndex(capacity=64)
+        index.extend(subscriptions.values())
+        for user_id in rng.sample(sorted(subscriptions), 380):
+            index.remove(user_id)
+            del subscriptions[user_id]
+        for title in ["common rare1", "usual rare7", "rare3 rare9", "common usual"]:
+            item = priced(title)
+            assert sorted(index.match(item)) == brute_force(subscriptions.values(), item)
+
+
+@pytest.mark.benchmark
+class TestPreferenceIndexBenchmark:
+    """Benchmark matching against 100k subscribers; run with ``-m benchmark``."""
+
+    def test_100k_users_match_under_a_millisecond(self):
+        """Median per-deal match time should stay under 1 ms at 100k users."""
+        rng = random.Random(0)
+        categories = ["electronics", "home", "toys", "sports", "fashion", "books"]
+        vocabulary = [f"word{i}" for i in range(5000)]
+        brands = [f"brand{i}" for i in range(500)]
+        index = PreferenceIndex()
+        index.extend(
+            Subscription.model_construct(
+                user_id=f"u{i}",
+                categories=frozenset(rng.sample(categories, rng.randint(0, 2))),
+                brands=frozenset(rng.sample(brands, rng.choice([0, 0, 1]))),
+                keywords=frozenset(rng.sample(vocabulary, rng.choice([0, 1, 3]))),
+                max_price=rng.choice([None, 50.0, 500.0]),
+                min_discount_pct=rng.choice([None, 10.0, 30.0]),
+            )
+            for i in range(100_000)
+        )
+        deals = [
+            priced(
+                " ".join(rng.sample(vocabulary, 8) + rng.sample(brands, 1)),
+                price=rng.uniform(5, 400),
+                estimate=500.0,
+                category=rng.choice(categories),
+            )
+            for _ in range(200)
+        ]
+        timings = []
+        for item in deals:
+            started = time.perf_counter()
+            index.match(item)
+            timings.append(time.perf_counter() - started)
+        assert len(index) == 100_000
+        assert statistics.median(timings) < 1e-3
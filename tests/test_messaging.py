@@ -0,0 +1,127 @@
+"""
+Unit tests for the MessagingAgent.
+"""
+
+import asyncio
+
+import pytest
+from helpers import FakeClock
+
+from dealfinder.messaging import (
+    FALLBACK_TEMPLATE,
+    MessageTemplate,
+    MessagingAgent,
+    Recipient,
+    Segment,
+    template_slots,
+)
+from dealfinder.schemas import Deal, PricedDeal
+
+
+class ScriptedGenerator:
+    """LLM stand-in returning a fixed reply and recording prompts."""
+
+    def __init__(self, reply="Hey {name}! {title} is {price}, {discount} off: {url}"):
+        self.reply = reply
+        self.prompts = []
+
+    async def generate(self, prompt):
+        self.prompts.append(prompt)
+        await asyncio.sleep(0.01)
+        if isinstance(self.reply, Exception):
+            raise self.reply
+        return self.reply
+
+
+def opportunity(title="Sony WH-1000XM5 Headphones", deal_id="d1"):
+    """A priced opportunity."""
+    deal = Deal(id=deal_id, title=title, price=248.0, url="https://ex.com/d1")
+    return PricedDeal(deal=deal, estimate=399.99, discount=151.99, is_opportunity=True)
+
+
+class TestMessageTemplate:
+    """Test slot parsing and rendering."""
+
+    def test_slots_and_malformed_placeholders(self):
+        """Placeholders are plain names; formats and broken braces are rejected."""
+        assert template_slots("{name} gets {title}") == {"name", "title"}
+        for bad in ("{price:.2f}", "{", "{}"):
+            with pytest.raises(ValueError):
+                template_slots(bad)
+
+    def test_render_shortens_title_to_fit(self):
+        """Long titles should be cut so the message stays within the limit."""
+        template = MessageTemplate("{name}: {title} now {price}", Segment(max_length=40))
+        text = template.render({"name": "Ana", "title": "x" * 80, "price": "$9.99"})
+        assert len(text) <= 40
+        assert text.startswith("Ana: xxx") and text.endswith("… now $9.99")
+
+
+class TestMessagingAgent:
+    """Test generate-once, personalize-many composition."""
+
+    @pytest.mark.asyncio
+    async def test_one_llm_call_per_segment(self):
+        """Thousands of recipients should cost one call per segment."""
+        generator = ScriptedGenerator()
+        agent = MessagingAgent(generator)
+        recipients = [
+            Recipient(f"u{i}", "sns" if i % 2 else "pushover", f"addr{i}", name=f"User{i}")
+            for i in range(2000)
+        ]
+        notifications = await agent.compose(opportunity(), recipients)
+        assert agent.llm_calls == 2 and len(generator.prompts) == 2
+        assert len(notifications) == 2000
+        first = notifications[0]
+        assert first.body == "Hey User0! Sony WH-1000XM5 Headphones is $248.00, $151.99 off: " + (
+            "https://ex.com/d1"
+        )
+        assert (first.id, first.channel, first.recipient) == ("d1:u0:pushover", "pushover", "addr0")
+        assert all(len(n.body) <= 160 for n in notifications if n.channel == "sns")
+        assert "at most 160 characters" in "".join(generator.prompts)
+
+    @pytest.mark.asyncio
+    async def test_templates_cached_by_deal_and_segment(self):
+        """Repeat and concurrent requests should reuse one template until it expires."""
+        clock = FakeClock(1_000.0)
+        agent = MessagingAgent(ScriptedGenerator(), ttl=60, clock=clock)
+        recipients = [Recipient("u1", "slack", "hook")]
+        await asyncio.gather(
+            agent.compose(opportunity(), recipients), agent.compose(opportunity(), recipients)
+        )
+        await agent.compose(opportunity(), recipients)
+        assert agent.llm_calls == 1 and agent.hits == 1
+
+        await agent.compose(opportunity(deal_id="d2"), recipients)
+        await agent.compose(opportunity(), [Recipient("u1", "slack", "hook", tone="urgent")])
+        assert agent.llm_calls == 3
+
+        clock.now += 61
+        await agent.compose(opportunity(), recipients)
+        assert agent.llm_calls == 4
+
+    @pytest.mark.parametrize(
+        "reply",
+        [
+            "Use code {coupon} now",
+            "Broken {title",
+            "x" * 250 + " {title}",
+            RuntimeError("throttled"),
+        ],
+    )
+    @pytest.mark.asyncio
+    async def test_bad_completions_fall_back(self, reply):
+        """Invalid or failed generations should use the uncached fallback template."""
+        agent = MessagingAgent(ScriptedGenerator(reply))
+        recipient = Recipient("u1", "slack", "hook", name="Ana")
+        [notification] = await agent.compose(opportunity(), [recipient])
+        expected = FALLBACK_TEMPLATE.format(
+            name="Ana",
+            title="Sony WH-1000XM5 Headphones",
+            price="$248.00",
+            discount="$151.99",
+            url="https://ex.com/d1",
+        )
+        assert notification.body == expected
+        await agent.compose(opportunity(), [recipient])
+        assert agent.llm_calls == 2
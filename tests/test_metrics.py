@@ -0,0 +1,43 @@
+"""
+Unit tests for in-process metrics.
+"""
+
+import pytest
+
+from dealfinder.metrics import LatencyHistogram
+
+
+class TestLatencyHistogram:
+    """Test the log-bucketed latency histogram."""
+
+    def test_empty_histogram_has_no_quantile(self):
+        """Quantiles are undefined without observations."""
+        assert LatencyHistogram().quantile(0.95) is None
+
+    def test_quantiles_within_bucket_precision(self):
+        """Quantiles should be within one bucket of the true value."""
+        histogram = LatencyHistogram(growth=1.1)
+        for i in range(1, 101):
+            histogram.record(i / 1000)
+        assert histogram.quantile(0.5) == pytest.approx(0.050, rel=0.1)
+        assert histogram.quantile(0.95) == pytest.approx(0.095, rel=0.1)
+
+    def test_recent_samples_dominate_after_decay(self):
+        """Old latency should fade once newer samples accumulate."""
+        histogram = LatencyHistogram(half_life=100)
+        for _ in range(100):
+            histogram.record(1.0)
+        for _ in range(1000):
+            histogram.record(0.01)
+        assert histogram.quantile(0.95) < 0.02
+
+    def test_values_beyond_range_are_clamped(self):
+        """Observations above the last bound should report the last bound."""
+        histogram = LatencyHistogram(max_value=10.0)
+        histogram.record(500.0)
+        assert histogram.quantile(0.5) == histogram.bounds[-1]
+
+    def test_rejects_invalid_quantile(self):
+        """Quantiles must be probabilities."""
+        with pytest.raises(ValueError):
+            LatencyHistogram().quantile(1.5)
@@ -0,0 +1,145 @@
+"""
+Unit tests for the in-process neural price model runtime.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from dealfinder.models import HashingFeaturizer, NeuralPriceModel, export_weights, quantize_int8
+from dealfinder.schemas import Deal
+
+
+def reference_forward(layers, features):
+    """Float64 reference of the exported MLP, mirroring the PyTorch module."""
+    x = np.asarray(features, dtype=np.float64)
+    for index, (weight, bias) in enumerate(layers):
+        x = x @ np.asarray(weight, dtype=np.float64).T + bias
+        if index < len(layers) - 1:
+            x = np.maximum(x, 0.0)
+    return x[:, 0]
+
+
+@pytest.fixture
+def layers():
+    """Random MLP weights shaped like a small price model (64 -> 32 -> 16 -> 1)."""
+    rng = np.random.default_rng(7)
+    shapes = [(32, 64), (16, 32), (1, 16)]
+    return [
+        (
+            rng.normal(0, 1 / np.sqrt(cols), size=(rows, cols)).astype(np.float32),
+            rng.normal(0, 0.1, size=rows).astype(np.float32),
+        )
+        for rows, cols in shapes
+    ]
+
+
+@pytest.fixture
+def features():
+    """A batch of feature vectors."""
+    return np.random.default_rng(11).normal(size=(128, 64)).astype(np.float32)
+
+
+class TestQuantization:
+    """Test int8 weight quantization."""
+
+    def test_quantize_int8_round_trip(self):
+        """Dequantized weights should be within half a step of the originals."""
+        weight = np.random.default_rng(0).normal(size=(8, 16)).astype(np.float32)
+        quantized, scale = quantize_int8(weight)
+        assert quantized.dtype == np.int8
+        assert np.all(np.abs(quantized * scale[:, None] - weight) <= scale[:, None] / 2 + 1e-6)
+
+    def test_zero_rows_are_safe(self):
+        """All-zero rows should not produce a zero scale."""
+        quantized, scale = quantize_int8(np.zeros((2, 4)))
+        assert np.all(scale == 1.0) and not quantized.any()
+
+
+class TestNeuralPriceModel:
+    """Parity of the NumPy runtime with the reference model."""
+
+    @pytest.mark.parametrize(
+        ("dtype", "tolerance"), [("float32", 1e-5), ("float16", 5e-3), ("int8", 3e-2)]
+    )
+    def test_parity_with_reference(self, tmp_path, layers, features, dtype, tolerance):
+        """Each storage type should match the reference within its precision."""
+        path = tmp_path / f"model-{dtype}.dfnn"
+        export_weights(path, layers, dtype=dtype)
+        model = NeuralPriceModel(path)
+        expected = reference_forward(layers, features)
+        actual = model.predict(features)
+        scale = np.abs(expected).max()
+        assert np.max(np.abs(actual - expected)) / scale < tolerance
+
+    def test_weights_are_memory_mapped(self, tmp_path, layers):
+        """Weights should be read-only views of the mapped file."""
+        path = tmp_path / "model.dfnn"
+        export_weights(path, layers, dtype="int8")
+        model = NeuralPriceModel(path)
+        weight = model._tensors["layers.0.weight"]
+        assert weight.dtype == np.int8 and not weight.flags.writeable
+        assert path.stat().st_size < sum(w.nbytes + b.nbytes for w, b in layers) / 2
+
+    def test_keep_dequantized_matches_lazy(self, tmp_path, layers, features):
+        """Caching dequantized weights should not change results."""
+        path = tmp_path / "model.dfnn"
+        export_weights(path, layers, dtype="int8")
+        lazy = NeuralPriceModel(path).predict(features)
+        eager = NeuralPriceModel(path, keep_dequantized=True)
+        eager.predict(features)
+        np.testing.assert_allclose(eager.predict(features), lazy)
+
+    def test_log1p_target_is_inverted(self, tmp_path):
+        """log1p-trained models should return dollar prices."""
+        path = tmp_path / "model.dfnn"
+        export_weights(
+            path, [(np.zeros((1, 2)), np.array([np.log1p(99.0)]))], metadata={"target": "log1p"}
+        )
+        assert NeuralPriceModel(path).predict(np.ones((1, 2)))[0] == pytest.approx(99.0, rel=1e-4)
+
+    def test_export_is_durable_and_shareable(self, tmp_path, monkeypatch):
+        """The weight file should be fsynced before the rename and left world-readable."""
+        synced = []
+        monkeypatch.setattr(os, "fsync", lambda fd: synced.append(fd))
+        path = tmp_path / "model.dfnn"
+        export_weights(path, [(np.ones((1, 2)), np.zeros(1))])
+        assert synced and path.stat().st_mode & 0o777 == 0o644
+
+    def test_rejects_foreign_file(self, tmp_path):
+        """Files without the DFNN preamble should be rejected."""
+        path = tmp_path / "model.bin"
+        path.write_bytes(b"\0" * 64)
+        with pytest.raises(ValueError):
+            NeuralPriceModel(path)
+
+    @pytest.mark.asyncio
+    async def test_estimate_batch_uses_featurizer(self, tmp_path):
+        """Deals should be featurized with the settings from the metadata."""
+        rng = np.random.default_rng(3)
+        layers = [(rng.normal(size=(4, 32)), np.zeros(4)), (rng.normal(size=(1, 4)), [50.0])]
+        path = tmp_path / "model.dfnn"
+        export_weights(path, layers, dtype="float32", metadata={"n_features": 32})
+        model = NeuralPriceModel(path)
+        deals = [Deal(id="1", title="Sony WH-1000XM5", price=248.0)]
+        features = HashingFeaturizer(32).transform(["Sony WH-1000XM5"])
+        expected = reference_forward(layers, features)
+        assert await model.estimate_batch(deals) == pytest.approx(expected.tolist(), rel=1e-5)
+
+
+class TestHashingFeaturizer:
+    """Test feature hashing."""
+
+    def test_rows_are_normalized(self):
+        """Non-empty texts should produce unit vectors, empty ones zeros."""
+        features = HashingFeaturizer(64).transform(["lego star wars falcon", ""])
+        assert np.linalg.norm(features[0]) == pytest.approx(1.0)
+        assert not features[1].any()
+
+    def test_is_deterministic(self):
+        """The same text should always hash to the same features."""
+        featurizer = HashingFeaturizer(128)
+        np.testing.assert_array_equal(
+            featurizer.transform(["Instant Pot Duo"]), featurizer.transform(["instant pot duo"])
+        )
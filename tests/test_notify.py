@@ -0,0 +1,456 @@
+"""
+Unit tests for notification channels and the dispatcher.
+"""
+
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from dataclasses import replace
+from urllib.parse import parse_qs
+
+import boto3
+import httpx
+import pytest
+from botocore.stub import Stubber
+from helpers import FakeClock
+
+from dealfinder.notify import (
+    DeliveryError,
+    DigestCoalescer,
+    Dispatcher,
+    FakeChannel,
+    Notification,
+    PushoverChannel,
+    SESChannel,
+    SlackChannel,
+    SNSChannel,
+    TimerWheel,
+    TokenBucket,
+)
+
+
+class ScriptedChannel(FakeChannel):
+    """Fake channel that fails chosen notifications a set number of times."""
+
+    def __init__(self, failures, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = dict(failures)
+
+    async def send_batch(self, notifications):
+        outcomes = []
+        for notification in notifications:
+            remaining = self.failures.get(notification.id, 0)
+            if remaining:
+                self.failures[notification.id] = remaining - 1
+                outcomes.append(DeliveryError("busy"))
+            else:
+                self.delivered.append(notification)
+                outcomes.append(None)
+        self.calls += 1
+        return outcomes
+
+
+def note(i, user="u1", channel="fake", **kwargs):
+    """A notification with a sortable ID."""
+    return Notification(
+        id=f"n{i:05d}",
+        user_id=user,
+        channel=channel,
+        recipient=f"{user}@example.com",
+        body=f"Deal {i}",
+        **kwargs,
+    )
+
+
+def per_user(notifications):
+    """Group notification IDs by user, in delivery order."""
+    order = defaultdict(list)
+    for notification in notifications:
+        order[notification.user_id].append(notification.id)
+    return order
+
+
+def aws_client(service):
+    """A boto3 client with dummy credentials for stubbing."""
+    return boto3.client(
+        service,
+        region_name="us-east-1",
+        aws_access_key_id="test",
+        aws_secret_access_key="test",
+    )
+
+
+class TestTokenBucket:
+    """Test the token bucket."""
+
+    def test_refills_at_rate_up_to_burst(self):
+        """Tokens should refill continuously and cap at the burst size."""
+        clock = FakeClock(0.0)
+        bucket = TokenBucket(10, 5, clock=clock)
+        assert bucket.try_acquire(5) and not bucket.try_acquire(1)
+        clock.now += 0.25
+        assert bucket.try_acquire(2) and not bucket.try_acquire(1)
+        clock.now += 100
+        assert bucket.try_acquire(5) and not bucket.try_acquire(1)
+
+    @pytest.mark.asyncio
+    async def test_acquire_rejects_more_than_burst(self):
+        """A request larger than the bucket could never be satisfied."""
+        with pytest.raises(ValueError):
+            await TokenBucket(10, 5).acquire(6)
+
+
+class TestDispatcher:
+    """Test batching, ordering, retries and rate limiting."""
+
+    @pytest.mark.asyncio
+    async def test_batches_up_to_channel_limit(self):
+        """Notifications for many users should share channel calls."""
+        channel = FakeChannel(max_batch_size=10, latency=0.001)
+        async with Dispatcher({"fake": channel}, workers=2) as dispatcher:
+            dispatcher.submit_many(note(i, user=f"u{i}") for i in range(100))
+        assert len(channel.delivered) == 100
+        assert channel.calls <= 15
+        assert dispatcher.stats["fake"].sent == 100
+
+    @pytest.mark.asyncio
+    async def test_retries_keep_per_user_order(self):
+        """A retrying notification should hold back the same user's later ones."""
+        channel = ScriptedChannel({"n00000": 2, "n00003": 1}, max_batch_size=4)
+        dispatcher = Dispatcher({"fake": channel}, base_delay=0.01, seed=1)
+        dispatcher.submit_many(note(i, user=f"u{i % 3}") for i in range(12))
+        await dispatcher.drain()
+        order = per_user(channel.delivered)
+        for user, ids in order.items():
+            assert ids == sorted(ids), user
+        assert dispatcher.stats["fake"].retries == 3
+        assert channel.delivered[0].user_id != "u0"
+        await dispatcher.aclose()
+
+    @pytest.mark.asyncio
+    async def test_permanent_and_exhausted_failures_are_dead_lettered(self):
+        """Non-retryable errors and exhausted retries should not block the lane."""
+        channel = ScriptedChannel({"n00000": 10}, max_batch_size=2)
+        rejected = FakeChannel("rejects", permanent_failure_rate=1.0)
+        dispatcher = Dispatcher(
+            {"fake": channel, "rejects": rejected}, max_attempts=3, base_delay=0.001
+        )
+        dispatcher.submit_many([note(0), note(1), note(2, channel="rejects")])
+        await dispatcher.drain()
+        assert [n.id for n in channel.delivered] == ["n00001"]
+        assert sorted(n.id for n, _ in dispatcher.dead_letters) == ["n00000", "n00002"]
+        assert dispatcher.stats["fake"].failed == 1 and dispatcher.stats["rejects"].failed == 1
+        assert dispatcher.outstanding == 0
+        await dispatcher.aclose()
+
+    @pytest.mark.asyncio
+    async def test_channel_exception_retries_whole_batch(self):
+        """An exception from a channel call should count as a retryable failure."""
+
+        class FlakyChannel(FakeChannel):
+            async def send_batch(self, notifications):
+                if self.calls == 0:
+                    self.calls += 1
+                    raise ConnectionError("reset")
+                return await super().send_batch(notifications)
+
+        channel = FlakyChannel()
+        async with Dispatcher({"fake": channel}, base_delay=0.001) as dispatcher:
+            dispatcher.submit_many(note(i, user=f"u{i}") for i in range(3))
+        assert len(channel.delivered) == 3
+        assert dispatcher.stats["fake"].retries == 3
+
+    @pytest.mark.asyncio
+    async def test_rate_limit_caps_throughput(self):
+        """Sends should not exceed the channel's token rate."""
+        channel = FakeChannel(max_batch_size=10)
+        dispatcher = Dispatcher({"fake": channel}, rate_limits={"fake": (200, 5)})
+        started = time.perf_counter()
+        dispatcher.submit_many(note(i, user=f"u{i}") for i in range(45))
+        await dispatcher.drain()
+        assert time.perf_counter() - started >= 0.18
+        assert channel.calls >= 9
+        await dispatcher.aclose()
+
+    def test_unknown_channel_is_rejected(self):
+        """Notifications must route to a configured channel."""
+        with pytest.raises(KeyError):
+            Dispatcher({"fake": FakeChannel()}).submit(note(0, channel="pager"))
+
+    @pytest.mark.asyncio
+    async def test_fake_channel_throughput_harness(self):
+        """A spike of notifications with failures should drain quickly and in order."""
+        channel = FakeChannel(max_batch_size=10, latency=0.002, failure_rate=0.05, seed=3)
+        dispatcher = Dispatcher({"fake": channel}, workers=16, base_delay=0.005, seed=3)
+        notifications = [note(i, user=f"u{i % 500}") for i in range(5000)]
+        started = time.perf_counter()
+        dispatcher.submit_many(notifications)
+        await asyncio.wait_for(dispatcher.drain(), timeout=30)
+        elapsed = time.perf_counter() - started
+        await dispatcher.aclose()
+
+        assert len(channel.delivered) == 5000 and not dispatcher.dead_letters
+        assert per_user(channel.delivered) == per_user(notifications)
+        assert channel.max_in_flight <= 16
+        assert elapsed < 10
+
+
+class TestTimerWheel:
+    """Test the hierarchical timer wheel."""
+
+    def test_matches_reference_under_random_schedule(self):
+        """Timers should fire after their deadline and before the tick past it."""
+        rng = random.Random(7)
+        wheel = TimerWheel(0.1, slots=8, levels=4)
+        deadlines = {}
+        now = 0.0
+        for _ in range(5000):
+            key = rng.randrange(300)
+            op = rng.random()
+            if op < 0.5:
+                deadlines[key] = now + rng.expovariate(1 / rng.choice([0.5, 5, 50]))
+                wheel.schedule(key, deadlines[key])
+            elif op < 0.6:
+                assert wheel.cancel(key) == (key in deadlines)
+                deadlines.pop(key, None)
+            else:
+                now += rng.random() * rng.choice([0.05, 1, 20])
+                for fired in wheel.advance(now):
+                    assert deadlines.pop(fired) <= now
+                floor = int(now / 0.1) * 0.1
+                assert all(deadline > floor - 1e-9 for deadline in deadlines.values())
+            assert len(wheel) == len(deadlines)
+
+    def test_rejects_deadlines_beyond_horizon(self):
+        """Delays longer than the wheel spans should be refused."""
+        wheel = TimerWheel(1.0, slots=4, levels=2)
+        wheel.schedule("a", wheel.horizon)
+        with pytest.raises(ValueError):
+            wheel.schedule("b", wheel.horizon + 1)
+
+
+class TestDigestCoalescer:
+    """Test per-user coalescing into digests."""
+
+    def test_single_notification_passes_through_after_window(self):
+        """A lone match should be released unchanged once its window ends."""
+        clock = FakeClock(0.0)
+        coalescer = DigestCoalescer(window=20, clock=clock)
+        coalescer.add(note(1))
+        clock.now = 19.9
+        assert coalescer.poll() == []
+        clock.now = 20.1
+        assert coalescer.poll() == [note(1)]
+        assert len(coalescer) == 0 and coalescer.digests == 0
+
+    def test_burst_becomes_one_ranked_digest(self):
+        """Matches within a window should merge, highest score first."""
+        clock = FakeClock(0.0)
+        coalescer = DigestCoalescer(window=10, max_items=2, clock=clock)
+        coalescer.add(note(9, user="u2"))
+        for i, score in enumerate([1.0, 3.0, 2.0]):
+            coalescer.add(note(i, data={"deal_id": f"d{i}"}), score)
+            clock.now += 3
+        clock.now = 10.1
+        single, digest = coalescer.poll()
+        assert digest.user_id == "u1" and digest.subject == "3 new deals"
+        assert digest.body.splitlines() == ["• Deal 1", "• Deal 2", "+1 more"]
+        assert digest.data["deal_ids"] == "d1,d2,d0"
+        assert single == note(9, user="u2")
+
+    def test_window_is_capped_by_sla(self):
+        """The hold window should leave the delivery budget inside the SLA."""
+        coalescer = DigestCoalescer(window=60, sla=30, delivery_budget=5)
+        assert coalescer.window == 25
+
+    def test_flush_releases_everything(self):
+        """Flushing should release all holds immediately."""
+        coalescer = DigestCoalescer(clock=FakeClock(0.0))
+        coalescer.add(note(1))
+        coalescer.add(note(2, user="u2"))
+        assert len(coalescer.flush()) == 2
+        assert coalescer.poll() == [] and len(coalescer) == 0
+
+    @pytest.mark.asyncio
+    async def test_run_feeds_dispatcher(self):
+        """The polling loop should submit digests to the dispatcher."""
+        coalescer = DigestCoalescer(window=0.05, tick=0.01)
+        channel = FakeChannel()
+        async with Dispatcher({"fake": channel}) as dispatcher:
+            runner = asyncio.create_task(coalescer.run(dispatcher.submit))
+            for i in range(3):
+                coalescer.add(note(i))
+            await asyncio.sleep(0.15)
+            runner.cancel()
+        assert len(channel.delivered) == 1
+        assert channel.delivered[0].subject == "3 new deals"
+
+
+class TestSNSChannel:
+    """Test SNS topic broadcasts and direct SMS publishing."""
+
+    @pytest.mark.asyncio
+    async def test_broadcast_maps_failures(self):
+        """Failed topic entries should map back to notifications by ID."""
+        client = aws_client("sns")
+        topic = "arn:aws:sns:us-east-1:123456789012:deal-notifications"
+        with Stubber(client) as stubber:
+            stubber.add_response(
+                "publish_batch",
+                {
+                    "Successful": [{"Id": "0", "MessageId": "m0"}],
+                    "Failed": [
+                        {"Id": "1", "Code": "Throttled", "SenderFault": False},
+                        {"Id": "2", "Code": "InvalidParameter", "SenderFault": True},
+                    ],
+                },
+                {
+                    "TopicArn": topic,
+                    "PublishBatchRequestEntries": [
+                        {
+                            "Id": str(i),
+                            "Message": f"Deal {i}",
+                            "MessageAttributes": {
+                                "user_id": {"DataType": "String", "StringValue": "u1"},
+                            },
+                        }
+                        for i in range(3)
+                    ],
+                },
+            )
+            outcomes = await SNSChannel(client=client).send_batch(
+                [replace(note(i, channel="sns"), recipient=topic) for i in range(3)]
+            )
+        assert outcomes[0] is None
+        assert outcomes[1].retryable and not outcomes[2].retryable
+
+    @pytest.mark.asyncio
+    async def test_direct_sms_publishes_to_recipient(self):
+        """Each phone-number notification should be published to that number alone."""
+        client = aws_client("sns")
+        notifications = [
+            Notification(id=f"n{i}", user_id=f"u{i}", channel="sns", recipient=phone, body="Deal")
+            for i, phone in enumerate(["+15550000000", "+15550000001"])
+        ]
+        with Stubber(client) as stubber:
+            stubber.add_response(
+                "publish",
+                {"MessageId": "m0"},
+                {
+                    "PhoneNumber": "+15550000000",
+                    "Message": "Deal",
+                    "MessageAttributes": {"user_id": {"DataType": "String", "StringValue": "u0"}},
+                },
+            )
+            stubber.add_client_error(
+                "publish",
+                service_error_code="Throttled",
+                http_status_code=429,
+                expected_params={
+                    "PhoneNumber": "+15550000001",
+                    "Message": "Deal",
+                    "MessageAttributes": {"user_id": {"DataType": "String", "StringValue": "u1"}},
+                },
+            )
+            channel = SNSChannel(client=client)
+            outcomes = [await channel.send_batch([n]) for n in notifications]
+        assert outcomes[0] == [None]
+        assert outcomes[1][0].retryable
+
+    @pytest.mark.asyncio
+    async def test_mixed_batch_routes_by_recipient(self):
+        """A batch should split into topic broadcasts and direct SMS."""
+        topic = "arn:aws:sns:us-east-1:123456789012:deal-alerts"
+        notifications = [
+            Notification(id="n0", user_id="u0", channel="sns", recipient="+15550000000", body="A"),
+            Notification(id="n1", user_id="ops", channel="sns", recipient=topic, body="B"),
+        ]
+        calls = []
+
+        class RecordingSNS:
+            def publish(self, **request):
+                calls.append(("publish", request["PhoneNumber"]))
+
+            def publish_batch(self, **request):
+                calls.append(("publish_batch", request["TopicArn"]))
+                return {"Failed": [{"Id": "0", "Code": "Bad", "SenderFault": True}]}
+
+        outcomes = await SNSChannel(client=RecordingSNS()).send_batch(notifications)
+        assert sorted(calls) == [("publish", "+15550000000"), ("publish_batch", topic)]
+        assert outcomes[0] is None and not outcomes[1].retryable
+
+
+class TestSESChannel:
+    """Test SESv2 bulk templated email mapping."""
+
+    @pytest.mark.asyncio
+    async def test_bulk_email_statuses(self):
+        """Entry statuses should map to success, retryable and permanent outcomes."""
+        client = aws_client("sesv2")
+        with Stubber(client) as stubber:
+            stubber.add_response(
+                "send_bulk_email",
+                {
+                    "BulkEmailEntryResults": [
+                        {"Status": "SUCCESS", "MessageId": "m0"},
+                        {"Status": "ACCOUNT_THROTTLED"},
+                        {"Status": "MESSAGE_REJECTED", "Error": "bad address"},
+                    ]
+                },
+            )
+            channel = SESChannel("deals@example.com", "deal-alert", client=client)
+            outcomes = await channel.send_batch(
+                [note(i, channel="ses", data={"url": "https://x"}) for i in range(3)]
+            )
+        assert outcomes[0] is None
+        assert outcomes[1].retryable
+        assert not outcomes[2].retryable and str(outcomes[2]) == "bad address"
+
+
+class TestHTTPChannels:
+    """Test Pushover and Slack status handling."""
+
+    @pytest.mark.asyncio
+    async def test_status_codes_map_to_outcomes(self):
+        """2xx succeeds, 429/5xx retries and other 4xx fail permanently."""
+        statuses = {"u200": 200, "u429": 429, "u503": 503, "u400": 400}
+        seen = []
+
+        def handler(request):
+            form = {k: v[0] for k, v in parse_qs(request.content.decode()).items()}
+            seen.append(form)
+            return httpx.Response(statuses[form["user"].split("@")[0]])
+
+        channel = PushoverChannel("token", transport=httpx.MockTransport(handler))
+        outcomes = await channel.send_batch(
+            [note(0, user=user, channel="pushover") for user in statuses]
+        )
+        await channel.aclose()
+        assert outcomes[0] is None
+        assert outcomes[1].retryable and outcomes[2].retryable
+        assert not outcomes[3].retryable
+        assert all(form["token"] == "token" for form in seen)
+
+    @pytest.mark.asyncio
+    async def test_slack_posts_json_to_webhook(self):
+        """Slack notifications should post the body to the recipient webhook."""
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200)
+
+        channel = SlackChannel(transport=httpx.MockTransport(handler))
+        notification = Notification(
+            id="n1",
+            user_id="u1",
+            channel="slack",
+            recipient="https://hooks.slack.com/services/T/B/X",
+            body="Deal!",
+        )
+        assert await channel.send_batch([notification]) == [None]
+        await channel.aclose()
+        assert str(requests[0].url) == notification.recipient
+        assert json.loads(requests[0].content) == {"text": "Deal!"}
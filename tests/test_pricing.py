@@ -0,0 +1,489 @@
+"""
+Unit tests for EnsembleAgent pricing.
+"""
+
+import asyncio
+import json
+import math
+import time
+
+import numpy as np
+import pytest
+from helpers import FakeClock
+
+from dealfinder.models import HashingFeaturizer
+from dealfinder.pricing import (
+    CachedEnsembleAgent,
+    EnsembleAgent,
+    PriceCache,
+    PromptCache,
+    SemanticCachedModel,
+    combine_estimates,
+    normalize_prompt,
+    product_key,
+)
+from dealfinder.schemas import Deal
+
+
+class StaticModel:
+    """Pricing model returning fixed estimates and recording its calls."""
+
+    def __init__(self, estimates, fail=False):
+        self.estimates = estimates
+        self.fail = fail
+        self.calls = []
+
+    async def estimate_batch(self, deals):
+        self.calls.append([deal.id for deal in deals])
+        if self.fail:
+            raise RuntimeError("model unavailable")
+        return [self.estimates[deal.id] for deal in deals]
+
+
+def make_deals(*prices):
+    """Build deals priced as given, with ids d0, d1, ..."""
+    return [Deal(id=f"d{i}", title=f"Deal {i}", price=price) for i, price in enumerate(prices)]
+
+
+class TestCombineEstimates:
+    """Test the vectorized ensemble weighting."""
+
+    def test_weighted_estimate_matches_design_example(self):
+        """The PROCESS_FLOWS example should produce its documented ensemble price."""
+        estimates, discounts, flags = combine_estimates(
+            np.array([[189.99], [124.50], [156.23]]),
+            np.array([0.8, 0.1, 0.1]),
+            np.array([100.0]),
+            threshold=50.0,
+        )
+        assert estimates[0] == pytest.approx(180.0, abs=0.1)
+        assert discounts[0] == pytest.approx(80.0, abs=0.1)
+        assert flags.tolist() == [True]
+
+    def test_missing_estimates_renormalize_weights(self):
+        """A NaN estimate should be excluded rather than counted as zero."""
+        estimates, _, _ = combine_estimates(
+            np.array([[np.nan], [100.0], [200.0]]),
+            np.array([0.8, 0.1, 0.1]),
+            np.array([10.0]),
+            threshold=50.0,
+        )
+        assert estimates[0] == pytest.approx(150.0)
+
+    def test_unpriced_deal_is_not_an_opportunity(self):
+        """Deals no model priced should have NaN estimates and no opportunity."""
+        estimates, discounts, flags = combine_estimates(
+            np.full((3, 1), np.nan), np.array([0.8, 0.1, 0.1]), np.array([10.0]), 50.0
+        )
+        assert math.isnan(estimates[0]) and math.isnan(discounts[0])
+        assert flags.tolist() == [False]
+
+    def test_threshold_is_strict(self):
+        """A discount exactly at the threshold is not an opportunity."""
+        _, _, flags = combine_estimates(
+            np.array([[150.0]]), np.array([1.0]), np.array([100.0]), threshold=50.0
+        )
+        assert flags.tolist() == [False]
+
+
+class TestEnsembleAgent:
+    """Test batched pricing through the EnsembleAgent."""
+
+    @pytest.mark.asyncio
+    async def test_each_model_called_once_per_batch(self):
+        """A batch should cost one call per model."""
+        deals = make_deals(100.0, 300.0)
+        models = {
+            "frontier": StaticModel({"d0": 200.0, "d1": 310.0}),
+            "specialist": StaticModel({"d0": 180.0, "d1": 290.0}),
+            "neural": StaticModel({"d0": 220.0, "d1": 300.0}),
+        }
+        pricing = await EnsembleAgent(models).price_batch(deals)
+        assert all(model.calls == [["d0", "d1"]] for model in models.values())
+        assert pricing.estimates.tolist() == pytest.approx([200.0, 307.0])
+        assert pricing.is_opportunity.tolist() == [True, False]
+        assert [o.deal.id for o in pricing.opportunities()] == ["d0"]
+
+    @pytest.mark.asyncio
+    async def test_large_batches_are_chunked(self):
+        """Batches above max_batch_size should be split per model call."""
+        deals = make_deals(*[10.0] * 5)
+        model = StaticModel({deal.id: 100.0 for deal in deals})
+        agent = EnsembleAgent({"frontier": model}, weights={"frontier": 1.0}, max_batch_size=2)
+        pricing = await agent.price_batch(deals)
+        assert [len(call) for call in model.calls] == [2, 2, 1]
+        assert pricing.is_opportunity.all()
+
+    @pytest.mark.asyncio
+    async def test_failed_model_is_treated_as_missing(self):
+        """A failing model should not sink the batch."""
+        deals = make_deals(100.0)
+        models = {
+            "frontier": StaticModel({}, fail=True),
+            "specialist": StaticModel({"d0": 160.0}),
+            "neural": StaticModel({"d0": 180.0}),
+        }
+        result = (await EnsembleAgent(models).price_batch(deals)).results()[0]
+        assert result.estimate == pytest.approx(170.0)
+        assert result.model_estimates == {"frontier": None, "specialist": 160.0, "neural": 180.0}
+        assert result.is_opportunity
+
+    @pytest.mark.asyncio
+    async def test_empty_batch(self):
+        """An empty batch should not call any model."""
+        model = StaticModel({})
+        pricing = await EnsembleAgent({"frontier": model}).price_batch([])
+        assert len(pricing) == 0 and model.calls == []
+
+    def test_rejects_model_without_weight(self):
+        """Every model needs an ensemble weight."""
+        with pytest.raises(ValueError):
+            EnsembleAgent({"mystery": StaticModel({})})
+
+
+class ScriptedModel:
+    """Pricing model whose successive calls follow a script of (delay, outcome)."""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+
+    async def estimate_batch(self, deals):
+        delay, outcome = self.script[min(self.calls, len(self.script) - 1)]
+        self.calls += 1
+        await asyncio.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return [outcome] * len(deals)
+
+
+class TestHedgedEnsemble:
+    """Test deadline and hedging behaviour of the EnsembleAgent."""
+
+    @pytest.mark.asyncio
+    async def test_deadline_returns_partial_ensemble(self):
+        """A model missing the deadline should be dropped and the result flagged."""
+        models = {
+            "frontier": ScriptedModel((5.0, 500.0)),
+            "specialist": ScriptedModel((0.0, 160.0)),
+            "neural": ScriptedModel((0.0, 180.0)),
+        }
+        agent = EnsembleAgent(models, deadline=0.05)
+        started = time.perf_counter()
+        result = await agent.price(Deal(id="d0", title="Deal", price=100.0))
+        assert time.perf_counter() - started < 1.0
+        assert result.partial
+        assert result.estimate == pytest.approx(170.0)
+        assert result.model_estimates["frontier"] is None
+
+    @pytest.mark.asyncio
+    async def test_deadline_keeps_chunks_that_answered(self):
+        """Only deals in a chunk that missed the deadline should be partial."""
+
+        class SlowOnDeal:
+            async def estimate_batch(self, deals):
+                if any(deal.id == "3" for deal in deals):
+                    await asyncio.sleep(5.0)
+                return [200.0] * len(deals)
+
+        models = {
+            "frontier": SlowOnDeal(),
+            "specialist": ScriptedModel((0.0, 160.0)),
+            "neural": ScriptedModel((0.0, 180.0)),
+        }
+        agent = EnsembleAgent(models, max_batch_size=2, deadline=0.1, hedge_quantile=None)
+        deals = [Deal(id=str(i), title=f"Deal {i}", price=100.0) for i in range(4)]
+        started = time.perf_counter()
+        batch = await agent.price_batch(deals)
+        assert time.perf_counter() - started < 1.0
+        assert batch.partial.tolist() == [False, False, True, True]
+        assert batch.model_estimates[0, :2].tolist() == [200.0, 200.0]
+        assert np.isnan(batch.model_estimates[0, 2:]).all()
+        assert batch.estimates[:2] == pytest.approx([194.0, 194.0])
+        assert batch.estimates[2:] == pytest.approx([170.0, 170.0])
+
+    @pytest.mark.asyncio
+    async def test_complete_ensemble_is_not_partial(self):
+        """When every model answers the result should not be flagged."""
+        models = {"frontier": ScriptedModel((0.0, 200.0))}
+        agent = EnsembleAgent(models, weights={"frontier": 1.0}, deadline=1.0)
+        result = await agent.price(Deal(id="d0", title="Deal", price=100.0))
+        assert not result.partial and result.estimate == 200.0
+
+    @pytest.mark.asyncio
+    async def test_slow_call_is_hedged_after_p95(self):
+        """A call exceeding the learned p95 should be raced by a duplicate."""
+        model = ScriptedModel((5.0, 999.0), (0.0, 200.0))
+        agent = EnsembleAgent({"frontier": model}, weights={"frontier": 1.0}, deadline=2.0)
+        for _ in range(50):
+            agent.latency["frontier"].record(0.01)
+        result = await agent.price(Deal(id="d0", title="Deal", price=100.0))
+        assert result.estimate == 200.0 and not result.partial
+        assert agent.hedges_sent["frontier"] == 1
+        assert model.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_cancelled_attempt_is_recorded_as_lower_bound(self):
+        """A primary cut off by the winning hedge should still count as a slow sample."""
+        model = ScriptedModel((5.0, 999.0), (0.0, 200.0))
+        agent = EnsembleAgent({"frontier": model}, weights={"frontier": 1.0}, deadline=2.0)
+        for _ in range(50):
+            agent.latency["frontier"].record(0.01)
+        await agent.price(Deal(id="d0", title="Deal", price=100.0))
+        await asyncio.sleep(0)
+        assert agent.latency["frontier"].count == 52
+        assert agent.latency["frontier"].quantile(1.0) >= 0.01
+
+    @pytest.mark.asyncio
+    async def test_no_hedge_without_latency_history(self):
+        """Models without enough samples should not be hedged."""
+        model = ScriptedModel((0.02, 200.0))
+        agent = EnsembleAgent({"frontier": model}, weights={"frontier": 1.0})
+        assert agent.hedge_delay("frontier") is None
+        await agent.price(Deal(id="d0", title="Deal", price=100.0))
+        assert agent.hedges_sent["frontier"] == 0
+        assert agent.latency["frontier"].count == 1
+
+    @pytest.mark.asyncio
+    async def test_fast_failure_is_retried_once(self):
+        """A failed primary should be retried before giving up."""
+        model = ScriptedModel((0.0, RuntimeError("throttled")), (0.0, 200.0))
+        agent = EnsembleAgent({"frontier": model}, weights={"frontier": 1.0})
+        result = await agent.price(Deal(id="d0", title="Deal", price=100.0))
+        assert result.estimate == 200.0
+        assert model.calls == 2
+
+
+class TestProductKey:
+    """Test canonical product identity extraction."""
+
+    def test_asin_from_url(self):
+        """Amazon product URLs should key on the ASIN."""
+        deal = Deal(
+            id="1", title="Headphones", price=1.0, url="https://www.amazon.com/dp/B09XS7JWHH?tag=x"
+        )
+        assert product_key(deal) == "asin:B09XS7JWHH"
+
+    def test_valid_upc_in_description(self):
+        """A checksum-valid UPC should be used as a GTIN."""
+        deal = Deal(id="1", title="Switch", price=1.0, description="UPC 045496882174")
+        assert product_key(deal) == "gtin:00045496882174"
+
+    def test_invalid_upc_is_ignored(self):
+        """Twelve digits with a bad check digit should not be treated as a UPC."""
+        deal = Deal(id="1", title="Order 123456789013 ships", price=1.0)
+        assert not product_key(deal).startswith("gtin:")
+
+    def test_model_number_is_brand_qualified(self):
+        """Model numbers should ignore punctuation and price text."""
+        a = Deal(id="1", title="Sony WH-1000XM5 Headphones $248", price=248.0)
+        b = Deal(id="2", title="Sony WH1000XM5 wireless, 30% off", price=230.0)
+        assert product_key(a) == product_key(b) == "model:sony:wh1000xm5"
+
+    def test_specs_are_not_model_numbers(self):
+        """Capacity and size tokens should not be mistaken for model numbers."""
+        deal = Deal(id="1", title="Samsung 128GB microSD card $12.99", price=12.99)
+        assert product_key(deal).startswith("title:")
+
+    def test_title_fallback_ignores_price_and_order(self):
+        """Title hashes should not depend on the price or word order."""
+        a = Deal(id="1", title="Instant Pot Duo Plus $59.99", price=59.99)
+        b = Deal(id="2", title="Duo Plus Instant Pot - $64.99", price=64.99)
+        assert product_key(a) == product_key(b)
+
+
+class TestPriceCache:
+    """Test the two-tier price-estimate cache."""
+
+    def test_ttl_shrinks_with_volatility(self, redis):
+        """Volatile prices should get shorter TTLs than stable ones."""
+        cache = PriceCache(redis, model_version="v1")
+        stable = cache.ttl_for([100.0, 100.0, 100.0])
+        volatile = cache.ttl_for([60.0, 100.0, 140.0])
+        assert stable == cache.max_ttl
+        assert cache.min_ttl <= volatile < stable
+        assert cache.ttl_for([100.0]) == cache.default_ttl
+
+    @pytest.mark.asyncio
+    async def test_round_trip_through_redis(self, redis):
+        """Entries written by one worker should be readable by another."""
+        writer = PriceCache(redis, model_version="v1")
+        await writer.set_many({"asin:B0": {"frontier": 200.0}}, {"asin:B0": 150.0})
+        reader = PriceCache(redis, model_version="v1")
+        found = await reader.get_many(["asin:B0", "asin:B1"])
+        assert found["asin:B0"].model_estimates == {"frontier": 200.0}
+        assert reader.hits == 1 and reader.misses == 1
+        assert 0 < await redis.ttl("pricing:estimate:v1:asin:B0") <= writer.default_ttl
+
+    @pytest.mark.asyncio
+    async def test_model_version_isolates_entries(self, redis):
+        """A new model version should not see the previous version's estimates."""
+        cache = PriceCache(redis, model_version="v1")
+        await cache.set_many({"asin:B0": {"frontier": 200.0}}, {"asin:B0": 150.0})
+        cache.rollout("v2")
+        assert await cache.get_many(["asin:B0"]) == {}
+
+    @pytest.mark.asyncio
+    async def test_invalidate_clears_both_tiers(self, redis):
+        """Invalidated products should miss in the LRU and Redis."""
+        cache = PriceCache(redis, model_version="v1")
+        await cache.set_many({"asin:B0": {"frontier": 200.0}}, {"asin:B0": 150.0})
+        await cache.invalidate(["asin:B0"])
+        assert await cache.get_many(["asin:B0"]) == {}
+
+    @pytest.mark.asyncio
+    async def test_cached_products_skip_model_calls(self, redis):
+        """Repeat products should be priced from the cache with their own discount."""
+        model = StaticModel({"a": 300.0, "b": 300.0, "c": 300.0})
+        agent = CachedEnsembleAgent(
+            EnsembleAgent({"frontier": model}, weights={"frontier": 1.0}),
+            PriceCache(redis, model_version="v1"),
+        )
+        url = "https://www.amazon.com/dp/B09XS7JWHH"
+        first = await agent.price_batch([Deal(id="a", title="XM5", price=200.0, url=url)])
+        second = await agent.price_batch(
+            [
+                Deal(id="b", title="XM5 again", price=280.0, url=url),
+                Deal(id="c", title="LEGO Falcon", price=100.0),
+            ]
+        )
+        assert model.calls == [["a"], ["c"]]
+        assert first.discounts.tolist() == [100.0]
+        assert second.discounts.tolist() == [20.0, 200.0]
+        assert second.is_opportunity.tolist() == [False, True]
+
+    @pytest.mark.asyncio
+    async def test_partial_results_are_not_cached(self, redis):
+        """Estimates missing a model should be recomputed next time."""
+        models = {
+            "frontier": StaticModel({}, fail=True),
+            "neural": StaticModel({"a": 100.0, "b": 100.0}),
+        }
+        agent = CachedEnsembleAgent(
+            EnsembleAgent(models, weights={"frontier": 0.9, "neural": 0.1}),
+            PriceCache(redis, model_version="v1"),
+        )
+        await agent.price_batch([Deal(id="a", title="Thing", price=10.0)])
+        result = await agent.price_batch([Deal(id="b", title="Thing", price=10.0)])
+        assert result.partial.tolist() == [True]
+        assert models["neural"].calls == [["a"], ["b"]]
+
+
+class HashingEmbedder:
+    """Deterministic bag-of-words embedder for cache tests."""
+
+    def __init__(self):
+        self.featurizer = HashingFeaturizer(512, ngram_range=(1, 1))
+        self.calls = 0
+
+    async def embed(self, texts):
+        self.calls += 1
+        return self.featurizer.transform(texts)
+
+
+def frontier_prompt(deal):
+    """Pricing prompt in the style sent to the Frontier model."""
+    return f"Estimate the retail price of this product: {deal.title}. {deal.description or ''}"
+
+
+class TestNormalizePrompt:
+    """Test prompt normalization."""
+
+    def test_strips_retailer_coupon_and_url(self):
+        """Retailer, coupon code and link differences should normalize away."""
+        a = normalize_prompt("Price: Sony WH-1000XM5 at Amazon. Use code SAVE20 https://amzn.to/x")
+        b = normalize_prompt("Price: Sony WH-1000XM5 from Best Buy.   Clip $20 off coupon")
+        assert a == b == "price: sony wh-1000xm5 ."
+
+
+class TestPromptCache:
+    """Test the exact and semantic Frontier prompt cache."""
+
+    @pytest.mark.asyncio
+    async def test_exact_hit_after_normalization(self, redis):
+        """A prompt differing only by retailer should be an exact hit with its age."""
+        clock = FakeClock()
+        cache = PromptCache(redis, HashingEmbedder(), clock=clock)
+        await cache.store_many(["Price of Instant Pot Duo at Walmart"], [89.0])
+        clock.now += 30
+        (hit,) = await cache.lookup_many(["Price of Instant Pot Duo from Target"])
+        assert hit.exact and hit.estimate == 89.0 and hit.age == 30
+        assert cache.stats.exact_hits == 1
+
+    @pytest.mark.asyncio
+    async def test_near_hit_by_embedding_similarity(self, redis):
+        """A trivially different prompt should be a near hit above the threshold."""
+        cache = PromptCache(redis, HashingEmbedder(), threshold=0.9, clock=FakeClock())
+        base = "price of sony wh-1000xm5 wireless noise cancelling headphones black color"
+        await cache.store_many([base], [348.0])
+        (hit,) = await cache.lookup_many([base + " renewed"])
+        assert hit is not None and not hit.exact
+        assert 0.9 <= hit.similarity < 1.0
+        (miss,) = await cache.lookup_many(["price of lego millennium falcon 75375"])
+        assert miss is None
+        assert cache.stats.near_hits == 1 and cache.stats.misses == 1
+
+    @pytest.mark.asyncio
+    async def test_expired_entries_are_not_near_hits(self, redis):
+        """Entries older than the TTL should be ignored by similarity search."""
+        clock = FakeClock()
+        cache = PromptCache(redis, HashingEmbedder(), threshold=0.5, ttl=60, clock=clock)
+        await cache.store_many(["price of kindle paperwhite"], [139.0])
+        clock.now += 61
+        assert await cache.lookup_many(["price of kindle paperwhite 2024"]) == [None]
+
+    @pytest.mark.asyncio
+    async def test_warm_loads_shared_entries(self, redis):
+        """A new instance should find near hits written by another instance."""
+        writer = PromptCache(redis, HashingEmbedder(), threshold=0.8, clock=FakeClock())
+        await writer.store_many(["price of apple airpods pro 2 usb-c"], [249.0])
+        reader = PromptCache(redis, HashingEmbedder(), threshold=0.8, clock=FakeClock())
+        assert await reader.warm() == 1
+        (hit,) = await reader.lookup_many(["price of apple airpods pro 2 usb-c case"])
+        assert hit is not None and hit.estimate == 249.0
+
+    @pytest.mark.asyncio
+    async def test_exact_entries_do_not_carry_embeddings(self, redis):
+        """Exact lookups should not fetch the embedding used for warming."""
+        cache = PromptCache(redis, HashingEmbedder(), clock=FakeClock())
+        await cache.store_many(["price of kindle paperwhite"], [139.0])
+        digest = cache.digest("price of kindle paperwhite")
+        assert json.loads(await redis.get(f"pricing:prompt:entry:{digest}")) == {
+            "estimate": 139.0,
+            "created": FakeClock().now,
+        }
+        assert len(await redis.get(f"pricing:prompt:embedding:{digest}")) == 512 * 4
+
+    @pytest.mark.asyncio
+    async def test_stale_hits_are_counted_as_misses(self, redis):
+        """Entries older than ``max_age`` should be re-fetched and not count as hits."""
+        clock = FakeClock()
+        model = StaticModel({"a": 89.0, "b": 95.0})
+        cache = PromptCache(redis, HashingEmbedder(), clock=clock)
+        frontier = SemanticCachedModel(model, cache, frontier_prompt, max_age=60)
+        await frontier.estimate_batch([Deal(id="a", title="Instant Pot Duo", price=60)])
+        clock.now += 61
+        assert await frontier.estimate_batch([Deal(id="b", title="Instant Pot Duo", price=60)]) == [
+            95.0
+        ]
+        assert model.calls == [["a"], ["b"]]
+        assert cache.stats.exact_hits == cache.stats.near_hits == 0
+        assert cache.stats.hit_rate == 0.0 and cache.stats.latency_saved == 0.0
+
+    @pytest.mark.asyncio
+    async def test_cached_model_only_calls_frontier_on_misses(self, redis):
+        """Cached prompts should not reach the wrapped model and savings should be counted."""
+        model = StaticModel({"a": 89.0, "b": 89.0, "c": 500.0})
+        cache = PromptCache(redis, HashingEmbedder(), clock=FakeClock())
+        frontier = SemanticCachedModel(model, cache, frontier_prompt)
+        await frontier.estimate_batch([Deal(id="a", title="Instant Pot Duo at Walmart", price=60)])
+        estimates = await frontier.estimate_batch(
+            [
+                Deal(id="b", title="Instant Pot Duo at Target", price=65),
+                Deal(id="c", title="Peloton Bike", price=900),
+            ]
+        )
+        assert estimates == [89.0, 500.0]
+        assert model.calls == [["a"], ["c"]]
+        assert cache.stats.hit_rate == pytest.approx(1 / 3)
+        assert cache.stats.latency_saved >= 0
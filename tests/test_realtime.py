@@ -0,0 +1,248 @@
+"""
+Unit tests and a fan-out benchmark for the WebSocket hub.
+"""
+
+import asyncio
+import gc
+import json
+import time
+import tracemalloc
+
+import fakeredis
+import pytest
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+from helpers import DroppingRedis, settle
+from starlette.websockets import WebSocketDisconnect
+
+from dealfinder.realtime import CLOSE_TOO_SLOW, Hub, encode_message
+
+
+def own_topics(user_id, topic):
+    """Let users subscribe to shared deal topics and their own topic."""
+    return topic.startswith("deals:") or topic == f"user:{user_id}"
+
+
+class FakeWebSocket:
+    """Records frames; ``gate`` blocks sends to simulate a slow client."""
+
+    def __init__(self, gate=None):
+        self.frames = []
+        self.closed = None
+        self.gate = gate
+        self.incoming = asyncio.Queue()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        if self.gate is not None:
+            await self.gate.wait()
+        self.frames.append(text)
+
+    async def close(self, code=1000):
+        self.closed = code
+
+    async def receive_text(self):
+        message = await self.incoming.get()
+        if message is None:
+            raise WebSocketDisconnect()
+        return message
+
+
+class SinkWebSocket:
+    """Minimal socket that counts frames, for the benchmark."""
+
+    __slots__ = ("frames",)
+
+    def __init__(self):
+        self.frames = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.frames += 1
+
+    async def close(self, code=1000):
+        pass
+
+
+class TestHub:
+    """Test subscription, fan-out and slow-consumer handling."""
+
+    @pytest.mark.asyncio
+    async def test_publish_reaches_topic_subscribers_only(self):
+        """A message should go to every subscriber of its topic, encoded once."""
+        hub = Hub()
+        deals, other = FakeWebSocket(), FakeWebSocket()
+        await hub.connect(deals, ["deals"])
+        await hub.connect(other, ["other"])
+        await hub.publish("deals", {"id": "d1", "price": 9.5})
+        await settle()
+        assert deals.frames == [encode_message("deals", {"id": "d1", "price": 9.5})]
+        assert other.frames == []
+        assert json.loads(deals.frames[0]) == {"topic": "deals", "data": {"id": "d1", "price": 9.5}}
+        await hub.aclose()
+
+    @pytest.mark.asyncio
+    async def test_slow_consumer_drops_oldest(self):
+        """A blocked client should keep only the newest frames."""
+        hub = Hub(max_queue=2)
+        gate = asyncio.Event()
+        slow = FakeWebSocket(gate)
+        await hub.connect(slow, ["deals"])
+        await settle()
+        for i in range(5):
+            hub.deliver("deals", str(i))
+        await settle()
+        gate.set()
+        await settle()
+        assert slow.frames == ["3", "4"]
+        assert hub.dropped == 3 and len(hub) == 1
+        await hub.aclose()
+
+    @pytest.mark.asyncio
+    async def test_slow_consumer_disconnected(self):
+        """With the disconnect policy an overflowing client should be closed."""
+        hub = Hub(max_queue=1, overflow="disconnect")
+        slow = FakeWebSocket(asyncio.Event())
+        await hub.connect(slow, ["deals"])
+        await settle()
+        for i in range(3):
+            hub.deliver("deals", str(i))
+        slow.gate.set()
+        await settle()
+        assert slow.closed == CLOSE_TOO_SLOW
+        assert len(hub) == 0 and hub.subscribers("deals") == 0 and hub.disconnected == 1
+
+    @pytest.mark.asyncio
+    async def test_serve_handles_topic_changes_and_disconnect(self):
+        """Clients should (un)subscribe by message and be removed on disconnect."""
+        hub = Hub(authorize=own_topics)
+        socket = FakeWebSocket()
+        session = asyncio.create_task(hub.serve(socket, "u1"))
+        socket.incoming.put_nowait('{"subscribe": ["deals:a", "deals:b"]}')
+        socket.incoming.put_nowait("not json")
+        socket.incoming.put_nowait('{"unsubscribe": ["deals:a"]}')
+        await settle()
+        assert (hub.subscribers("deals:a"), hub.subscribers("deals:b")) == (0, 1)
+        socket.incoming.put_nowait(None)
+        await session
+        assert len(hub) == 0 and hub.subscribers("deals:b") == 0
+
+    @pytest.mark.asyncio
+    async def test_serve_refuses_unauthorized_topics(self):
+        """Clients should only get topics authorize allows for their user."""
+        hub = Hub(authorize=own_topics)
+        socket = FakeWebSocket()
+        session = asyncio.create_task(hub.serve(socket, "u1"))
+        socket.incoming.put_nowait('{"subscribe": ["user:u1", "user:u2", "deals:x\\nuser:u2"]}')
+        await settle()
+        assert hub.subscribers("user:u1") == 1
+        assert hub.subscribers("user:u2") == 0 and hub.subscribers("deals:x\nuser:u2") == 0
+        socket.incoming.put_nowait(None)
+        await session
+
+        unrestricted = Hub()
+        socket = FakeWebSocket()
+        session = asyncio.create_task(unrestricted.serve(socket, "u1", ["deals:a"]))
+        socket.incoming.put_nowait('{"subscribe": ["deals:b"]}')
+        await settle()
+        assert unrestricted.subscribers("deals:a") == 1 and unrestricted.subscribers("deals:b") == 0
+        socket.incoming.put_nowait(None)
+        await session
+
+    @pytest.mark.asyncio
+    async def test_topics_with_newlines_are_rejected(self):
+        """A newline would split the pub/sub envelope in the wrong place."""
+        hub = Hub()
+        with pytest.raises(ValueError):
+            await hub.publish("deals\nother", {})
+        with pytest.raises(ValueError):
+            hub.subscribe(await hub.connect(FakeWebSocket()), "a\nb")
+        await hub.aclose()
+
+    @pytest.mark.asyncio
+    async def test_redis_fans_out_across_instances(self):
+        """A publish on one instance should reach subscribers of every instance."""
+        server = fakeredis.FakeServer()
+        hubs = [Hub(fakeredis.FakeAsyncRedis(server=server)) for _ in range(2)]
+        sockets = [FakeWebSocket() for _ in hubs]
+        for hub, socket in zip(hubs, sockets):
+            await hub.start()
+            await hub.connect(socket, ["deals"])
+        await hubs[0].publish("deals", "hello")
+        for _ in range(50):
+            if all(socket.frames for socket in sockets):
+                break
+            await asyncio.sleep(0.01)
+        assert [socket.frames for socket in sockets] == [[encode_message("deals", "hello")]] * 2
+        for hub in hubs:
+            await hub.aclose()
+
+    @pytest.mark.asyncio
+    async def test_relay_resubscribes_after_connection_loss(self, caplog):
+        """A dropped subscription should be logged and re-established."""
+        redis = DroppingRedis(fakeredis.FakeAsyncRedis())
+        hub = Hub(redis)
+        socket = FakeWebSocket()
+        await hub.start()
+        await hub.connect(socket, ["deals"])
+        for _ in range(100):
+            if redis.pubsubs == 2 and await redis.pubsub_numsub("realtime") == [(b"realtime", 1)]:
+                break
+            await asyncio.sleep(0.01)
+        await hub.publish("deals", "hello")
+        for _ in range(50):
+            if socket.frames:
+                break
+            await asyncio.sleep(0.01)
+        assert socket.frames == [encode_message("deals", "hello")]
+        assert "subscription lost" in caplog.text
+        await hub.aclose()
+
+    def test_fastapi_endpoint(self):
+        """The hub should serve a real Starlette WebSocket route."""
+        hub = Hub()
+        app = FastAPI()
+
+        @app.websocket("/ws")
+        async def stream(websocket: WebSocket):
+            await hub.serve(websocket, "u1", ["deals"])
+
+        @app.post("/publish")
+        async def publish():
+            await hub.publish("deals", {"id": "d1"})
+
+        with TestClient(app) as client, client.websocket_connect("/ws") as ws:
+            client.post("/publish")
+            assert ws.receive_json() == {"topic": "deals", "data": {"id": "d1"}}
+
+    @pytest.mark.benchmark
+    @pytest.mark.asyncio
+    async def test_fanout_benchmark(self):
+        """Report fan-out throughput and memory per connection; run with ``-m benchmark``."""
+        connections, messages = 20_000, 20
+        hub = Hub(max_queue=64)
+        sockets = [SinkWebSocket() for _ in range(connections)]
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for socket in sockets:
+            await hub.connect(socket, ["deals"])
+        await settle()
+        per_connection = (tracemalloc.get_traced_memory()[0] - before) / connections
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        for i in range(messages):
+            await hub.publish("deals", {"id": f"d{i}", "title": "Deal", "price": 19.99})
+            await asyncio.sleep(0)
+        while any(socket.frames < messages for socket in sockets[-10:]):
+            await asyncio.sleep(0)
+        rate = connections * messages / (time.perf_counter() - start)
+        print(f"\nfan-out: {rate:,.0f} messages/s, {per_connection:,.0f} bytes/connection")
+        assert all(socket.frames == messages for socket in sockets)
+        assert rate > 100_000
+        await hub.aclose()
@@ -0,0 +1,204 @@
+"""
+Unit tests for the business-rule engine.
+"""
+
+import json
+import os
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+import pytest
+from helpers import FakeClock
+
+from dealfinder.pricing import combine_estimates
+from dealfinder.pricing.ensemble import BatchPricing
+from dealfinder.rules import (
+    DEFAULT_RULES,
+    RuleEngine,
+    RuleError,
+    RuleSet,
+    compile_expression,
+    deal_columns,
+)
+from dealfinder.schemas import Deal
+
+NOW = datetime(2026, 3, 2, 14, 30, tzinfo=UTC)
+
+
+def batch(rows):
+    """BatchPricing for ``(deal, estimate)`` rows."""
+    deals = [deal for deal, _ in rows]
+    model_estimates = np.array([[np.nan if e is None else e for _, e in rows]])
+    prices = np.array([deal.price for deal in deals])
+    estimates, discounts, flags = combine_estimates(model_estimates, np.array([1.0]), prices, 50)
+    return BatchPricing(
+        deals=deals,
+        models=("frontier",),
+        model_estimates=model_estimates,
+        estimates=estimates,
+        discounts=discounts,
+        is_opportunity=flags,
+        partial=np.zeros(len(deals), dtype=bool),
+    )
+
+
+def deal(i, price, category=None, retailer=None, published_at=None):
+    """A deal with the fields rules look at."""
+    return Deal(
+        id=f"d{i}",
+        title=f"Deal {i}",
+        price=price,
+        category=category,
+        retailer=retailer,
+        published_at=published_at,
+    )
+
+
+class TestCompileExpression:
+    """Test the expression compiler."""
+
+    def columns(self):
+        return deal_columns(
+            [deal(0, 10.0, "Books"), deal(1, 200.0, "Toys", "Wish")],
+            [30.0, np.nan],
+            [20.0, np.nan],
+            now=NOW,
+        )
+
+    @pytest.mark.parametrize(
+        ("source", "expected"),
+        [
+            ("category == 'books'", [True, False]),
+            ("category in ['BOOKS', 'games']", [True, False]),
+            ("retailer not in ['wish']", [True, False]),
+            ("5 < price <= 10", [True, False]),
+            ("discount_pct > 50", [True, False]),
+            ("estimate > 2 * price or hour == 14", [True, True]),
+            ("not discount > 0", [False, True]),
+            ("-price < -100", [False, True]),
+        ],
+    )
+    def test_evaluates_column_wise(self, source, expected):
+        """Expressions should yield one boolean per deal."""
+        assert compile_expression(source)(self.columns()).tolist() == expected
+
+    @pytest.mark.parametrize(
+        "source",
+        ["__import__('os')", "price.real > 1", "bogus > 1", "price in other", "price >", "x[0]"],
+    )
+    def test_rejects_unsupported_syntax(self, source):
+        """Only whitelisted columns and operators should compile."""
+        with pytest.raises(RuleError):
+            compile_expression(source)
+
+    def test_naive_published_at_is_utc(self):
+        """Naive timestamps should be aged as UTC instead of failing the batch."""
+        naive = NOW.replace(tzinfo=None) - timedelta(hours=3)
+        columns = deal_columns(
+            [deal(0, 10.0, published_at=naive), deal(1, 10.0, published_at=NOW)],
+            [20.0, 20.0],
+            [10.0, 10.0],
+            now=NOW,
+        )
+        assert columns["age_hours"].tolist() == [3.0, 0.0]
+
+
+class TestRuleSet:
+    """Test rule configuration parsing."""
+
+    def test_requires_one_action_and_unique_names(self):
+        """Rules need exactly one action and distinct names."""
+        with pytest.raises(RuleError):
+            RuleSet.from_config({"rules": [{"name": "a", "require": "1", "reject": "1"}]})
+        with pytest.raises(RuleError):
+            RuleSet.from_config({"rules": [{"name": "a", "reject": "price > 1"}] * 2})
+
+    def test_version_tracks_content(self):
+        """Identical configs share a version; edits change it."""
+        config = {"rules": [{"name": "a", "reject": "price > 1"}]}
+        assert RuleSet.from_config(config).version == RuleSet.from_config(config).version
+        config["rules"][0]["reject"] = "price > 2"
+        assert RuleSet.from_config(config).version != DEFAULT_RULES.version
+
+
+class TestRuleEngine:
+    """Test evaluation, hit counting and hot reload."""
+
+    def test_default_rules_match_dollar_threshold(self):
+        """Without configuration the engine keeps the $50 discount check."""
+        priced = batch([(deal(0, 100.0), 200.0), (deal(1, 100.0), 140.0), (deal(2, 100.0), None)])
+        result = RuleEngine(clock=FakeClock(NOW.timestamp())).apply(priced)
+        assert result.is_opportunity.tolist() == priced.is_opportunity.tolist()
+
+    def test_scoped_thresholds_blocklists_and_hits(self):
+        """Rules should combine per deal and count the deals each rejects."""
+        rules = RuleSet.from_config(
+            {
+                "rules": [
+                    {
+                        "name": "min_discount",
+                        "require": "discount > 50",
+                        "when": "category != 'books'",
+                    },
+                    {
+                        "name": "books_discount",
+                        "require": "discount > 10",
+                        "when": "category == 'books'",
+                    },
+                    {"name": "blocked", "reject": "retailer in ['wish']"},
+                    {"name": "sanity", "reject": "estimate > 20 * price"},
+                    {"name": "stale", "reject": "age_hours > 48"},
+                ]
+            }
+        )
+        engine = RuleEngine(rules, clock=FakeClock(NOW.timestamp()))
+        priced = batch(
+            [
+                (deal(0, 20.0, "Books"), 40.0),
+                (deal(1, 100.0, "Toys"), 140.0),
+                (deal(2, 100.0, "Toys", "Wish"), 300.0),
+                (deal(3, 5.0, "Toys"), 500.0),
+                (deal(4, 100.0, "Toys", published_at=NOW - timedelta(days=3)), 300.0),
+                (deal(5, 100.0, "Toys", published_at=NOW - timedelta(hours=1)), 300.0),
+            ]
+        )
+        result = engine.apply(priced)
+        assert result.is_opportunity.tolist() == [True, False, False, False, False, True]
+        assert engine.hits == {
+            "min_discount": 1,
+            "books_discount": 0,
+            "blocked": 1,
+            "sanity": 1,
+            "stale": 1,
+        }
+        assert (engine.evaluated, engine.passed) == (6, 2)
+
+    def test_time_of_day_uses_engine_timezone(self):
+        """Hour columns should reflect the clock in the configured zone."""
+        rules = RuleSet.from_config({"rules": [{"name": "quiet", "reject": "hour < 6"}]})
+        priced = batch([(deal(0, 100.0), 300.0)])
+        clock = FakeClock(datetime(2026, 3, 2, 3, tzinfo=UTC).timestamp())
+        assert not RuleEngine(rules, clock=clock).apply(priced).is_opportunity[0]
+        clock.now += 4 * 3600
+        assert RuleEngine(rules, clock=clock).apply(priced).is_opportunity[0]
+
+    def test_hot_reload_and_bad_file_keeps_rules(self, tmp_path):
+        """Changed rule files should swap in; invalid ones should be ignored."""
+        path = tmp_path / "rules.json"
+        path.write_text(json.dumps({"rules": [{"name": "cheap", "require": "price < 50"}]}))
+        clock = FakeClock(NOW.timestamp())
+        engine = RuleEngine(path=path, reload_interval=10, clock=clock)
+        priced = batch([(deal(0, 100.0), 300.0)])
+        assert not engine.apply(priced).is_opportunity[0]
+
+        path.write_text(json.dumps({"rules": [{"name": "cheap", "require": "price < 500"}]}))
+        os.utime(path, ns=(1, 1))
+        assert not engine.apply(priced).is_opportunity[0]
+        clock.now += 10
+        assert engine.apply(priced).is_opportunity[0]
+
+        version = engine.rules.version
+        path.write_text(json.dumps({"rules": [{"name": "broken", "require": "price <"}]}))
+        os.utime(path, ns=(2, 2))
+        assert not engine.reload()
+        assert engine.rules.version == version
@@ -0,0 +1,326 @@
+"""
+Unit tests for the ScannerAgent feed fetching and parsing components.
+"""
+
+import asyncio
+from datetime import UTC, datetime
+
+import feedparser
+import httpx
+import pytest
+
+from dealfinder.scanner import (
+    FeedEntry,
+    FeedFetcher,
+    FeedValidators,
+    HighWaterMark,
+    HighWaterMarkStore,
+    PollScheduler,
+    iter_entries,
+    parse_new_entries,
+)
+from dealfinder.state import InMemoryStateStore
+
+RSS_BODY = b"<rss><channel><title>Deals</title></channel></rss>"
+
+
+def conditional_handler(request: httpx.Request) -> httpx.Response:
+    """Serve a feed that honours ETag/Last-Modified validators."""
+    if request.headers.get("If-None-Match") == '"v1"':
+        return httpx.Response(304)
+    return httpx.Response(
+        200,
+        content=RSS_BODY,
+        headers={"ETag": '"v1"', "Last-Modified": "Sat, 17 Oct 2026 10:00:00 GMT"},
+    )
+
+
+class TestFeedValidators:
+    """Test conditional request header handling."""
+
+    def test_headers_include_both_validators(self):
+        """Both validators should be sent when known."""
+        validators = FeedValidators(etag='"abc"', last_modified="Sat, 17 Oct 2026 10:00:00 GMT")
+        assert validators.headers() == {
+            "If-None-Match": '"abc"',
+            "If-Modified-Since": "Sat, 17 Oct 2026 10:00:00 GMT",
+        }
+
+    def test_empty_validators_send_no_headers(self):
+        """Unknown feeds should be fetched unconditionally."""
+        assert FeedValidators().headers() == {}
+
+    def test_round_trip_through_dict(self):
+        """Validators should survive persistence as a plain dict."""
+        validators = FeedValidators(etag='"abc"')
+        assert FeedValidators.from_dict(validators.to_dict()) == validators
+
+
+class TestFeedFetcher:
+    """Test the pooled feed fetcher."""
+
+    @pytest.mark.asyncio
+    async def test_first_fetch_downloads_and_records_validators(self):
+        """A first fetch should download the body and remember the ETag."""
+        async with FeedFetcher(transport=httpx.MockTransport(conditional_handler)) as fetcher:
+            result = await fetcher.fetch("https://deals.example.com/rss")
+        assert result.ok
+        assert result.content == RSS_BODY
+        assert fetcher.validators["https://deals.example.com/rss"].etag == '"v1"'
+
+    @pytest.mark.asyncio
+    async def test_unchanged_feed_returns_not_modified(self):
+        """A repeat fetch with stored validators should cost a 304."""
+        url = "https://deals.example.com/rss"
+        validators = {url: FeedValidators(etag='"v1"')}
+        transport = httpx.MockTransport(conditional_handler)
+        async with FeedFetcher(validators=validators, transport=transport) as fetcher:
+            result = await fetcher.fetch(url)
+        assert result.not_modified
+        assert result.content is None
+        assert validators[url].etag == '"v1"'
+
+    @pytest.mark.asyncio
+    async def test_errors_are_captured_per_feed(self):
+        """One failing feed should not abort the others."""
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.host == "broken.example.com":
+                raise httpx.ConnectError("connection refused", request=request)
+            if request.url.host == "gone.example.com":
+                return httpx.Response(404)
+            return httpx.Response(200, content=RSS_BODY)
+
+        urls = [
+            "https://ok.example.com/rss",
+            "https://broken.example.com/rss",
+            "https://gone.example.com/rss",
+        ]
+        async with FeedFetcher(transport=httpx.MockTransport(handler)) as fetcher:
+            results = await fetcher.fetch_all(urls)
+        assert [r.url for r in results] == urls
+        assert results[0].ok
+        assert results[1].status is None and "ConnectError" in results[1].error
+        assert results[2].status == 404 and not results[2].ok
+
+    @pytest.mark.asyncio
+    async def test_per_host_concurrency_is_limited(self):
+        """No more than max_connections_per_host requests should be in flight per host."""
+        in_flight = 0
+        peak = 0
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return httpx.Response(200, content=RSS_BODY)
+
+        urls = [f"https://aggregator.example.com/feed/{i}" for i in range(12)]
+        transport = httpx.MockTransport(handler)
+        async with FeedFetcher(max_connections_per_host=3, transport=transport) as fetcher:
+            results = await fetcher.fetch_all(urls)
+        assert all(r.ok for r in results)
+        assert peak == 3
+
+    def test_rejects_zero_per_host_limit(self):
+        """A per-host limit below one would deadlock every fetch."""
+        with pytest.raises(ValueError):
+            FeedFetcher(max_connections_per_host=0)
+
+
+def rss_document(count: int) -> bytes:
+    """Build an RSS feed with ``count`` items, newest first."""
+    items = "".join(
+        f"<item><title>Deal {i}</title><link>https://deals.example.com/{i}</link>"
+        f"<guid>deal-{i}</guid><pubDate>Sat, 17 Oct 2026 10:{i % 60:02d}:00 GMT</pubDate></item>"
+        for i in range(count, 0, -1)
+    )
+    return f"<rss version='2.0'><channel><title>Deals</title>{items}</channel></rss>".encode()
+
+
+ATOM_BODY = b"""<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <title>Atom Deals</title>
+  <entry>
+    <title>Headphones $248</title>
+    <link rel="alternate" href="https://atom.example.com/2"/>
+    <id>urn:deal:2</id>
+    <updated>2026-10-17T10:05:00Z</updated>
+    <summary>Sony WH-1000XM5</summary>
+  </entry>
+  <entry>
+    <title>Monitor $199</title>
+    <link rel="alternate" href="https://atom.example.com/1"/>
+    <id>urn:deal:1</id>
+    <updated>2026-10-17T10:00:00Z</updated>
+  </entry>
+</feed>"""
+
+
+class TestIncrementalParser:
+    """Test the early-terminating feed parser."""
+
+    def test_parses_rss_items_in_document_order(self):
+        """RSS items should come back newest first with ids and dates."""
+        entries = list(iter_entries(rss_document(3)))
+        assert [e.id for e in entries] == ["deal-3", "deal-2", "deal-1"]
+        assert entries[0].link == "https://deals.example.com/3"
+        assert entries[0].published is not None
+
+    def test_parses_atom_entries(self):
+        """Atom entries should use id, alternate link and updated date."""
+        entries = list(iter_entries(ATOM_BODY))
+        assert [e.id for e in entries] == ["urn:deal:2", "urn:deal:1"]
+        assert entries[0].link == "https://atom.example.com/2"
+        assert entries[0].summary == "Sony WH-1000XM5"
+        assert entries[0].published.year == 2026
+
+    def test_stops_at_high_water_mark(self):
+        """Only entries newer than the first already-seen id should be returned."""
+        mark = HighWaterMark(ids=["deal-95"])
+        entries = parse_new_entries(rss_document(100), mark)
+        assert [e.id for e in entries] == ["deal-100", "deal-99", "deal-98", "deal-97", "deal-96"]
+
+    def test_stops_on_seen_link(self):
+        """A stored link should also terminate the scan."""
+        entries = parse_new_entries(rss_document(5), {"https://deals.example.com/4"})
+        assert [e.id for e in entries] == ["deal-5"]
+
+    def test_does_not_parse_past_high_water_mark(self, monkeypatch):
+        """Malformed bytes after the seen entry should never be reached."""
+        monkeypatch.setattr(feedparser, "parse", pytest.fail)
+        content = rss_document(3).replace(b"</channel></rss>", b"<item><broken></channel>")
+        entries = parse_new_entries(content, {"deal-2"}, chunk_size=64)
+        assert [e.id for e in entries] == ["deal-3"]
+
+    def test_falls_back_to_feedparser_on_malformed_xml(self):
+        """HTML entities that strict XML rejects should still parse."""
+        content = rss_document(2).replace(b"Deal 2", b"Deal&nbsp;2")
+        entries = parse_new_entries(content, set())
+        assert [e.id for e in entries] == ["deal-2", "deal-1"]
+
+
+class TestHighWaterMark:
+    """Test per-feed high-water mark tracking."""
+
+    def test_advance_keeps_newest_ids_up_to_capacity(self):
+        """New ids should be prepended and the oldest dropped."""
+        mark = HighWaterMark(ids=["b", "a"], capacity=3)
+        mark.advance(["d", "c"])
+        assert mark.ids == ["d", "c", "b"]
+
+    def test_store_round_trip(self):
+        """Marks should persist through the agent-state store."""
+        store = HighWaterMarkStore(InMemoryStateStore())
+        marks = store.load(["https://a.example.com/rss", "https://b.example.com/rss"])
+        assert all(not mark.ids for mark in marks.values())
+        marks["https://a.example.com/rss"].advance(["deal-1"])
+        store.save(marks)
+        reloaded = store.load(["https://a.example.com/rss"])
+        assert "deal-1" in reloaded["https://a.example.com/rss"]
+
+
+def entries_at(*timestamps: float) -> list[FeedEntry]:
+    """Build entries published at the given epoch seconds, newest first."""
+    return [
+        FeedEntry(id=f"e{stamp}", title="deal", published=datetime.fromtimestamp(stamp, UTC))
+        for stamp in sorted(timestamps, reverse=True)
+    ]
+
+
+class TestPollScheduler:
+    """Test adaptive per-feed poll scheduling."""
+
+    def test_new_feeds_are_due_immediately(self):
+        """Freshly added feeds should be in the first due batch."""
+        scheduler = PollScheduler(clock=lambda: 1000.0)
+        scheduler.sync(["https://a.example.com/rss", "https://b.example.com/rss"])
+        assert sorted(scheduler.due()) == ["https://a.example.com/rss", "https://b.example.com/rss"]
+        assert scheduler.due() == []
+
+    def test_due_respects_limit_and_order(self):
+        """The most overdue feeds should be returned first."""
+        scheduler = PollScheduler()
+        scheduler.add_feed("late", due=10.0)
+        scheduler.add_feed("later", due=20.0)
+        scheduler.add_feed("future", due=500.0)
+        assert scheduler.due(limit=1, now=100.0) == ["late"]
+        assert scheduler.due(now=100.0) == ["later"]
+
+    def test_hot_feed_converges_to_min_interval(self):
+        """A feed publishing every 40 seconds should be polled every 30."""
+        scheduler = PollScheduler()
+        scheduler.add_feed("hot", due=0.0)
+        now = 0.0
+        for _ in range(5):
+            assert scheduler.due(now=now) == ["hot"]
+            interval = scheduler.record_poll("hot", entries_at(now - 40, now - 80), now=now)
+            now += interval
+        assert interval == scheduler.min_interval
+
+    def test_cadence_sets_interval(self):
+        """The interval should be half the learned publish gap."""
+        scheduler = PollScheduler()
+        scheduler.add_feed("feed", due=0.0)
+        scheduler.due(now=0.0)
+        interval = scheduler.record_poll("feed", entries_at(-1200, -600, 0), now=0.0)
+        assert interval == 300.0
+
+    def test_quiet_feed_backs_off_to_max_interval(self):
+        """A feed that never publishes should back off to the max interval."""
+        scheduler = PollScheduler()
+        scheduler.add_feed("dead", due=0.0)
+        now = 0.0
+        for _ in range(20):
+            scheduler.due(now=now)
+            interval = scheduler.record_poll("dead", [], now=now)
+            now += interval
+        assert interval == scheduler.max_interval
+
+    def test_in_flight_feed_is_not_returned_twice(self):
+        """A feed handed out should not be due again until recorded."""
+        scheduler = PollScheduler()
+        scheduler.add_feed("feed", due=0.0)
+        assert scheduler.due(now=0.0) == ["feed"]
+        assert scheduler.due(now=10_000.0) == []
+        scheduler.record_poll("feed", [], now=10_000.0)
+        assert scheduler.due(now=20_000.0) == ["feed"]
+
+    def test_failures_back_off_exponentially(self):
+        """Repeated failures should lengthen the retry delay."""
+        scheduler = PollScheduler(initial_interval=30.0)
+        scheduler.add_feed("flaky", due=0.0)
+        delays = []
+        for _ in range(3):
+            scheduler.due(now=1e9)
+            delays.append(scheduler.record_failure("flaky", now=0.0))
+        assert delays == [60.0, 120.0, 240.0]
+
+    def test_removed_feed_is_never_due(self):
+        """Removing a feed should drop it from future batches."""
+        scheduler = PollScheduler()
+        scheduler.add_feed("gone", due=0.0)
+        scheduler.remove_feed("gone")
+        assert scheduler.due(now=100.0) == []
+
+    def test_state_round_trip(self):
+        """The learned schedule should survive a save and load."""
+        store = InMemoryStateStore()
+        scheduler = PollScheduler()
+        scheduler.add_feed("feed", due=0.0)
+        scheduler.due(now=0.0)
+        scheduler.record_poll("feed", entries_at(-1200, -600, 0), now=0.0)
+        scheduler.save(store)
+
+        restored = PollScheduler()
+        restored.load(store)
+        assert restored.get("feed") == scheduler.get("feed")
+        assert restored.due(now=299.0) == []
+        assert restored.due(now=300.0) == ["feed"]
+
+    def test_rejects_inverted_bounds(self):
+        """Interval bounds must be ordered."""
+        with pytest.raises(ValueError):
+            PollScheduler(min_interval=600.0, max_interval=60.0)
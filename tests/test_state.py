@@ -0,0 +1,100 @@
+"""
+Unit tests for the agent state stores.
+"""
+
+import json
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from dealfinder.state import DynamoDBStateStore, InMemoryStateStore, table_name
+
+
+class TestTableName:
+    """Test Terraform table naming."""
+
+    def test_matches_terraform_pattern(self):
+        """Table names should follow project-environment-table."""
+        assert table_name("agent-state", "prod") == "dealfinder-prod-agent-state"
+
+
+class TestInMemoryStateStore:
+    """Test the in-memory state store."""
+
+    def test_put_and_get(self):
+        """Stored documents should be returned as copies."""
+        store = InMemoryStateStore()
+        store.put("feed#1", {"ids": ["a"]})
+        value = store.get("feed#1")
+        value["ids"].append("b")
+        assert store.get("feed#1") == {"ids": ["a"]}
+
+    def test_missing_key_returns_none(self):
+        """Unknown keys should return None."""
+        assert InMemoryStateStore().get("missing") is None
+
+    def test_get_many_skips_missing_keys(self):
+        """Batch reads should only include existing keys."""
+        store = InMemoryStateStore()
+        store.put_many({"a": {"n": 1}, "b": {"n": 2}})
+        assert store.get_many(["a", "c"]) == {"a": {"n": 1}}
+
+    def test_expired_items_are_hidden(self):
+        """Items past their TTL should no longer be returned."""
+        store = InMemoryStateStore()
+        store.put("a", {"n": 1}, ttl=-1)
+        assert store.get("a") is None
+
+
+class TestDynamoDBStateStore:
+    """Test the DynamoDB-backed state store against a stubbed client."""
+
+    @pytest.fixture
+    def resource(self):
+        """DynamoDB resource with a stubbed client."""
+        resource = boto3.resource(
+            "dynamodb",
+            region_name="us-east-1",
+            aws_access_key_id="test",
+            aws_secret_access_key="test",
+        )
+        with Stubber(resource.meta.client) as stubber:
+            resource.stubber = stubber
+            yield resource
+
+    def test_get_decodes_json_document(self, resource):
+        """Items should be decoded from the JSON data attribute."""
+        resource.stubber.add_response(
+            "get_item",
+            {"Item": {"pk": {"S": "feed#1"}, "data": {"S": json.dumps({"ids": ["a"]})}}},
+            {"TableName": "dealfinder-dev-agent-state", "Key": {"pk": "feed#1"}},
+        )
+        store = DynamoDBStateStore("dealfinder-dev-agent-state", resource=resource)
+        assert store.get("feed#1") == {"ids": ["a"]}
+
+    def test_get_many_follows_unprocessed_keys(self, resource):
+        """Unprocessed keys from BatchGetItem should be retried."""
+        name = "dealfinder-dev-agent-state"
+        resource.stubber.add_response(
+            "batch_get_item",
+            {
+                "Responses": {name: [{"pk": {"S": "a"}, "data": {"S": '{"n": 1}'}}]},
+                "UnprocessedKeys": {name: {"Keys": [{"pk": {"S": "b"}}]}},
+            },
+        )
+        resource.stubber.add_response(
+            "batch_get_item",
+            {"Responses": {name: [{"pk": {"S": "b"}, "data": {"S": '{"n": 2}'}}]}},
+        )
+        store = DynamoDBStateStore(name, resource=resource)
+        assert store.get_many(["a", "b"]) == {"a": {"n": 1}, "b": {"n": 2}}
+
+    def test_expired_item_is_ignored(self, resource):
+        """Items whose TTL has passed but are not yet deleted should be hidden."""
+        resource.stubber.add_response(
+            "get_item",
+            {"Item": {"pk": {"S": "a"}, "data": {"S": "{}"}, "expires_at": {"N": "1"}}},
+        )
+        store = DynamoDBStateStore("dealfinder-dev-agent-state", resource=resource)
+        assert store.get("a") is None
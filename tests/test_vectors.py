@@ -0,0 +1,266 @@
+"""
+Unit tests for in-process vector search.
+"""
+
+import numpy as np
+import pytest
+
+from dealfinder.vectors import HNSWIndex, MappedHNSW, PQStore, ProductQuantizer
+from dealfinder.vectors.snapshot import Snapshot, write_snapshot
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    """Clustered unit vectors with queries near existing points."""
+    rng = np.random.default_rng(42)
+    centers = rng.normal(size=(20, 16))
+    vectors = centers[rng.integers(0, 20, 600)] + 0.4 * rng.normal(size=(600, 16))
+    queries = vectors[:25] + 0.05 * rng.normal(size=(25, 16))
+    return [f"deal-{i}" for i in range(600)], vectors, queries
+
+
+@pytest.fixture(scope="module")
+def built(dataset):
+    """An HNSW index over the dataset."""
+    keys, vectors, _ = dataset
+    index = HNSWIndex(16, m=8, ef_construction=64, seed=3)
+    index.add_many(keys, vectors)
+    return index
+
+
+def brute_force(vectors, queries, k):
+    """Exact top-k cosine neighbours."""
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    q = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return [set(row) for row in np.argsort(-(q @ unit.T), axis=1)[:, :k]]
+
+
+def recall(results, truth):
+    """Mean fraction of true neighbours found."""
+    found = [{int(key.split("-")[1]) for key, _ in row} for row in results]
+    return np.mean([len(f & t) / len(t) for f, t in zip(found, truth)])
+
+
+class TestSnapshot:
+    """Test the shared snapshot file format."""
+
+    def test_sections_round_trip(self, tmp_path):
+        """Sections should come back as aligned read-only views."""
+        path = tmp_path / "snap.bin"
+        sections = {"a": np.arange(5, dtype=np.int64), "b": np.ones((3, 2), dtype=np.float16)}
+        write_snapshot(path, b"TEST", 1, {"n": 5}, sections)
+        snapshot = Snapshot(path, magic=b"TEST", version=1, kind="file")
+        assert snapshot.header["n"] == 5 and "b" in snapshot and "c" not in snapshot
+        np.testing.assert_array_equal(snapshot.section("a"), sections["a"])
+        assert snapshot.section("b").shape == (3, 2)
+        assert not snapshot.section("a").flags.writeable
+        assert [p.name for p in tmp_path.iterdir()] == ["snap.bin"]
+
+    def test_file_is_readable_by_other_workers(self, tmp_path):
+        """Snapshots should not keep the temporary file's private mode."""
+        path = tmp_path / "snap.bin"
+        write_snapshot(path, b"TEST", 1, {}, {"a": np.zeros(4)})
+        assert path.stat().st_mode & 0o777 == 0o644
+
+    def test_rejects_other_version(self, tmp_path):
+        """A different format version should not be mapped."""
+        path = tmp_path / "snap.bin"
+        write_snapshot(path, b"TEST", 2, {}, {})
+        with pytest.raises(ValueError, match="version 1 TEST file"):
+            Snapshot(path, magic=b"TEST", version=1, kind="file")
+
+
+class TestHNSWIndex:
+    """Test the mutable HNSW builder."""
+
+    def test_recall_against_brute_force(self, dataset, built):
+        """Approximate search should find nearly all exact neighbours."""
+        _, vectors, queries = dataset
+        results = built.search(queries, k=10, ef=64)
+        assert recall(results, brute_force(vectors, queries, 10)) >= 0.9
+
+    def test_scores_are_sorted_cosine_similarities(self, built, dataset):
+        """Results should be in descending similarity within [-1, 1]."""
+        _, _, queries = dataset
+        scores = [score for _, score in built.search(queries[:1], k=5)[0]]
+        assert scores == sorted(scores, reverse=True)
+        assert all(-1.0 <= s <= 1.0 + 1e-6 for s in scores)
+
+    def test_rejects_duplicate_and_misshaped_vectors(self):
+        """Keys are unique and dimensions must match."""
+        index = HNSWIndex(4)
+        index.add("a", [1, 0, 0, 0])
+        with pytest.raises(ValueError):
+            index.add("a", [0, 1, 0, 0])
+        with pytest.raises(ValueError):
+            index.add("b", [1, 0, 0])
+
+    def test_empty_index_returns_no_results(self):
+        """Searching an empty index should return empty lists."""
+        assert HNSWIndex(4).search(np.ones((2, 4))) == [[], []]
+
+
+class TestMappedHNSW:
+    """Test read-only memory-mapped snapshots."""
+
+    def test_snapshot_matches_builder(self, tmp_path, dataset, built):
+        """The mapped index should return the same neighbours as the builder."""
+        _, vectors, queries = dataset
+        path = tmp_path / "specialist.dfhn"
+        built.save(path)
+        mapped = MappedHNSW(path)
+        assert len(mapped) == len(built)
+        assert mapped.vectors.dtype == np.float16 and not mapped.vectors.flags.writeable
+        results = mapped.search(queries, k=10, ef=64)
+        assert recall(results, brute_force(vectors, queries, 10)) >= 0.9
+
+    def test_refresh_picks_up_swapped_snapshot(self, tmp_path):
+        """Readers should remap after an atomic snapshot swap."""
+        path = tmp_path / "specialist.dfhn"
+        index = HNSWIndex(4, seed=1)
+        index.add("a", [1, 0, 0, 0])
+        index.save(path)
+        reader = MappedHNSW(path)
+        assert not reader.refresh()
+
+        index.add("b", [0, 1, 0, 0])
+        index.save(path)
+        assert reader.refresh()
+        assert reader.search([[0, 1, 0, 0]], k=1)[0][0][0] == "b"
+        assert not list(tmp_path.glob(".specialist.dfhn.*"))
+
+    def test_load_and_continue_inserting(self, tmp_path, dataset):
+        """A snapshot should reload into a mutable index for incremental inserts."""
+        keys, vectors, queries = dataset
+        first = HNSWIndex(16, m=8, ef_construction=64, seed=3)
+        first.add_many(keys[:300], vectors[:300])
+        path = tmp_path / "specialist.dfhn"
+        first.save(path)
+
+        resumed = HNSWIndex.load(path, seed=4)
+        resumed.add_many(keys[300:], vectors[300:])
+        results = resumed.search(queries, k=10, ef=64)
+        assert len(resumed) == 600
+        assert recall(results, brute_force(vectors, queries, 10)) >= 0.85
+
+    def test_keys_are_memory_mapped(self, tmp_path):
+        """Keys should live in mapped sections, not the JSON header."""
+        keys = ["a", "", "déal-β", "a" * 300]
+        index = HNSWIndex(4, seed=1)
+        index.add_many(keys, np.eye(4))
+        path = tmp_path / "specialist.dfhn"
+        index.save(path)
+        assert b'"keys"' not in path.read_bytes()[:512]
+        mapped = MappedHNSW(path)
+        assert list(mapped.keys) == keys
+        assert [mapped.keys.position(key) for key in keys] == [0, 1, 2, 3]
+        assert mapped.keys.position("missing") is None and "déal-β" in mapped.keys
+        assert mapped.search([[0, 0, 1, 0]], k=1)[0][0][0] == "déal-β"
+
+    def test_rejects_foreign_file(self, tmp_path):
+        """Files without the DFHN preamble should be rejected."""
+        path = tmp_path / "index.bin"
+        path.write_bytes(b"\0" * 64)
+        with pytest.raises(ValueError):
+            MappedHNSW(path)
+
+
+@pytest.fixture(scope="module")
+def quantizer(dataset):
+    """A small quantizer trained on the dataset."""
+    _, vectors, _ = dataset
+    return ProductQuantizer(16, subspaces=8, bits=5).fit(vectors, seed=0)
+
+
+class TestProductQuantizer:
+    """Test the PQ codec."""
+
+    def test_encode_decode_approximates_vectors(self, dataset, quantizer):
+        """Decoded codes should be close to the unit-normalized originals."""
+        _, vectors, _ = dataset
+        codes = quantizer.encode(vectors)
+        assert codes.shape == (600, 8) and codes.dtype == np.uint8
+        unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        cosine = np.sum(quantizer.decode(codes) * unit, axis=1)
+        assert np.mean(cosine) > 0.9
+
+    def test_tables_reproduce_decoded_dot_products(self, dataset, quantizer):
+        """Summing table lookups equals the dot product with decoded vectors."""
+        _, vectors, queries = dataset
+        codes = quantizer.encode(vectors[:10])
+        tables = quantizer.tables(queries[:1])[0]
+        adc = tables[np.arange(8), codes].sum(axis=1)
+        q = queries[0] / np.linalg.norm(queries[0])
+        np.testing.assert_allclose(adc, quantizer.decode(codes) @ q, rtol=1e-5, atol=1e-6)
+
+    def test_validates_configuration(self):
+        """Dimensions must split evenly and training needs enough samples."""
+        with pytest.raises(ValueError):
+            ProductQuantizer(10, subspaces=4)
+        with pytest.raises(ValueError):
+            ProductQuantizer(8, subspaces=2).fit(np.ones((10, 8)))
+        with pytest.raises(RuntimeError):
+            ProductQuantizer(8, subspaces=2).encode(np.ones((1, 8)))
+
+
+class TestPQStore:
+    """Test approximate search over PQ codes."""
+
+    def test_search_with_exact_rerank(self, dataset, quantizer):
+        """Re-ranking a shortlist should recover the exact neighbours."""
+        keys, vectors, queries = dataset
+        store = PQStore(quantizer, keep_vectors=True)
+        store.add(keys, vectors)
+        approximate = store.search(queries, k=10)
+        exact = store.search(queries, k=10, rerank=100)
+        truth = brute_force(vectors, queries, 10)
+        assert recall(approximate, truth) >= 0.5
+        assert recall(exact, truth) >= 0.95
+        assert store.nbytes == 600 * (8 + 16 * 2)
+
+    def test_rerank_requires_vectors(self, dataset, quantizer):
+        """Codes-only stores cannot re-rank exactly."""
+        keys, vectors, queries = dataset
+        store = PQStore(quantizer)
+        store.add(keys[:50], vectors[:50])
+        assert store.nbytes == 50 * 8
+        with pytest.raises(ValueError):
+            store.search(queries, rerank=20)
+
+    def test_rejects_duplicate_keys(self, dataset, quantizer):
+        """Keys must be unique across and within batches."""
+        _, vectors, _ = dataset
+        store = PQStore(quantizer)
+        store.add(["a"], vectors[:1])
+        with pytest.raises(ValueError):
+            store.add(["a"], vectors[1:2])
+        with pytest.raises(ValueError):
+            store.add(["b", "b"], vectors[1:3])
+
+    def test_save_load_and_append(self, tmp_path, dataset, quantizer):
+        """A loaded store should be memory-mapped and still accept inserts."""
+        keys, vectors, queries = dataset
+        store = PQStore(quantizer, keep_vectors=True)
+        store.add(keys[:300], vectors[:300])
+        path = tmp_path / "catalog.dfpq"
+        store.save(path)
+
+        loaded = PQStore.load(path)
+        assert not loaded.codes.flags.writeable
+        assert b'"keys"' not in path.read_bytes()[:512]
+        assert "deal-299" in loaded and "deal-300" not in loaded
+        np.testing.assert_array_equal(loaded.codes, store.codes)
+        assert loaded.search(queries, k=5, rerank=50) == store.search(queries, k=5, rerank=50)
+
+        loaded.add(keys[300:], vectors[300:])
+        assert len(loaded) == 600 and "deal-599" in loaded
+        with pytest.raises(ValueError):
+            loaded.add(["deal-0"], vectors[:1])
+        assert (
+            recall(loaded.search(queries, k=10, rerank=100), brute_force(vectors, queries, 10))
+            >= 0.95
+        )
+
+    def test_empty_store_returns_no_results(self, quantizer):
+        """Searching an empty store should return empty lists."""
+        assert PQStore(quantizer).search(np.ones((2, 16))) == [[], []]